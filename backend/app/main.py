@@ -3,7 +3,15 @@ FastAPI main application entry point
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import divination, calendar
+from app.routers import divination, calendar, hexagrams, jobs
+from app.services.batch_service import shutdown_pool
+from app.services.interpretation_service import (
+    start_watcher, stop_watcher, precompute_interpretations, PRECOMPUTE_INTERPRETATIONS
+)
+from app.services.search_index import get_index
+from app.services.meihua_service import SHICHEN_CACHE
+from app.services import llm_client
+from app.services.job_queue import JOB_QUEUE
 
 app = FastAPI(
     title="周易卜卦系统 API",
@@ -23,6 +31,8 @@ app.add_middleware(
 # Include routers
 app.include_router(divination.router, prefix="/api/divination", tags=["Divination"])
 app.include_router(calendar.router, prefix="/api/calendar", tags=["Calendar"])
+app.include_router(hexagrams.router, prefix="/api/hexagrams", tags=["Hexagrams"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["Jobs"])
 
 
 @app.get("/")
@@ -32,12 +42,44 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "八字排盘": "/api/divination/bazi",
+            "批量排盘": "/api/divination/bazi/batch",
+            "四柱反查": "/api/divination/bazi/reverse",
+            "批量合婚": "/api/divination/bazi/compatibility",
+            "时辰卦": "/api/divination/meihua/hour",
+            "卦辞": "/api/hexagrams/{name}",
+            "卦辞检索": "/api/hexagrams/search",
+            "AI任务": "/api/jobs/{id}",
             "万年历": "/api/calendar/convert",
             "节气": "/api/calendar/jieqi"
         }
     }
 
 
+@app.on_event("startup")
+async def startup():
+    # 创建大模型客户端 (LLM_BACKEND)
+    llm_client.configure()
+    # AI 后台任务工作协程 (JOB_BACKEND=local 时)
+    JOB_QUEUE.start()
+    # 监视卦辞数据文件 (HEXAGRAM_WATCH_INTERVAL > 0 时)
+    start_watcher()
+    # 预建卦爻辞检索索引
+    get_index()
+    # 预先算好当前与下一时辰的时辰卦
+    SHICHEN_CACHE.get()
+    # 预先生成全部起卦解读片段 (INTERPRETATION_PRECOMPUTE=1 时)
+    if PRECOMPUTE_INTERPRETATIONS:
+        precompute_interpretations()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # 关闭批量排盘进程池
+    shutdown_pool()
+    stop_watcher()
+    await JOB_QUEUE.stop()
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -2,7 +2,7 @@
 Pydantic schemas for API request/response
 """
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 
 
 class BaziRequest(BaseModel):
@@ -16,6 +16,12 @@ class BaziRequest(BaseModel):
     latitude: float = Field(39.9, ge=-90, le=90, description="出生地纬度")
     gender: int = Field(1, ge=0, le=1, description="性别：1男 0女")
     use_true_solar_time: bool = Field(True, description="是否使用真太阳时")
+    sect: int = Field(1, ge=1, le=2, description="子时流派：1晚子时算明天 2晚子时算当天")
+    luck_cycles: Literal["summary", "current", "all"] = Field(
+        "all", description="大运展开：summary仅大运 current仅当前大运 all全部大运"
+    )
+    years_from: Optional[int] = Field(None, description="流年窗口起始年（含）")
+    years_to: Optional[int] = Field(None, description="流年窗口结束年（含）")
     
     class Config:
         json_schema_extra = {
@@ -32,6 +38,69 @@ class BaziRequest(BaseModel):
         }
 
 
+class BaziBatchRequest(BaseModel):
+    """批量八字排盘请求"""
+    items: List[Dict[str, Any]] = Field(
+        ...,
+        min_length=1,
+        description="BaziRequest 列表；每条单独校验，错误在结果流中逐条返回"
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [
+                    {"birth_year": 1995, "birth_month": 10, "birth_day": 27, "birth_hour": 10, "gender": 1},
+                    {"birth_year": 1990, "birth_month": 6, "birth_day": 1, "birth_hour": 12, "gender": 0}
+                ]
+            }
+        }
+
+
+class BaziReverseRequest(BaseModel):
+    """四柱反查请求"""
+    year_pillar: str = Field(..., min_length=2, max_length=2, description="年柱干支")
+    month_pillar: str = Field(..., min_length=2, max_length=2, description="月柱干支")
+    day_pillar: str = Field(..., min_length=2, max_length=2, description="日柱干支")
+    time_pillar: str = Field(..., min_length=2, max_length=2, description="时柱干支")
+    year_from: int = Field(1900, ge=1900, le=2100, description="起始年（公历，含）")
+    year_to: int = Field(2100, ge=1900, le=2100, description="结束年（公历，含）")
+    sect: int = Field(1, ge=1, le=2, description="子时流派：1晚子时算明天 2晚子时算当天")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "year_pillar": "乙亥",
+                "month_pillar": "丙戌",
+                "day_pillar": "丙寅",
+                "time_pillar": "癸巳",
+                "year_from": 1900,
+                "year_to": 2100
+            }
+        }
+
+
+class CompatibilityRequest(BaseModel):
+    """批量合婚配对请求"""
+    left: List[BaziRequest] = Field(..., min_length=1, description="待配对的出生信息列表")
+    right: Optional[List[BaziRequest]] = Field(
+        None, description="候选出生信息列表；为空时 left 内部两两配对（排除自身）"
+    )
+    top_k: int = Field(10, ge=1, le=100, description="每人返回的最佳配对数")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "left": [{"birth_year": 1995, "birth_month": 10, "birth_day": 27, "birth_hour": 10, "gender": 1}],
+                "right": [
+                    {"birth_year": 1996, "birth_month": 3, "birth_day": 8, "birth_hour": 6, "gender": 0},
+                    {"birth_year": 1994, "birth_month": 12, "birth_day": 1, "birth_hour": 20, "gender": 0}
+                ],
+                "top_k": 1
+            }
+        }
+
+
 class PillarInfo(BaseModel):
     """单柱信息"""
     position: str
@@ -1,13 +1,14 @@
 """
 Calendar API routes
 """
-from fastapi import APIRouter, HTTPException
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query
+from datetime import date, datetime
 from app.models.schemas import CalendarConvertRequest, TrueSolarTimeRequest
 from app.services.calendar_engine import (
     solar_to_lunar,
     lunar_to_solar,
     get_jie_qi_list,
+    get_calendar_range,
     get_today_info
 )
 from app.services.solar_time import get_true_solar_time
@@ -50,6 +51,24 @@ async def get_jieqi(year: int):
         raise HTTPException(status_code=500, detail=f"节气计算错误: {str(e)}")
 
 
+@router.get("/range", summary="日期区间日历")
+async def get_range(
+    start: date = Query(..., description="开始日期（含），如 2024-01-01"),
+    end: date = Query(..., description="结束日期（含），如 2024-12-31")
+):
+    """获取区间内每日的日柱干支、农历日期与节气，用于月历、年历网格"""
+    if start.year < 1900 or end.year > 2100:
+        raise HTTPException(status_code=400, detail="年份超出范围(1900-2100)")
+    
+    try:
+        days = get_calendar_range(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"日历计算错误: {str(e)}")
+    return {"start": start.isoformat(), "end": end.isoformat(), "days": days}
+
+
 @router.get("/today", summary="今日信息")
 async def today_info():
     """获取今日的农历、干支、宜忌等综合信息"""
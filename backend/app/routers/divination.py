@@ -1,12 +1,34 @@
 """
 Divination API routes
 """
-from fastapi import APIRouter, HTTPException
+import json
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from pydantic import BaseModel, Field
-from app.models.schemas import BaziRequest, BaziResponse
-from app.services.bazi_service import generate_bazi_chart
-from app.services.liuyao_service import generate_liuyao_chart, simulate_coin_toss
+from app.models.schemas import (
+    BaziRequest, BaziResponse, BaziBatchRequest, BaziReverseRequest, CompatibilityRequest
+)
+from app.services.bazi_service import (
+    generate_bazi_chart,
+    get_bazi_luck_cycles,
+    find_bazi_birth_times,
+    get_chart_cache_stats,
+    MAX_LUCK_CYCLES
+)
+from app.services.batch_service import stream_bazi_batch, BATCH_MAX_ITEMS
+from app.services.compatibility_service import match_charts, COMPAT_MAX_ITEMS
+from app.services.hexagram import Hexagram, moving_mask
+from app.services.meihua_service import SHICHEN_CACHE, cast_by_reported_numbers
+from app.services.sse import SSE_HEADERS, sse_text_stream
+from app.services.liuyao_service import (
+    generate_liuyao_chart,
+    simulate_coin_toss,
+    simulate_casts,
+    SIMULATE_MAX_CASTS
+)
 
 router = APIRouter()
 
@@ -15,6 +37,8 @@ class LiuyaoRequest(BaseModel):
     """六爻起卦请求"""
     question: str = Field("", description="所问之事")
     coin_results: Optional[List[int]] = Field(None, description="六次抛币结果(6-9),为空则自动模拟")
+    cast_time: Optional[datetime] = Field(None, description="起卦时间(定日干、安六兽),为空则取当前时间")
+    seed: Optional[int] = Field(None, ge=0, description="自动模拟时的随机种子,用于复现起卦")
     
     class Config:
         json_schema_extra = {
@@ -25,6 +49,29 @@ class LiuyaoRequest(BaseModel):
         }
 
 
+def _chart_from_request(request: BaziRequest, **overrides) -> dict:
+    """按请求排盘 (经由命盘缓存, /bazi、/bazi/ai、/bazi/analyze-year 共用)"""
+    options = {
+        "luck_cycles": request.luck_cycles,
+        "years_from": request.years_from,
+        "years_to": request.years_to,
+        **overrides
+    }
+    return generate_bazi_chart(
+        year=request.birth_year,
+        month=request.birth_month,
+        day=request.birth_day,
+        hour=request.birth_hour,
+        minute=request.birth_minute,
+        longitude=request.longitude,
+        latitude=request.latitude,
+        gender=request.gender,
+        use_true_solar_time=request.use_true_solar_time,
+        sect=request.sect,
+        **options
+    )
+
+
 @router.post("/bazi", summary="八字排盘", response_model=BaziResponse)
 async def get_bazi_chart(request: BaziRequest):
     """
@@ -39,22 +86,142 @@ async def get_bazi_chart(request: BaziRequest):
     - **latitude**: 出生地纬度
     - **gender**: 1男 0女（影响大运顺逆）
     - **use_true_solar_time**: 是否启用真太阳时校正
+    - **sect**: 子时流派
+    - **luck_cycles**: 大运展开方式（summary/current/all）
+    - **years_from/years_to**: 流年窗口，仅计算窗口内的流年
+    """
+    try:
+        result = _chart_from_request(request)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"排盘计算错误: {str(e)}")
+
+
+@router.post("/bazi/batch", summary="批量八字排盘")
+async def get_bazi_chart_batch(request: BaziBatchRequest):
+    """
+    批量生成八字命盘（进程池并行计算）
+
+    - **items**: BaziRequest 列表
+
+    以 NDJSON (application/x-ndjson) 流式返回，每完成一条输出一行：
+    `{"index": 序号, "success": true/false, "error": 错误信息, "data": 命盘}`
+    行的顺序为完成顺序，按 index 对应原始请求；单条出错不影响其余记录
+    """
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"单批最多{BATCH_MAX_ITEMS}条")
+
+    return StreamingResponse(
+        stream_bazi_batch(request.items),
+        media_type="application/x-ndjson"
+    )
+
+
+@router.post("/bazi/luck-cycles", summary="大运分页")
+async def get_bazi_luck_cycles_page(
+    request: BaziRequest,
+    offset: int = Query(0, ge=0, description="起始大运(从0起)"),
+    limit: int = Query(2, ge=1, le=MAX_LUCK_CYCLES, description="每页大运数")
+):
+    """
+    分页获取大运及其流年（命盘取自缓存）
+
+    流年窗口 years_from/years_to 同样生效
     """
     try:
-        result = generate_bazi_chart(
+        return get_bazi_luck_cycles(
             year=request.birth_year,
             month=request.birth_month,
             day=request.birth_day,
             hour=request.birth_hour,
             minute=request.birth_minute,
             longitude=request.longitude,
-            latitude=request.latitude,
             gender=request.gender,
-            use_true_solar_time=request.use_true_solar_time
+            use_true_solar_time=request.use_true_solar_time,
+            sect=request.sect,
+            offset=offset,
+            limit=limit,
+            years_from=request.years_from,
+            years_to=request.years_to
         )
-        return result
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"排盘计算错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"大运计算错误: {str(e)}")
+
+
+@router.post("/bazi/reverse", summary="四柱反查出生时间")
+async def reverse_bazi(request: BaziReverseRequest):
+    """
+    由年月日时四柱反查所有符合的出生时间窗口（北京时间）
+
+    - 窗口为左闭右开区间，精确到分钟
+    - 子时按 sect 流派区分早子、晚子
+    """
+    try:
+        return find_bazi_birth_times(
+            year_pillar=request.year_pillar,
+            month_pillar=request.month_pillar,
+            day_pillar=request.day_pillar,
+            time_pillar=request.time_pillar,
+            year_from=request.year_from,
+            year_to=request.year_to,
+            sect=request.sect
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"反查计算错误: {str(e)}")
+
+
+@router.post("/bazi/compatibility", summary="批量合婚配对")
+async def bazi_compatibility(request: CompatibilityRequest):
+    """
+    批量合婚：对 left × right 全部配对打分，返回每人得分最高的 top_k 个候选
+
+    - 日干五合/相冲，日支（夫妻宫）、年支（生肖）合冲刑害
+    - 四柱地支交叉关系
+    - 五行互补（喜用五行在对方命局中的多寡）
+    """
+    sizes = [len(request.left), len(request.right or [])]
+    if max(sizes) > COMPAT_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"单侧最多 {COMPAT_MAX_ITEMS} 条")
+
+    try:
+        return await run_in_threadpool(
+            match_charts,
+            [item.model_dump() for item in request.left],
+            [item.model_dump() for item in request.right] if request.right is not None else None,
+            request.top_k
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"合婚计算错误: {str(e)}")
+
+
+@router.get("/bazi/cache/stats", summary="命盘缓存统计")
+async def bazi_cache_stats():
+    """命盘缓存的容量、命中/未命中/淘汰次数"""
+    return get_chart_cache_stats()
+
+
+@router.get("/ai/cache/stats", summary="AI解读缓存统计")
+async def ai_cache_stats():
+    """AI解读两级缓存（内存、SQLite）的容量与命中率"""
+    from app.services.ai_cache import AI_CACHE
+    return await run_in_threadpool(AI_CACHE.stats)
+
+
+@router.get("/ai/client/stats", summary="AI调用统计")
+async def ai_client_stats():
+    """大模型客户端的并发、重试、超时与熔断状态，以及相同请求合并次数"""
+    from app.services.gemini_service import flight_stats
+    from app.services.llm_client import get_client
+    return {**get_client().stats(), "coalescing": flight_stats()}
+
+
+def _json_with_fragment(content: dict, key: str, fragment: bytes) -> Response:
+    """序列化 content 并在末尾拼入已序列化的 JSON 片段 (与 JSONResponse 编码一致)"""
+    body = json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    head = body[:-1] + (b"," if content else b"")
+    return Response(head + json.dumps(key).encode("utf-8") + b":" + fragment + b"}", media_type="application/json")
 
 
 @router.post("/liuyao", summary="六爻起卦")
@@ -64,30 +231,27 @@ async def get_liuyao_chart(request: LiuyaoRequest):
     
     - **question**: 所问之事
     - **coin_results**: 六次抛币结果(6=老阴,7=少阳,8=少阴,9=老阳)
+    - **cast_time**: 起卦时间，用于定日干、安六兽
+    - **seed**: 随机种子，自动模拟时使用，返回的 seed 可用于复现
     
     如果不传coin_results，系统会自动模拟抛币
     返回包含卦象和卦辞解读的完整数据
     """
-    from app.services.interpretation_service import generate_interpretation
+    from app.services.interpretation_service import interpretation_fragment
     
     try:
         result = generate_liuyao_chart(
             coin_results=request.coin_results,
-            question=request.question
-        )
-        
-        # 获取卦辞解读
-        interpretation = generate_interpretation(
-            hexagram_name=result.get("original_hexagram", {}).get("name", ""),
-            changed_hexagram_name=result.get("changed_hexagram", {}).get("name") if result.get("changed_hexagram") else None,
-            moving_positions=result.get("moving_positions", []),
-            question=request.question
+            question=request.question,
+            cast_time=request.cast_time,
+            seed=request.seed
         )
         
-        # 合并结果
-        result["interpretation"] = interpretation
+        # 卦辞解读为预先序列化的 JSON 片段, 直接拼入响应
+        hexagram = Hexagram.from_name(result["original_hexagram"]["name"])
+        fragment = interpretation_fragment(hexagram.bits, moving_mask(result["moving_positions"]))
         
-        return result
+        return _json_with_fragment(result, "interpretation", fragment)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"起卦计算错误: {str(e)}")
 
@@ -105,6 +269,92 @@ async def toss_coin():
     }
 
 
+class LiuyaoSimulateRequest(BaseModel):
+    """起卦模拟请求"""
+    casts: int = Field(1_000_000, ge=1, description="模拟起卦次数")
+    seed: Optional[int] = Field(None, ge=0, description="随机种子,为空则随机选取")
+
+
+@router.post("/liuyao/simulate", summary="起卦统计模拟")
+async def simulate_liuyao(request: LiuyaoSimulateRequest):
+    """
+    批量模拟金钱卦起卦，统计本卦分布、动爻数分布与本卦→变卦转移矩阵
+
+    用于检验起卦公平性；相同 seed 结果相同
+    """
+    if request.casts > SIMULATE_MAX_CASTS:
+        raise HTTPException(status_code=413, detail=f"单次最多模拟 {SIMULATE_MAX_CASTS} 次")
+
+    try:
+        return await run_in_threadpool(simulate_casts, request.casts, request.seed)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"模拟计算错误: {str(e)}")
+
+
+class MeihuaTimeRequest(BaseModel):
+    """梅花易数时间起卦请求"""
+    cast_time: Optional[datetime] = Field(None, description="起卦时间,为空则取当前时间")
+
+
+class MeihuaNumberRequest(BaseModel):
+    """梅花易数报数起卦请求"""
+    first: int = Field(..., ge=1, description="前数,取上卦")
+    second: int = Field(..., ge=1, description="后数,取下卦")
+    cast_time: Optional[datetime] = Field(None, description="起卦时间,给出时动爻加时辰数")
+
+
+def _meihua_response(result: dict) -> Response:
+    """梅花起卦结果拼入动爻解读片段"""
+    from app.services.interpretation_service import interpretation_fragment
+
+    hexagram = Hexagram.from_name(result["original_hexagram"]["name"])
+    fragment = interpretation_fragment(hexagram.bits, 1 << (result["moving_position"] - 1))
+    return _json_with_fragment(result, "interpretation", fragment)
+
+
+@router.post("/meihua/time", summary="梅花易数时间起卦")
+async def meihua_time(request: MeihuaTimeRequest):
+    """
+    以农历年支数、月数、日数、时辰数起卦
+
+    返回本卦、互卦、变卦、动爻、体用及卦辞解读
+    """
+    try:
+        if request.cast_time is None:
+            result, _ = SHICHEN_CACHE.get()
+        else:
+            result = SHICHEN_CACHE.lookup(request.cast_time)
+        return _meihua_response(result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"起卦计算错误: {str(e)}")
+
+
+@router.post("/meihua/number", summary="梅花易数报数起卦")
+async def meihua_number(request: MeihuaNumberRequest):
+    """前数取上卦，后数取下卦，两数之和（可加时辰数）取动爻"""
+    try:
+        return _meihua_response(cast_by_reported_numbers(request.first, request.second, request.cast_time))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"起卦计算错误: {str(e)}")
+
+
+@router.get("/meihua/hour", summary="时辰卦")
+async def meihua_hour():
+    """
+    当前时辰的时间起卦结果，同一时辰内对所有人相同
+
+    结果预先缓存，响应带 Cache-Control，有效期至时辰结束
+    """
+    try:
+        result, end = SHICHEN_CACHE.get()
+        response = _meihua_response(result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"起卦计算错误: {str(e)}")
+    max_age = max(0, int((end - datetime.now()).total_seconds()))
+    response.headers["Cache-Control"] = f"public, max-age={max_age}"
+    return response
+
+
 class AIInterpretRequest(BaseModel):
     """AI解卦请求"""
     question: str = Field("", description="所问之事")
@@ -145,6 +395,70 @@ async def ai_interpret(request: AIInterpretRequest):
         raise HTTPException(status_code=500, detail=f"AI解卦错误: {str(e)}")
 
 
+@router.post("/liuyao/ai-interpret/stream", summary="AI智能解卦（流式）")
+async def ai_interpret_stream(request: AIInterpretRequest):
+    """
+    AI 解卦，以 Server-Sent Events 逐段推送模型输出
+
+    事件：start、chunk {"text"}、done {"length"}、error {"error"}；客户端断开即取消上游调用
+    """
+    from app.services.gemini_service import ai_configured, build_interpretation_prompt, stream_completion
+    
+    if not ai_configured():
+        raise HTTPException(status_code=500, detail="Gemini API key not configured")
+    
+    prompt = build_interpretation_prompt(
+        question=request.question,
+        hexagram_name=request.hexagram_name,
+        changed_hexagram_name=request.changed_hexagram_name,
+        moving_positions=request.moving_positions or [],
+        interpretation_data=request.interpretation_data
+    )
+    return StreamingResponse(
+        sse_text_stream(stream_completion(prompt)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+async def _submit_job(kind: str, prompt: str, priority: int, meta: Optional[dict] = None) -> JSONResponse:
+    """提交 AI 后台任务, 立即返回任务号 (202)"""
+    from app.services.job_queue import JOB_QUEUE, QueueFull
+    
+    try:
+        job = await JOB_QUEUE.submit(kind, {"prompt": prompt, "meta": meta or {}}, priority)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    job["poll"] = f"/api/jobs/{job['id']}"
+    job["events"] = f"/api/jobs/{job['id']}/events"
+    return JSONResponse(job, status_code=202)
+
+
+@router.post("/liuyao/ai-interpret/jobs", summary="AI智能解卦（后台任务）", status_code=202)
+async def ai_interpret_job(
+    request: AIInterpretRequest,
+    priority: int = Query(5, ge=0, le=9, description="优先级，0 最高")
+):
+    """
+    提交 AI 解卦后台任务，立即返回任务号
+
+    结果经 GET /api/jobs/{id} 轮询，或由 GET /api/jobs/{id}/events 以 SSE 推送
+    """
+    from app.services.gemini_service import ai_configured, build_interpretation_prompt
+    
+    if not ai_configured():
+        raise HTTPException(status_code=500, detail="Gemini API key not configured")
+    
+    prompt = build_interpretation_prompt(
+        question=request.question,
+        hexagram_name=request.hexagram_name,
+        changed_hexagram_name=request.changed_hexagram_name,
+        moving_positions=request.moving_positions or [],
+        interpretation_data=request.interpretation_data
+    )
+    return await _submit_job("liuyao_interpret", prompt, priority)
+
+
 @router.get("/test", summary="测试接口")
 async def test_endpoint():
     """测试八字排盘接口"""
@@ -161,28 +475,48 @@ async def test_endpoint():
     return test_result
 
 
+def _reading_chart(request: BaziRequest) -> dict:
+    """八字解读用命盘: 流年只展开今年"""
+    this_year = datetime.now().year
+    return _chart_from_request(request, luck_cycles="all", years_from=this_year, years_to=this_year)
+
+
+@router.post("/bazi/ai/prompt", summary="八字AI提示词预览")
+async def preview_bazi_prompt(
+    request: BaziRequest,
+    year: Optional[int] = Query(None, description="流年分析的年份，为空则为八字解读"),
+    budget: Optional[int] = Query(None, ge=100, le=8000, description="token 预算，为空取 BAZI_PROMPT_TOKEN_BUDGET")
+):
+    """
+    返回 /bazi/ai（或带 year 时 /bazi/analyze-year）将发送的提示词
+
+    含预估 token 数及因预算删去的段落，不调用 AI
+    """
+    from app.services.bazi_prompt import bazi_reading_prompt, year_analysis_prompt
+    
+    try:
+        if year is None:
+            return bazi_reading_prompt(_reading_chart(request), budget=budget)
+        chart_data = _chart_from_request(request, luck_cycles="all", years_from=year, years_to=year)
+        return year_analysis_prompt(chart_data, year, budget=budget)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"提示词生成错误: {str(e)}")
+
+
 @router.post("/bazi/ai", summary="八字AI解读")
 async def get_bazi_ai_interpretation(request: BaziRequest):
     """
     八字AI深度解读
     
-    重新计算命盘并调用AI进行详细分析
+    命盘取自缓存（通常刚由 /bazi 算过），再调用AI进行详细分析
     """
     from app.services.gemini_service import generate_bazi_ai_interpretation
     
     try:
-        # 1. 重新生成排盘数据
-        chart_data = generate_bazi_chart(
-            year=request.birth_year,
-            month=request.birth_month,
-            day=request.birth_day,
-            hour=request.birth_hour,
-            minute=request.birth_minute,
-            longitude=request.longitude,
-            latitude=request.latitude,
-            gender=request.gender,
-            use_true_solar_time=request.use_true_solar_time
-        )
+        # 1. 排盘数据 (命中缓存时不重新计算), 提示词只用今年所在大运与流年
+        chart_data = _reading_chart(request)
         
         # 2. 调用AI服务
         result = await generate_bazi_ai_interpretation(chart_data)
@@ -192,7 +526,8 @@ async def get_bazi_ai_interpretation(request: BaziRequest):
             
         return {
             "success": True,
-            "content": result["content"]
+            "content": result["content"],
+            "prompt_tokens": result["prompt_tokens"]
         }
         
     except HTTPException:
@@ -200,6 +535,46 @@ async def get_bazi_ai_interpretation(request: BaziRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI解盘错误: {str(e)}")
 
+
+@router.post("/bazi/ai/stream", summary="八字AI解读（流式）")
+async def get_bazi_ai_interpretation_stream(request: BaziRequest):
+    """八字AI解读，以 Server-Sent Events 逐段推送（事件同 /liuyao/ai-interpret/stream）"""
+    from app.services.gemini_service import ai_configured, build_bazi_prompt, stream_completion
+    
+    if not ai_configured():
+        raise HTTPException(status_code=500, detail="Gemini API key not configured")
+    
+    try:
+        prompt = build_bazi_prompt(_reading_chart(request))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"AI解盘错误: {str(e)}")
+    return StreamingResponse(
+        sse_text_stream(stream_completion(prompt)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@router.post("/bazi/ai/jobs", summary="八字AI解读（后台任务）", status_code=202)
+async def bazi_ai_job(
+    request: BaziRequest,
+    priority: int = Query(5, ge=0, le=9, description="优先级，0 最高")
+):
+    """提交八字AI解读后台任务，立即返回任务号（取结果同 /liuyao/ai-interpret/jobs）"""
+    from app.services.bazi_prompt import bazi_reading_prompt
+    from app.services.gemini_service import ai_configured
+    
+    if not ai_configured():
+        raise HTTPException(status_code=500, detail="Gemini API key not configured")
+    
+    try:
+        prompt = bazi_reading_prompt(_reading_chart(request))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"AI解盘错误: {str(e)}")
+    return await _submit_job("bazi_reading", prompt["prompt"], priority,
+                             {"prompt_tokens": prompt["estimated_tokens"]})
+
+
 @router.post("/bazi/analyze-year", summary="流年运势分析")
 async def analyze_bazi_year(request: BaziRequest, year: int):
     """
@@ -208,18 +583,8 @@ async def analyze_bazi_year(request: BaziRequest, year: int):
     from app.services.gemini_service import generate_bazi_year_analysis
     
     try:
-        # 1. 生成排盘
-        chart_data = generate_bazi_chart(
-            year=request.birth_year,
-            month=request.birth_month,
-            day=request.birth_day,
-            hour=request.birth_hour,
-            minute=request.birth_minute,
-            longitude=request.longitude,
-            latitude=request.latitude,
-            gender=request.gender,
-            use_true_solar_time=request.use_true_solar_time
-        )
+        # 1. 排盘 (连续查看多个流年时命中缓存), 只展开目标流年
+        chart_data = _chart_from_request(request, luck_cycles="all", years_from=year, years_to=year)
         
         # 2. 调用AI
         result = await generate_bazi_year_analysis(chart_data, year)
@@ -229,10 +594,59 @@ async def analyze_bazi_year(request: BaziRequest, year: int):
             
         return {
             "success": True,
-            "content": result["content"]
+            "content": result["content"],
+            "prompt_tokens": result["prompt_tokens"]
         }
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"流年分析错误: {str(e)}")
+
+
+@router.post("/bazi/analyze-year/stream", summary="流年运势分析（流式）")
+async def analyze_bazi_year_stream(request: BaziRequest, year: int):
+    """流年运势分析，以 Server-Sent Events 逐段推送（事件同 /liuyao/ai-interpret/stream）"""
+    from app.services.gemini_service import ai_configured, build_year_analysis_prompt, stream_completion
+    
+    if not ai_configured():
+        raise HTTPException(status_code=500, detail="Gemini API key not configured")
+    
+    try:
+        chart_data = _chart_from_request(request, luck_cycles="all", years_from=year, years_to=year)
+        prompt = build_year_analysis_prompt(chart_data, year)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"流年分析错误: {str(e)}")
+    return StreamingResponse(
+        sse_text_stream(stream_completion(prompt)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@router.post("/bazi/analyze-year/jobs", summary="流年运势分析（后台任务）", status_code=202)
+async def analyze_bazi_year_job(
+    request: BaziRequest,
+    year: int,
+    priority: int = Query(5, ge=0, le=9, description="优先级，0 最高")
+):
+    """提交流年分析后台任务，立即返回任务号（取结果同 /liuyao/ai-interpret/jobs）"""
+    from app.services.bazi_prompt import year_analysis_prompt
+    from app.services.gemini_service import ai_configured
+    
+    if not ai_configured():
+        raise HTTPException(status_code=500, detail="Gemini API key not configured")
+    
+    try:
+        chart_data = _chart_from_request(request, luck_cycles="all", years_from=year, years_to=year)
+        prompt = year_analysis_prompt(chart_data, year)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"流年分析错误: {str(e)}")
+    return await _submit_job("bazi_year", prompt["prompt"], priority,
+                             {"prompt_tokens": prompt["estimated_tokens"]})
@@ -0,0 +1,122 @@
+"""
+Hexagram text API routes
+"""
+import hmac
+import os
+from typing import Any, Callable, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.services import interpretation_service
+from app.services.search_index import search_texts, MAX_QUERY_LENGTH
+from app.services.hexagram import Hexagram
+from app.services.text_store import NUMBER_TO_BITS
+
+router = APIRouter()
+
+# 热更新接口口令, 未配置时接口不启用
+ADMIN_TOKEN = os.getenv("HEXAGRAM_ADMIN_TOKEN", "")
+
+
+def _resolve(key: str) -> Hexagram:
+    """卦名 (全称、简称) 或文王卦序"""
+    hexagram = Hexagram.from_name(key)
+    if hexagram is None and key.isdigit() and 1 <= int(key) <= 64:
+        hexagram = Hexagram.of(NUMBER_TO_BITS[int(key)])
+    if hexagram is None:
+        raise HTTPException(status_code=404, detail=f"未知卦名: {key}")
+    return hexagram
+
+
+def _etag_response(request: Request, build: Callable[[Any], Any]) -> Response:
+    """
+    以数据版本为 ETag 返回 build(store) 的结果
+
+    If-None-Match 命中时返回 304, 不重新生成
+    """
+    store = interpretation_service.TEXT_STORE
+    etag = f'"{store.version}"'
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(","))):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(build(store), headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+@router.get("/version", summary="卦辞数据版本")
+async def get_version():
+    store = interpretation_service.TEXT_STORE
+    return {"version": store.version, "hexagrams": len(store)}
+
+
+@router.post("/reload", summary="热更新卦辞数据")
+async def reload_data(x_admin_token: Optional[str] = Header(None)):
+    """
+    重新编译并加载卦辞数据，无需重启服务
+
+    需在请求头 X-Admin-Token 中提供 HEXAGRAM_ADMIN_TOKEN；
+    数据校验失败时返回 422，现有数据不变
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="未配置 HEXAGRAM_ADMIN_TOKEN，热更新接口未启用")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="口令错误")
+
+    try:
+        return await run_in_threadpool(interpretation_service.reload_hexagram_data)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"卦辞数据校验失败: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"热更新失败: {str(e)}")
+
+
+@router.get("/search", summary="卦爻辞全文检索")
+async def search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=MAX_QUERY_LENGTH, description="查询词，空格分隔的多个词须同时命中"),
+    limit: int = Query(20, ge=1, le=100, description="返回条数")
+):
+    """
+    检索卦辞、彖辞、象辞与爻辞（含白话解释）
+
+    结果按相关度排序，highlight 中命中部分以 <em></em> 标出，带 ETag
+    """
+    return _etag_response(request, lambda store: search_texts(q, limit, store=store))
+
+
+@router.get("/{key}", summary="卦辞爻辞")
+async def get_hexagram(key: str, request: Request):
+    """按卦名（全称或简称）或卦序获取卦辞、彖辞、象辞与六爻爻辞，带 ETag"""
+    hexagram = _resolve(key)
+
+    def build(store):
+        text = store.get(hexagram.bits)
+        if text is None:
+            raise HTTPException(status_code=404, detail=f"暂无卦辞数据: {hexagram.name}")
+        return text
+
+    return _etag_response(request, build)
+
+
+@router.get("/{key}/interpretation", summary="卦象解读")
+async def get_interpretation(
+    key: str,
+    request: Request,
+    changed: Optional[str] = Query(None, description="变卦名称"),
+    moving: str = Query("", description="动爻位置，逗号分隔，如 1,3")
+):
+    """本卦、变卦、动爻组合的解读，带 ETag"""
+    hexagram = _resolve(key)
+    changed_name = _resolve(changed).name if changed is not None else None
+    try:
+        moving_positions = [int(p) for p in moving.split(",") if p.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"动爻位置有误: {moving}")
+    if any(not 1 <= p <= 6 for p in moving_positions):
+        raise HTTPException(status_code=400, detail=f"动爻位置有误: {moving}")
+
+    return _etag_response(request, lambda store: interpretation_service.generate_interpretation(
+        hexagram.name, changed_name, moving_positions, store=store
+    ))
@@ -0,0 +1,56 @@
+"""
+AI background job API routes
+"""
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.services.job_queue import JOB_QUEUE, FINISHED
+from app.services.sse import SSE_HEADERS, sse_event
+
+router = APIRouter()
+
+
+@router.get("/stats", summary="任务队列统计")
+async def job_stats():
+    """排队、执行中与已完成任务数"""
+    return await run_in_threadpool(JOB_QUEUE.stats)
+
+
+@router.get("/{job_id}", summary="查询任务")
+async def get_job(job_id: str):
+    """
+    任务状态与结果（轮询）
+
+    status: queued / running / done / failed / cancelled；done 时 result 为 {"content", ...}，failed 时见 error
+    """
+    job = await JOB_QUEUE.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在或已过期: {job_id}")
+    return job
+
+
+@router.get("/{job_id}/events", summary="任务状态推送")
+async def job_events(job_id: str):
+    """
+    以 Server-Sent Events 推送任务状态
+
+    事件：status（排队、执行中，连接后立即发送当前状态）、done（结束，含结果或错误）
+    """
+    if await JOB_QUEUE.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在或已过期: {job_id}")
+
+    async def events():
+        async for job in JOB_QUEUE.watch(job_id):
+            yield sse_event("done" if job["status"] in FINISHED else "status", job)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.delete("/{job_id}", summary="取消任务")
+async def cancel_job(job_id: str):
+    """取消排队中的任务；已开始或已结束的任务返回其当前状态"""
+    job = await JOB_QUEUE.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在或已过期: {job_id}")
+    return job
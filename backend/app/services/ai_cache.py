@@ -0,0 +1,212 @@
+"""
+AI 解读缓存
+Two-tier (in-process LRU + SQLite) cache of model responses keyed by prompt
+
+未填所问之事的起卦, 其提示词只由本卦、变卦与动爻决定, 大量重复;
+同一提示词的回复直接复用, 不再调用模型.
+
+- 键: sha256(模型名 + 规整后的提示词), 规整只去除各行首尾空白、合并行内连续空白、删去空行
+- 内存层: LRUTTLCache, 命中不访问磁盘
+- 磁盘层: SQLite (WAL), 重启后仍有效; 超过 max_entries 时淘汰最久未访问的条目
+- 两层共用写入时刻起算的 TTL, 磁盘命中后回填内存层 (剩余有效期不变)
+- 只缓存成功的完整回复
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .cache import LRUTTLCache
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+# 磁盘层路径, 置空则只用内存层
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", os.path.join(DATA_DIR, "ai_cache.sqlite3"))
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "512"))
+AI_CACHE_DB_MAX_ENTRIES = int(os.getenv("AI_CACHE_DB_MAX_ENTRIES", "20000"))
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", str(30 * 24 * 3600)))
+
+_WHITESPACE = re.compile(r"[ \t　]+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """去除各行首尾空白、合并行内连续空白、删去空行"""
+    lines = (_WHITESPACE.sub(" ", line).strip() for line in prompt.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def cache_key(prompt: str, model: str) -> str:
+    digest = hashlib.sha256(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_prompt(prompt).encode("utf-8"))
+    return digest.hexdigest()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ai_responses_accessed ON ai_responses (accessed);
+"""
+
+
+class AIResponseCache:
+    """
+    模型回复的两级缓存 (线程安全)
+
+    get/set 会访问磁盘, 异步代码中应先 get_memory, 未命中再放入线程池调用 get_disk
+    """
+
+    def __init__(self, path: Optional[str] = AI_CACHE_PATH, maxsize: int = AI_CACHE_SIZE,
+                 max_entries: int = AI_CACHE_DB_MAX_ENTRIES, ttl: float = AI_CACHE_TTL):
+        self.path = path or None
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # 内存层的值为 (过期时刻, 回复), 过期以磁盘层为准
+        self.memory = LRUTTLCache(maxsize=maxsize, ttl=ttl)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_evictions = 0
+        self.disk_expirations = 0
+        self.writes = 0
+        self.errors = 0
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """首次使用时打开数据库 (调用方持有锁); 打开失败则退化为只用内存层"""
+        if self._conn is None and self.path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(_SCHEMA)
+                # 启动时清除已过期的条目
+                conn.execute("DELETE FROM ai_responses WHERE created <= ?", (time.time() - self.ttl,))
+                self._conn = conn
+            except sqlite3.Error as e:
+                print(f"Error opening AI cache {self.path}: {e}")
+                self.errors += 1
+                self.path = None
+        return self._conn
+
+    def get_memory(self, key: str) -> Optional[str]:
+        """只查内存层"""
+        entry = self.memory.get(key)
+        if entry is None:
+            return None
+        expires_at, content = entry
+        return content if expires_at > time.time() else None
+
+    def get(self, key: str) -> Optional[str]:
+        """先查内存层, 再查磁盘层"""
+        content = self.get_memory(key)
+        return content if content is not None else self.get_disk(key)
+
+    def get_disk(self, key: str) -> Optional[str]:
+        """只查磁盘层, 命中时回填内存层"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            now = time.time()
+            try:
+                row = conn.execute(
+                    "SELECT content, created FROM ai_responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.disk_misses += 1
+                    return None
+                content, created = row
+                if created + self.ttl <= now:
+                    conn.execute("DELETE FROM ai_responses WHERE key = ?", (key,))
+                    self.disk_expirations += 1
+                    self.disk_misses += 1
+                    return None
+                conn.execute(
+                    "UPDATE ai_responses SET accessed = ?, hits = hits + 1 WHERE key = ?", (now, key)
+                )
+            except sqlite3.Error as e:
+                print(f"Error reading AI cache: {e}")
+                self.errors += 1
+                return None
+            self.disk_hits += 1
+        self.memory.set(key, (created + self.ttl, content))
+        return content
+
+    def set(self, key: str, model: str, content: str):
+        """写入两层, 磁盘层超出 max_entries 时淘汰最久未访问的条目"""
+        now = time.time()
+        self.memory.set(key, (now + self.ttl, content))
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute("BEGIN")
+                conn.execute(
+                    "INSERT OR REPLACE INTO ai_responses (key, model, content, created, accessed, hits) "
+                    "VALUES (?, ?, ?, ?, ?, 0)", (key, model, content, now, now)
+                )
+                evicted = conn.execute(
+                    "DELETE FROM ai_responses WHERE key IN ("
+                    "SELECT key FROM ai_responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                ).rowcount
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                print(f"Error writing AI cache: {e}")
+                self.errors += 1
+                return
+            self.writes += 1
+            self.disk_evictions += max(evicted, 0)
+
+    def clear(self):
+        self.memory.clear()
+        with self._lock:
+            conn = self._connect()
+            if conn is not None:
+                conn.execute("DELETE FROM ai_responses")
+
+    def stats(self) -> Dict[str, Any]:
+        """两级缓存统计, hit_rate 为任一层命中占全部查询的比例"""
+        memory = self.memory.stats()
+        with self._lock:
+            conn = self._connect()
+            size = conn.execute("SELECT COUNT(*) FROM ai_responses").fetchone()[0] if conn else 0
+            lookups = memory["hits"] + memory["misses"]
+            hits = memory["hits"] + self.disk_hits
+            return {
+                "memory": memory,
+                "disk": {
+                    "enabled": conn is not None,
+                    "path": self.path,
+                    "size": size,
+                    "max_entries": self.max_entries,
+                    "hits": self.disk_hits,
+                    "misses": self.disk_misses,
+                    "evictions": self.disk_evictions,
+                    "expirations": self.disk_expirations,
+                    "writes": self.writes,
+                    "errors": self.errors
+                },
+                "ttl": self.ttl,
+                "hits": hits,
+                "misses": lookups - hits,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+            }
+
+
+AI_CACHE = AIResponseCache()
@@ -0,0 +1,140 @@
+"""
+批量排盘服务
+Bulk BaZi charting on a process pool with NDJSON streaming
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, AsyncIterator, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.models.schemas import BaziRequest, BaziResponse
+from .bazi_service import generate_bazi_chart
+
+
+# 进程池大小 (默认CPU核数)
+BATCH_WORKERS = int(os.getenv("BAZI_BATCH_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# 同时在途的任务数上限, 避免数万条记录一次性压入进程池
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BAZI_BATCH_MAX_IN_FLIGHT", "0")) or BATCH_WORKERS * 4
+
+# 单批最大条数
+BATCH_MAX_ITEMS = int(os.getenv("BAZI_BATCH_MAX_ITEMS", "50000"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """获取(必要时创建)排盘进程池"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+    return _pool
+
+
+def shutdown_pool():
+    """关闭进程池（应用退出时调用）"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _reset_pool(broken: ProcessPoolExecutor):
+    """进程池损坏（子进程崩溃）后丢弃, 下次使用时重建"""
+    global _pool
+    if _pool is broken:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def chart_worker(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    子进程中执行的排盘任务
+
+    结果经 BaziResponse 校验后序列化, 与 /bazi 接口输出一致
+    """
+    chart = generate_bazi_chart(
+        year=params["birth_year"],
+        month=params["birth_month"],
+        day=params["birth_day"],
+        hour=params["birth_hour"],
+        minute=params["birth_minute"],
+        longitude=params["longitude"],
+        latitude=params["latitude"],
+        gender=params["gender"],
+        use_true_solar_time=params["use_true_solar_time"],
+        sect=params["sect"],
+        luck_cycles=params["luck_cycles"],
+        years_from=params["years_from"],
+        years_to=params["years_to"]
+    )
+    return BaziResponse.model_validate(chart).model_dump()
+
+
+def _ndjson(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _error_line(index: int, error: str) -> str:
+    return _ndjson({"index": index, "success": False, "error": error, "data": None})
+
+
+async def stream_bazi_batch(items: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    批量排盘, 按完成顺序逐条产出 NDJSON 行
+
+    每行格式: {"index": 原始序号, "success": bool, "error": str|None, "data": 命盘|None}
+    单条记录校验失败或计算出错只影响该行, 不中断整批
+    """
+    loop = asyncio.get_running_loop()
+    pending: Dict[asyncio.Future, Tuple[int, ProcessPoolExecutor]] = {}
+    queue = iter(enumerate(items))
+
+    def submit_next() -> Optional[str]:
+        """提交下一条记录; 校验失败时直接返回错误行"""
+        index, raw = next(queue)
+        try:
+            params = BaziRequest.model_validate(raw).model_dump()
+        except ValidationError as e:
+            errors = "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            )
+            return _error_line(index, f"参数错误: {errors}")
+        pool = get_pool()
+        future = loop.run_in_executor(pool, chart_worker, params)
+        pending[future] = (index, pool)
+        return None
+
+    try:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < BATCH_MAX_IN_FLIGHT:
+                try:
+                    line = submit_next()
+                except StopIteration:
+                    exhausted = True
+                    break
+                if line:
+                    yield line
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                index, pool = pending.pop(future)
+                try:
+                    line = _ndjson({"index": index, "success": True, "error": None, "data": future.result()})
+                except BrokenProcessPool:
+                    _reset_pool(pool)
+                    line = _error_line(index, "排盘进程异常退出")
+                except Exception as e:
+                    line = _error_line(index, f"排盘计算错误: {str(e)}")
+                yield line
+    finally:
+        # 客户端断开时取消尚未开始的任务
+        for future in pending:
+            future.cancel()
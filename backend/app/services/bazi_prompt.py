@@ -0,0 +1,193 @@
+"""
+八字 AI 提示词
+Compact, deterministic BaZi chart serialization for AI prompts with a token budget
+
+排盘结果 (generate_bazi_chart) 序列化为紧凑文本, 只取四柱、旺衰、格局、用神与相关大运:
+- 段落顺序与写法固定, 同一命盘、同一年份生成的提示词逐字相同 (便于 AI 解读缓存命中)
+- 大运只取参照年份所在一步及前后各一步, 流年只取参照年份
+- 超出 token 预算时按优先级从低到高删去可选段落 (其他格局、旺衰依据、纳音、藏干、五行计数、前后大运),
+  必需段落不删; 预估 token 数随结果返回
+token 按字估算: 汉字及全角字符每字计 1, 其余每 4 字符计 1.
+"""
+import math
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .bazi_service import DI_ZHI, ELEMENTS, WU_XING
+from .pillar_engine import SHENG_XIAO
+
+
+# 整个提示词 (含系统提示词与要求) 的 token 预算
+BAZI_PROMPT_TOKEN_BUDGET = int(os.getenv("BAZI_PROMPT_TOKEN_BUDGET", "600"))
+
+BAZI_SYSTEM_PROMPT = "你是一位精通子平八字的命理师，论命以日主旺衰、格局、用神为纲，语言平实、客观。"
+
+READING_INSTRUCTIONS = """请根据以上命盘，为命主详细解读，按以下格式回答：
+【命局】日主强弱与格局概要
+【性格】
+【事业财运】
+【感情婚姻】
+【健康】
+【建议】具体可行的建议"""
+
+YEAR_INSTRUCTIONS = """请分析【{year}年】流年运势，流年干支以【{gan_zhi}】为准，勿用其他干支：
+1. 吉凶：结合流年干支与命局、大运的关系，给出运势得分(0-100)
+2. 重点领域：事业、财运、感情、健康中哪方面最受影响
+3. 关键事件：据流年十神（{ten_god}）推断可能之事
+4. 趋吉避凶：具体行动建议"""
+
+POSITIONS = ("年", "月", "日", "时")
+
+# 可选段落的删减优先级, 数值小者先删
+OPTIONAL_PRIORITY = {
+    "patterns": 0,
+    "strength_details": 1,
+    "nayin": 2,
+    "hidden_stems": 3,
+    "elements": 4,
+    "luck_neighbors": 5,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """预估 token 数: 汉字及全角字符每字 1, 其余每 4 字符 1"""
+    wide = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+def _names(items: List[str]) -> str:
+    return "、".join(items) if items else "无"
+
+
+def _cycle_text(cycle: Dict[str, Any]) -> str:
+    return f"{cycle['gan_zhi']}({cycle['start_year']}-{cycle['end_year']},{cycle['start_age']}-{cycle['end_age']}岁)"
+
+
+def _current_cycle(cycles: List[Dict[str, Any]], year: int) -> int:
+    """year 所在大运的下标, 起运前取首步, 超出取末步"""
+    for i, cycle in enumerate(cycles):
+        if year <= cycle["end_year"]:
+            return i
+    return len(cycles) - 1
+
+
+def _find_year(cycles: List[Dict[str, Any]], year: int) -> Optional[Dict[str, Any]]:
+    for cycle in cycles:
+        if cycle["start_year"] <= year <= cycle["end_year"]:
+            for entry in cycle.get("years") or []:
+                if entry["year"] == year:
+                    return entry
+    return None
+
+
+def _liunian_text(entry: Dict[str, Any]) -> str:
+    zhi = entry["gan_zhi"][1]
+    events = "、".join(entry.get("events") or []) or "无冲合"
+    return (f"{entry['year']}年{entry['gan_zhi']}（{SHENG_XIAO[DI_ZHI.index(zhi)]}年，"
+            f"支{WU_XING[zhi]}），十神{entry['ten_god']}，{events}")
+
+
+def _sections(chart_data: Dict[str, Any], year: int, year_entry: Optional[Dict[str, Any]]) -> List[Tuple[Optional[str], str]]:
+    """(可选段落名或 None, 文本) 列表, 按输出顺序"""
+    chart = chart_data["chart"]
+    pillars = chart["pillars"]
+    day_master = chart["day_master"]
+    strength = chart_data["strength_analysis"]
+    gods = chart_data["useful_gods"]
+    patterns = chart_data["pattern_analysis"]
+    main = patterns["main_pattern"]
+    birth_year = int(chart_data["birth_info"]["solar_date"][:4])
+
+    sections: List[Tuple[Optional[str], str]] = [
+        (None, f"【命主】{chart_data['birth_info']['gender']}，{birth_year}年生"),
+        (None, "【四柱】" + " ".join(f"{pos}{p['gan_zhi']}" for pos, p in zip(POSITIONS, pillars))),
+        (None, "【十神】" + " ".join(
+            f"{pos}干{p['ten_god']}" for pos, p in zip(POSITIONS, pillars) if p["position"] != "day")),
+        ("hidden_stems", "【藏干】" + " ".join(
+            f"{p['zhi']}({''.join(p['hidden_stems'])})" for p in pillars)),
+        ("nayin", "【纳音】" + " ".join(p["nayin"] for p in pillars)),
+        (None, f"【日主】{day_master['gan']}{day_master['element']}，{strength['level']}（{strength['score']:g}）"),
+        ("strength_details", "【旺衰依据】" + "；".join(strength.get("details") or [])),
+        ("elements", "【五行】" + " ".join(f"{e}{chart['elements_count'].get(e, 0)}" for e in ELEMENTS)),
+        (None, f"【格局】{main['name']}（{main['type']}，{main['desc']}）"),
+    ]
+    others = [p["name"] + ("" if p.get("revealed") else "(未透)")
+              for p in patterns.get("all_patterns") or [] if p["name"] != main["name"]]
+    if others:
+        sections.append(("patterns", f"【兼格】{'、'.join(others)}"))
+
+    gods_text = (f"【用神】{gods['yong_shen']}；喜{_names(gods['xi_shen'])}；"
+                 f"忌{_names(gods['ji_shen'])}")
+    if gods.get("tiao_hou"):
+        gods_text += f"；调候{gods['tiao_hou']}"
+    if gods.get("tong_guan"):
+        gods_text += f"；通关{gods['tong_guan']}"
+    sections.append((None, gods_text))
+
+    cycles = chart_data.get("luck_cycles") or []
+    if cycles:
+        i = _current_cycle(cycles, year)
+        sections.append((None, f"【大运】{year}年行{_cycle_text(cycles[i])}"))
+        neighbors = [f"前{_cycle_text(cycles[i - 1])}"] if i > 0 else []
+        if i + 1 < len(cycles):
+            neighbors.append(f"后{_cycle_text(cycles[i + 1])}")
+        if neighbors:
+            sections.append(("luck_neighbors", "【前后大运】" + " ".join(neighbors)))
+    if year_entry is not None:
+        sections.append((None, "【流年】" + _liunian_text(year_entry)))
+    return sections
+
+
+def _assemble(head: str, sections: List[Tuple[Optional[str], str]], tail: str,
+              budget: int) -> Dict[str, Any]:
+    omitted: List[str] = []
+    optional = sorted((OPTIONAL_PRIORITY[name], name) for name, _ in sections if name)
+    while True:
+        body = "\n".join(text for name, text in sections if name not in omitted)
+        prompt = f"{head}\n\n{body}\n\n{tail}"
+        tokens = estimate_tokens(prompt)
+        if tokens <= budget or not optional:
+            break
+        omitted.append(optional.pop(0)[1])
+    return {
+        "prompt": prompt,
+        "estimated_tokens": tokens,
+        "budget": budget,
+        "omitted": omitted
+    }
+
+
+def bazi_reading_prompt(chart_data: Dict[str, Any], reference_year: Optional[int] = None,
+                        budget: Optional[int] = None) -> Dict[str, Any]:
+    """
+    八字解读提示词
+
+    Args:
+        chart_data: generate_bazi_chart 的结果 (流年只需参照年份, 可用 years_from/years_to 限定)
+        reference_year: 取其所在大运与流年, 默认今年
+        budget: token 预算, 默认 BAZI_PROMPT_TOKEN_BUDGET
+
+    Returns:
+        {"prompt", "estimated_tokens", "budget", "omitted": 因预算删去的段落}
+    """
+    year = reference_year or datetime.now().year
+    year_entry = _find_year(chart_data.get("luck_cycles") or [], year)
+    return _assemble(BAZI_SYSTEM_PROMPT, _sections(chart_data, year, year_entry), READING_INSTRUCTIONS,
+                     budget or BAZI_PROMPT_TOKEN_BUDGET)
+
+
+def year_analysis_prompt(chart_data: Dict[str, Any], target_year: int,
+                         budget: Optional[int] = None) -> Dict[str, Any]:
+    """
+    流年分析提示词, 返回值同 bazi_reading_prompt
+
+    Raises:
+        ValueError: 命盘中没有该流年
+    """
+    year_entry = _find_year(chart_data.get("luck_cycles") or [], target_year)
+    if year_entry is None:
+        raise ValueError(f"找不到{target_year}年的流年数据")
+    tail = YEAR_INSTRUCTIONS.format(year=target_year, gan_zhi=year_entry["gan_zhi"], ten_god=year_entry["ten_god"])
+    return _assemble(BAZI_SYSTEM_PROMPT, _sections(chart_data, target_year, year_entry), tail,
+                     budget or BAZI_PROMPT_TOKEN_BUDGET)
@@ -2,10 +2,13 @@
 八字排盘服务
 BaZi (Four Pillars of Destiny) Chart Generation Service
 """
+import os
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from lunar_python import Solar, Lunar
+from . import pillar_engine
 from .solar_time import get_true_solar_time
+from .cache import LRUTTLCache
 
 
 # 天干
@@ -115,32 +118,6 @@ TEN_GODS_RULES = {
     ("水", "水", "diff"): "劫财",
 }
 
-
-def get_ten_god(day_gan: str, other_gan: str) -> str:
-    """
-    计算十神
-    
-    Args:
-        day_gan: 日干（日主）
-        other_gan: 其他天干
-        
-    Returns:
-        十神名称
-    """
-    if day_gan == other_gan:
-        return "比肩"
-    
-    day_wuxing = WU_XING[day_gan]
-    other_wuxing = WU_XING[other_gan]
-    day_yinyang = GAN_YIN_YANG[day_gan]
-    other_yinyang = GAN_YIN_YANG[other_gan]
-    
-    yy_relation = "same" if day_yinyang == other_yinyang else "diff"
-    
-    key = (day_wuxing, other_wuxing, yy_relation)
-    return TEN_GODS_RULES.get(key, "")
-
-
 # ========== 身强身弱判断系统 ==========
 
 # 月令旺相休囚死 - 日干在各月支的状态
@@ -165,6 +142,114 @@ WU_XING_RELATIONS = {
     "水": {"生我": "金", "我生": "木", "克我": "土", "我克": "火", "同我": "水"}
 }
 
+# 地支六冲
+LIU_CHONG = {'子': '午', '丑': '未', '寅': '申', '卯': '酉', '辰': '戌', '巳': '亥',
+             '午': '子', '未': '丑', '申': '寅', '酉': '卯', '戌': '辰', '亥': '巳'}
+
+# 地支六合
+LIU_HE = {'子': '丑', '丑': '子', '寅': '亥', '亥': '寅', '卯': '戌', '戌': '卯',
+          '辰': '酉', '酉': '辰', '巳': '申', '申': '巳', '午': '未', '未': '午'}
+
+# 身强等级 (由强到弱) 及说明
+STRENGTH_LEVELS = [
+    ("极强", "日主极旺，多为专旺或从强"),
+    ("偏强", "日主偏旺，喜克泄耗"),
+    ("中和", "日主中和，五行流通"),
+    ("偏弱", "日主偏弱，喜生扶"),
+    ("极弱", "日主极弱，多为从弱或从势"),
+]
+
+
+# ========== 整数编码核心 ==========
+# 分析计算全部在整数编码上进行, 仅在输出时转换为汉字:
+#   天干 0-9 (甲..癸, 偶数为阳), 地支 0-11 (子..亥), 五行 0-4 (木火土金水)
+#   六十甲子 0-59, 干 = i % 10, 支 = i % 12
+
+ELEMENTS = ["木", "火", "土", "金", "水"]
+TEN_GOD_NAMES = ["比肩", "劫财", "食神", "伤官", "偏财", "正财", "七杀", "正官", "偏印", "正印"]
+JIA_ZI = [TIAN_GAN[i % 10] + DI_ZHI[i % 12] for i in range(60)]
+
+GAN_CODE = {g: i for i, g in enumerate(TIAN_GAN)}
+ZHI_CODE = {z: i for i, z in enumerate(DI_ZHI)}
+ELEMENT_CODE = {e: i for i, e in enumerate(ELEMENTS)}
+TEN_GOD_CODE = {name: i for i, name in enumerate(TEN_GOD_NAMES)}
+LEVEL_CODE = {level: i for i, (level, _) in enumerate(STRENGTH_LEVELS)}
+LEVEL_EXTREME_STRONG, LEVEL_STRONG, LEVEL_BALANCED, LEVEL_WEAK, LEVEL_EXTREME_WEAK = range(5)
+
+GAN_ELEMENT = tuple(ELEMENT_CODE[WU_XING[g]] for g in TIAN_GAN)
+ZHI_ELEMENT = tuple(ELEMENT_CODE[WU_XING[z]] for z in DI_ZHI)
+ZHI_HIDDEN = tuple(tuple(GAN_CODE[g] for g in ZHI_CANG_GAN[z]) for z in DI_ZHI)
+ZHI_CHONG = tuple(ZHI_CODE[LIU_CHONG[z]] for z in DI_ZHI)
+ZHI_HE = tuple(ZHI_CODE[LIU_HE[z]] for z in DI_ZHI)
+
+# 五行关系: ELEMENT_RELATIONS[e] = (生我, 我生, 克我, 我克, 同我)
+ELEMENT_RELATIONS = tuple(
+    tuple(ELEMENT_CODE[WU_XING_RELATIONS[e][k]] for k in ("生我", "我生", "克我", "我克", "同我"))
+    for e in ELEMENTS
+)
+
+# 十神表 10×10: TEN_GOD_TABLE[日干][他干] -> 十神编码
+TEN_GOD_TABLE = tuple(
+    tuple(
+        TEN_GOD_CODE[TEN_GODS_RULES[(
+            WU_XING[day],
+            WU_XING[other],
+            "same" if GAN_YIN_YANG[day] == GAN_YIN_YANG[other] else "diff"
+        )]]
+        for other in TIAN_GAN
+    )
+    for day in TIAN_GAN
+)
+
+# 月令表 5×12: MONTH_STRENGTH_TABLE[日干五行][月支] -> 得分
+MONTH_STRENGTH_TABLE = tuple(tuple(MONTH_STRENGTH[e][z] for z in DI_ZHI) for e in ELEMENTS)
+
+
+def _root_score(element: int, zhi: int) -> int:
+    """地支藏干中首个同我五行之根: 本气+15, 中气/余气+8, 无根0"""
+    hidden = ZHI_HIDDEN[zhi]
+    for i, stem in enumerate(hidden):
+        if GAN_ELEMENT[stem] == element:
+            return 15 if i == 0 else 8  # 中气/余气简化统一
+    return 0
+
+
+# 通根表 5×12: ROOT_TABLE[日干五行][地支] -> 根气得分
+ROOT_TABLE = tuple(tuple(_root_score(e, z) for z in range(12)) for e in range(5))
+
+FIRE, WATER = ELEMENT_CODE["火"], ELEMENT_CODE["水"]
+WINTER_ZHI = frozenset(ZHI_CODE[z] for z in ("亥", "子", "丑"))
+SUMMER_ZHI = frozenset(ZHI_CODE[z] for z in ("巳", "午", "未"))
+
+
+def gan_zhi_code(gan: int, zhi: int) -> int:
+    """干支编码 -> 六十甲子序号"""
+    return (6 * gan - 5 * zhi) % 60
+
+
+def get_ten_god(day_gan: str, other_gan: str) -> str:
+    """
+    计算十神
+    
+    Args:
+        day_gan: 日干（日主）
+        other_gan: 其他天干
+        
+    Returns:
+        十神名称
+    """
+    return TEN_GOD_NAMES[TEN_GOD_TABLE[GAN_CODE[day_gan]][GAN_CODE[other_gan]]]
+
+
+def _pillar_codes(pillars: List[Dict[str, Any]]) -> Tuple[List[int], List[int], List[int]]:
+    """四柱字典 -> (全部天干, 日主以外天干, 地支) 编码"""
+    stems = [GAN_CODE[p["gan"]] for p in pillars]
+    other_stems = [GAN_CODE[p["gan"]] for p in pillars if p["position"] != "day"]
+    branches = [ZHI_CODE[p["zhi"]] for p in pillars]
+    return stems, other_stems, branches
+
+
+# ========== 身强身弱判断系统 ==========
 
 def calculate_day_master_strength(
     day_gan: str,
@@ -191,78 +276,53 @@ def calculate_day_master_strength(
     -30 ~ -11: 偏弱
     <= -31: 极弱
     """
-    day_element = WU_XING[day_gan]
-    score = 0
+    _, other_stems, branches = _pillar_codes(pillars)
+    dg = GAN_CODE[day_gan]
+    score, level, details = _day_master_strength(dg, ZHI_CODE[month_zhi], other_stems, branches)
+    return _strength_result(dg, score, level, details)
+
+
+def _day_master_strength(
+    dg: int,
+    mz: int,
+    other_stems: List[int],
+    branches: List[int]
+) -> Tuple[int, int, List[str]]:
+    """身强弱评分 (编码版), 返回 (得分, 等级编码, 明细)"""
+    day_element = GAN_ELEMENT[dg]
     details = []
     
     # 1. 月令得分
-    month_score = MONTH_STRENGTH.get(day_element, {}).get(month_zhi, 0)
-    score += month_score
+    month_score = MONTH_STRENGTH_TABLE[day_element][mz]
+    score = month_score
     if month_score >= 20:
-        details.append(f"月令{month_zhi}，得令(+{month_score})")
+        details.append(f"月令{DI_ZHI[mz]}，得令(+{month_score})")
     elif month_score <= -10:
-        details.append(f"月令{month_zhi}，失令({month_score})")
+        details.append(f"月令{DI_ZHI[mz]}，失令({month_score})")
     else:
-        details.append(f"月令{month_zhi}，平常({month_score})")
+        details.append(f"月令{DI_ZHI[mz]}，平常({month_score})")
     
-    # 2. 通根分析 (更精细的根气计算)
-    # 简单查表法: 地支藏干
-    # 这里我们简化处理: 检查地支藏干中是否有同我五行
-    root_score = 0
+    # 2. 通根分析: 地支藏干中有同我五行
+    roots = ROOT_TABLE[day_element]
     roots_found = []
-    
-    for pillar in pillars:
-        zhi = pillar["zhi"]
-        hidden = ZHI_CANG_GAN.get(zhi, [])
-        
-        # 判断根的力度
-        # 简化逻辑: 如果藏干第一位(本气)是同我/生我 -> 强根
-        main_energy = hidden[0]
-        main_element = WU_XING[main_energy]
-        
-        current_root_score = 0
-        is_root = False
-        
-        # 遍历藏干寻找比劫(同我)
-        for stem in hidden:
-            if WU_XING[stem] == day_element:
-                is_root = True
-                # 本气 (通常在第一个)
-                if stem == hidden[0]:
-                    current_root_score = 15
-                else:
-                    # 中气/余气
-                    current_root_score = 8 # 简化统一
-                break
-        
-        if is_root:
-            root_score += current_root_score
-            roots_found.append(f"{zhi}(+{current_root_score})")
-    
-    score += root_score
+    for zhi in branches:
+        root = roots[zhi]
+        if root:
+            score += root
+            roots_found.append(f"{DI_ZHI[zhi]}(+{root})")
     if roots_found:
         details.append(f"通根: {', '.join(roots_found)}")
     
-    # 3. 天干生扶 (排除日主自己)
+    # 3. 天干生扶 (排除日主自己): 生我(印) 或 同我(比劫) = 帮扶, 其余耗泄
+    sheng_wo = ELEMENT_RELATIONS[day_element][0]
     help_count = 0
-    drain_count = 0
-    relations = WU_XING_RELATIONS[day_element]
-    
-    for pillar in pillars:
-        if pillar["position"] == "day":
-            continue # 跳过日主
-            
-        gan_element = pillar["gan_element"]
-        
-        # 生我(印) 或 同我(比劫) = 帮扶
-        if gan_element == relations["生我"] or gan_element == day_element:
+    for stem in other_stems:
+        element = GAN_ELEMENT[stem]
+        if element == sheng_wo or element == day_element:
             help_count += 1
-            score += 10
-        # 我生/克我/我克 = 耗泄
-        else:
-            drain_count += 1
-            score -= 10
-            
+    drain_count = len(other_stems) - help_count
+    score += (help_count - drain_count) * 10
+    
     if help_count > 0:
         details.append(f"天干帮扶{help_count}位(+{help_count * 10})")
     if drain_count > 0:
@@ -270,27 +330,27 @@ def calculate_day_master_strength(
     
     # 4. 确定强弱等级
     if score >= 50:
-        level = "极强"
-        level_desc = "日主极旺，多为专旺或从强"
+        level = LEVEL_EXTREME_STRONG
     elif score >= 20:
-        level = "偏强"
-        level_desc = "日主偏旺，喜克泄耗"
+        level = LEVEL_STRONG
     elif score >= -10:
-        level = "中和"
-        level_desc = "日主中和，五行流通"
+        level = LEVEL_BALANCED
     elif score >= -40:
-        level = "偏弱"
-        level_desc = "日主偏弱，喜生扶"
+        level = LEVEL_WEAK
     else:
-        level = "极弱"
-        level_desc = "日主极弱，多为从弱或从势"
+        level = LEVEL_EXTREME_WEAK
     
+    return score, level, details
+
+
+def _strength_result(dg: int, score: int, level: int, details: List[str]) -> Dict[str, Any]:
+    level_name, level_desc = STRENGTH_LEVELS[level]
     return {
         "score": float(score),
-        "level": level,
+        "level": level_name,
         "level_desc": level_desc,
         "details": details,
-        "day_element": day_element
+        "day_element": ELEMENTS[GAN_ELEMENT[dg]]
     }
 
 
@@ -310,87 +370,66 @@ def calculate_useful_gods(
     Returns:
         喜用忌神结果
     """
-    day_element = WU_XING[day_gan]
-    level = strength_result["level"]
-    relations = WU_XING_RELATIONS[day_element]
-    
-    xi_shen = []
-    yong_shen = None # 最主要用神
-    ji_shen = []
-    xian_shen = []
+    return _useful_gods(
+        GAN_ELEMENT[GAN_CODE[day_gan]],
+        LEVEL_CODE[strength_result["level"]],
+        ZHI_CODE[month_zhi]
+    )
+
+
+def _useful_gods(day_element: int, level: int, mz: int) -> Dict[str, Any]:
+    """喜用神 (编码版)"""
+    sheng_wo, wo_sheng, ke_wo, wo_ke, tong_wo = ELEMENT_RELATIONS[day_element]
     
     # === 1. 扶抑用神 (基础) ===
-    if level in ["极强", "偏强"]:
-        # 身强喜: 克(官杀), 泄(食伤), 耗(财)
-        # 优先取用原则: 
-        # 极强(专旺/从强) -> 顺势而为, 喜印比
-        if level == "极强": # 特殊处理: 假定为专旺
-             yong_shen = relations["同我"] # 用比劫
-             xi_shen = [relations["生我"], relations["同我"]]
-             ji_shen = [relations["克我"], relations["我克"]] # 忌财官
-        else:
-             # 偏强 -> 抑之
-             # 官杀首选 (克), 食伤次之 (泄), 财星 (耗)
-             yong_shen = relations["克我"] 
-             xi_shen = [relations["克我"], relations["我生"], relations["我克"]]
-             ji_shen = [relations["生我"], relations["同我"]] # 忌印比
-
-    elif level in ["极弱", "偏弱"]:
-        if level == "极弱": # 特殊处理: 假定为从格(从弱/从杀/从财)
-             # 顺势而为 -> 喜克泄耗, 忌印比
-             yong_shen = relations["克我"] # 假定从杀/从势
-             xi_shen = [relations["克我"], relations["我生"], relations["我克"]]
-             ji_shen = [relations["生我"], relations["同我"]]
-        else:
-             # 偏弱 -> 扶之
-             yong_shen = relations["生我"] # 此时印星最有力
-             xi_shen = [relations["生我"], relations["同我"]]
-             ji_shen = [relations["克我"], relations["我生"], relations["我克"]] # 忌官杀食伤财
-             
-    else: # 中和
-        # 通关为主, 追求平衡
-        yong_shen = relations["我生"] # 食伤流通
-        xi_shen = [relations["我生"], relations["我克"]]
+    if level == LEVEL_EXTREME_STRONG:
+        # 特殊处理: 假定为专旺 -> 顺势而为, 喜印比, 忌财官
+        yong_shen = tong_wo
+        xi_shen = [sheng_wo, tong_wo]
+        ji_shen = [ke_wo, wo_ke]
+    elif level == LEVEL_STRONG or level == LEVEL_EXTREME_WEAK:
+        # 偏强 -> 抑之: 官杀首选 (克), 食伤次之 (泄), 财星 (耗)
+        # 极弱 -> 假定为从格(从弱/从杀/从财), 顺势喜克泄耗
+        yong_shen = ke_wo
+        xi_shen = [ke_wo, wo_sheng, wo_ke]
+        ji_shen = [sheng_wo, tong_wo]
+    elif level == LEVEL_WEAK:
+        # 偏弱 -> 扶之, 此时印星最有力
+        yong_shen = sheng_wo
+        xi_shen = [sheng_wo, tong_wo]
+        ji_shen = [ke_wo, wo_sheng, wo_ke]
+    else:
+        # 中和: 通关为主, 追求平衡, 食伤流通
+        yong_shen = wo_sheng
+        xi_shen = [wo_sheng, wo_ke]
         ji_shen = []
     
     # === 2. 调候用神 (气候调整) ===
     # 冬月 (亥子丑) -> 寒冷 -> 喜火暖局
     # 夏月 (巳午未) -> 炎热 -> 喜水润局
     tiao_hou = None
-    
-    if month_zhi in ["亥", "子", "丑"]:
-        # 冬生人, 无论身强弱, 局中要有火
-        if "火" not in xi_shen:
-            xi_shen.append("火")
-            # 如果用神不是火, 则火为重要辅助
-            if yong_shen != "火":
+    if mz in WINTER_ZHI:
+        if FIRE not in xi_shen:
+            xi_shen.append(FIRE)
+            if yong_shen != FIRE:
                 tiao_hou = "火 (调候)"
-                
-    elif month_zhi in ["巳", "午", "未"]:
-        # 夏生人, 局中要有水
-         if "水" not in xi_shen:
-            xi_shen.append("水")
-            if yong_shen != "水":
+    elif mz in SUMMER_ZHI:
+        if WATER not in xi_shen:
+            xi_shen.append(WATER)
+            if yong_shen != WATER:
                 tiao_hou = "水 (调候)"
-                
-    # === 3. 通关用神 (简单逻辑) ===
-    # 比如: 金木交战 (金克木), 用水通关 (金生水, 水生木)
-    tong_guan = None
-    # 暂略复杂判定, 仅作为概念预留
     
-    # 去重
-    xi_shen = list(set(xi_shen))
-    ji_shen = list(set(ji_shen))
+    # === 3. 通关用神 (暂略复杂判定, 仅作为概念预留) ===
+    tong_guan = None
     
     # 确保忌神里没有喜神 (调候优先)
     ji_shen = [e for e in ji_shen if e not in xi_shen]
     
-    # 构造返回
     return {
-        "yong_shen": yong_shen,
-        "xi_shen": xi_shen,
-        "ji_shen": ji_shen,
-        "xian_shen": xian_shen,
+        "yong_shen": ELEMENTS[yong_shen],
+        "xi_shen": [ELEMENTS[e] for e in xi_shen],
+        "ji_shen": [ELEMENTS[e] for e in ji_shen],
+        "xian_shen": [],
         "tiao_hou": tiao_hou,
         "tong_guan": tong_guan
     }
@@ -414,159 +453,159 @@ def determine_pattern(
     Returns:
         格局判断结果
     """
-    score = strength_result["score"]
-    level = strength_result["level"]
-    day_element = WU_XING[day_gan]
-    
+    stems, _, branches = _pillar_codes(pillars)
+    return _pattern(
+        GAN_CODE[day_gan],
+        ZHI_CODE[month_zhi],
+        stems,
+        branches,
+        strength_result["score"],
+        LEVEL_CODE[strength_result["level"]]
+    )
+
+
+def _pattern(
+    dg: int,
+    mz: int,
+    stems: List[int],
+    branches: List[int],
+    score: float,
+    level: int
+) -> Dict[str, Any]:
+    """格局判断 (编码版)"""
+    day_element = GAN_ELEMENT[dg]
+    ten_gods = TEN_GOD_TABLE[dg]
     patterns = []
-    main_pattern = None
     
     # === 1. 特殊格局判断 (优先) ===
     # 1.1 专旺格 (身极强)
-    if level == "极强" and score >= 60: # 提高门槛
-        # 检查是否五行单一
+    if level == LEVEL_EXTREME_STRONG and score >= 60:
+        element_name = ELEMENTS[day_element]
         patterns.append({
-            "name": f"{day_element}专旺格",
+            "name": f"{element_name}专旺格",
             "type": "外格",
             "revealed": True,
-            "desc": f"日主极旺，气势专一于{day_element}，顺势而为"
+            "desc": f"日主极旺，气势专一于{element_name}，顺势而为"
         })
-        
-    # 1.2 从格 (身极弱)
-    elif level == "极弱" and score <= -40:
-        # 判断从什么
-        # 统计最强势力
-        elements_count = {"木": 0, "火": 0, "土": 0, "金": 0, "水": 0}
-        for p in pillars:
-            elements_count[p["gan_element"]] += 1
-            elements_count[p["zhi_element"]] += 1
-            
-        # 排除日干自己
+    
+    # 1.2 从格 (身极弱): 统计最强势力 (排除日干自己)
+    elif level == LEVEL_EXTREME_WEAK and score <= -40:
+        elements_count = [0] * 5
+        for stem in stems:
+            elements_count[GAN_ELEMENT[stem]] += 1
+        for zhi in branches:
+            elements_count[ZHI_ELEMENT[zhi]] += 1
         elements_count[day_element] -= 1
+        dominant = elements_count.index(max(elements_count))
         
-        dominant_element = max(elements_count, key=elements_count.get)
-        dominant_ten_god = get_ten_god(day_gan, dominant_element) # 这里需要一个简化的十神查找
-        
-        # 简单的十神反查
-        relations = WU_XING_RELATIONS[day_element]
+        _, wo_sheng, ke_wo, wo_ke, _ = ELEMENT_RELATIONS[day_element]
         pattern_name = "从弱格"
-        if dominant_element == relations["克我"]:
+        if dominant == ke_wo:
             pattern_name = "从杀格"
-        elif dominant_element == relations["我克"]:
+        elif dominant == wo_ke:
             pattern_name = "从财格"
-        elif dominant_element == relations["我生"]:
+        elif dominant == wo_sheng:
             pattern_name = "从儿格"
-            
+        
         patterns.append({
             "name": pattern_name,
             "type": "外格",
             "revealed": True,
-            "desc": f"日主极弱，势从{dominant_element}，为{pattern_name}"
+            "desc": f"日主极弱，势从{ELEMENTS[dominant]}，为{pattern_name}"
         })
-
-    # === 2. 正格判断 (月令藏干) ===
-    # 月支藏干取格
-    month_hidden = ZHI_CANG_GAN.get(month_zhi, [])
     
-    # 建禄格/羊刃格 (月令为比劫)
+    # === 2. 正格判断 (月令藏干) ===
+    month_hidden = ZHI_HIDDEN[mz]
     month_initial = month_hidden[0]
-    initial_element = WU_XING[month_initial]
     
-    if initial_element == day_element:
-        # 比肩=建禄, 劫财=羊刃
-        ten_god = get_ten_god(day_gan, month_initial)
-        name = "建禄格" if ten_god == "比肩" else "羊刃格"
+    if GAN_ELEMENT[month_initial] == day_element:
+        # 建禄格/羊刃格 (月令为比劫): 比肩=建禄, 劫财=羊刃
+        ten_god = ten_gods[month_initial]
         patterns.append({
-            "name": name,
+            "name": "建禄格" if ten_god == 0 else "羊刃格",
             "type": "正格",
             "revealed": True,
-            "desc": f"月令{month_zhi}为日主之{ten_god}"
+            "desc": f"月令{DI_ZHI[mz]}为日主之{TEN_GOD_NAMES[ten_god]}"
         })
     else:
-        # 正常取格 (看透干)
-        found_zheng_ge = False
+        # 正常取格 (看透干), 比劫不取正格
         for stem in month_hidden:
-            ten_god = get_ten_god(day_gan, stem)
-            if ten_god in ["比肩", "劫财"]: continue # 比劫不取正格
-            
-            # 检查透干
-            is_revealed = any(p["gan"] == stem for p in pillars)
-            pattern_name = f"{ten_god}格"
-            
+            ten_god = ten_gods[stem]
+            if ten_god < 2:
+                continue
+            is_revealed = stem in stems
+            ten_god_name = TEN_GOD_NAMES[ten_god]
             p_data = {
-                "name": pattern_name,
+                "name": f"{ten_god_name}格",
                 "type": "正格",
                 "revealed": is_revealed,
-                "desc": f"月支藏{stem}({ten_god}){'透干' if is_revealed else '未透'}"
+                "desc": f"月支藏{TIAN_GAN[stem]}({ten_god_name}){'透干' if is_revealed else '未透'}"
             }
-            
             if is_revealed:
-                patterns.insert(0, p_data) # 透干优先
-                found_zheng_ge = True
+                patterns.insert(0, p_data)  # 透干优先
             else:
                 patterns.append(p_data)
     
-    # 取最显著的格局
-    if patterns:
-        main_pattern = patterns[0]
-    
     return {
-        "main_pattern": main_pattern,
+        "main_pattern": patterns[0] if patterns else None,
         "all_patterns": patterns,
-        "strength_level": strength_result["level"]
+        "strength_level": STRENGTH_LEVELS[level][0]
     }
 
 
 def calculate_liunian_events(ln_gan_zhi: str, pillars: List[Dict]) -> List[str]:
     """计算流年与四柱的刑冲合害关系"""
-    events = []
     if not pillars:
-        return events
-        
-    ln_gan = ln_gan_zhi[0]
-    ln_zhi = ln_gan_zhi[1]
+        return []
     
-    # 简单的地支关系映射
-    # 六冲
-    LIU_CHONG = {'子': '午', '丑': '未', '寅': '申', '卯': '酉', '辰': '戌', '巳': '亥',
-                 '午': '子', '未': '丑', '申': '寅', '酉': '卯', '戌': '辰', '亥': '巳'}
-    # 六合
-    LIU_HE = {'子': '丑', '丑': '子', '寅': '亥', '亥': '寅', '卯': '戌', '戌': '卯', 
-              '辰': '酉', '酉': '辰', '巳': '申', '申': '巳', '午': '未', '未': '午'}
+    day_pillar = next((p for p in pillars if p['position'] == 'day'), None)
+    year_pillar = next((p for p in pillars if p['position'] == 'year'), None)
+    
+    def code(pillar: Optional[Dict]) -> Optional[int]:
+        return gan_zhi_code(GAN_CODE[pillar['gan']], ZHI_CODE[pillar['zhi']]) if pillar else None
+    
+    ln = gan_zhi_code(GAN_CODE[ln_gan_zhi[0]], ZHI_CODE[ln_gan_zhi[1]])
+    return _liunian_events(ln, code(day_pillar), code(year_pillar))
+
+
+def _liunian_events(ln: int, day_gz: Optional[int], year_gz: Optional[int]) -> List[str]:
+    """流年事件 (编码版): ln/day_gz/year_gz 均为六十甲子序号"""
+    events = []
+    ln_zhi = ln % 12
     
     # 检查与日柱的关系 (最重要)
-    day_pillar = next((p for p in pillars if p['position'] == 'day'), None)
-    if day_pillar:
-        day_zhi = day_pillar['zhi']
-        day_gan = day_pillar['gan']
-        
+    if day_gz is not None:
+        day_zhi = day_gz % 12
         # 伏吟 (天地同)
-        if ln_gan_zhi == day_pillar['gan_zhi']:
+        if ln == day_gz:
             events.append("日柱伏吟")
         # 反吟 (天克地冲 - 简易版仅看地支冲)
-        elif LIU_CHONG.get(ln_zhi) == day_zhi:
+        elif ZHI_CHONG[ln_zhi] == day_zhi:
             events.append("日支相冲")
-        elif LIU_HE.get(ln_zhi) == day_zhi:
+        elif ZHI_HE[ln_zhi] == day_zhi:
             events.append("日支相合")
-            
+    
     # 检查与年柱 (太岁)
-    year_pillar = next((p for p in pillars if p['position'] == 'year'), None)
-    if year_pillar:
-        year_zhi = year_pillar['zhi']
-        if ln_gan_zhi == year_pillar['gan_zhi']:
+    if year_gz is not None:
+        year_zhi = year_gz % 12
+        if ln == year_gz:
             events.append("本命年")
-        elif LIU_CHONG.get(ln_zhi) == year_zhi:
+        elif ZHI_CHONG[ln_zhi] == year_zhi:
             events.append("冲太岁")
-        elif LIU_HE.get(ln_zhi) == year_zhi:
+        elif ZHI_HE[ln_zhi] == year_zhi:
             events.append("合太岁")
-
+    
     return events
 
+
 def get_da_yun(
     solar: Solar,
     gender: int,
     day_gan: str,
-    pillars: List[Dict] = None
+    pillars: List[Dict] = None,
+    mode: str = "all",
+    years_from: Optional[int] = None,
+    years_to: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """
     计算大运及流年
@@ -576,70 +615,289 @@ def get_da_yun(
         gender: 1男 0女
         day_gan: 日干 (用于推算流年十神)
         pillars: 四柱数据 (用于计算流年事件)
+        mode: 展开方式, 见 expand_luck_cycles
+        years_from, years_to: 流年窗口 (含两端)
         
     Returns:
         大运列表
     """
+    day_gz = year_gz = None
+    if pillars:
+        codes = {
+            p['position']: gan_zhi_code(GAN_CODE[p['gan']], ZHI_CODE[p['zhi']])
+            for p in pillars
+        }
+        day_gz, year_gz = codes.get('day'), codes.get('year')
+    
+    pillar_data = lunar_pillars(
+        solar.getYear(), solar.getMonth(), solar.getDay(), solar.getHour(), solar.getMinute(), gender
+    )
+    luck = _luck_context(pillar_data, GAN_CODE[day_gan], day_gz, year_gz)
+    return expand_luck_cycles(luck, mode, years_from, years_to)
+
+
+# 命盘展示的大运步数
+MAX_LUCK_CYCLES = 8
+
+# 大运展开方式: summary 仅大运不含流年, current 仅当前大运, all 全部大运
+LUCK_CYCLE_MODES = ("summary", "current", "all")
+
+
+def _luck_context(
+    pillar_data: Dict[str, Any],
+    dg: int,
+    day_gz: Optional[int],
+    year_gz: Optional[int]
+) -> Tuple:
+    """
+    大运推算所需的全部参数 (可缓存, 大运/流年据此按需展开)
+    
+    Returns:
+        (起运年份, 出生年份, 月柱序号, 是否顺排, 日干, 日柱序号, 年柱序号)
+    """
+    return (
+        pillar_data["luck_start_year"],
+        pillar_data["birth_year"],
+        gan_zhi_code(pillar_data["stems"][1], pillar_data["branches"][1]),
+        pillar_data["forward"],
+        dg,
+        day_gz,
+        year_gz
+    )
+
+
+def _luck_cycle(luck: Tuple, index: int) -> Dict[str, Any]:
+    """第 index 步大运 (从1起, 不含流年): 每步十年, 干支由月柱顺逆推"""
+    first_year, birth_year, month_gz, forward = luck[:4]
+    start_year = first_year + (index - 1) * 10
+    start_age = start_year - birth_year + 1
+    return {
+        "index": index,
+        "start_age": start_age,
+        "end_age": start_age + 9,
+        "start_year": start_year,
+        "end_year": start_year + 9,
+        "gan_zhi": JIA_ZI[(month_gz + index if forward else month_gz - index) % 60],
+        "years": []
+    }
+
+
+def _liunian(
+    luck: Tuple,
+    cycle: Dict[str, Any],
+    years_from: Optional[int] = None,
+    years_to: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    大运内的流年 (编码版), 只计算窗口内的年份
+    
+    流年干支即该公历年的年干支 (year - 4) % 60, 直接按编码推算
+    """
+    dg, day_gz, year_gz = luck[4:]
+    ten_gods = TEN_GOD_TABLE[dg]
+    with_events = day_gz is not None or year_gz is not None
+    
+    start_year = cycle["start_year"]
+    first = start_year if years_from is None else max(start_year, years_from)
+    last = cycle["end_year"] if years_to is None else min(cycle["end_year"], years_to)
+    
+    years = []
+    for year in range(first, last + 1):
+        ln = (year - 4) % 60
+        years.append({
+            "year": year,
+            "age": cycle["start_age"] + year - start_year,
+            "gan_zhi": JIA_ZI[ln],
+            "ten_god": TEN_GOD_NAMES[ten_gods[ln % 10]],
+            "events": _liunian_events(ln, day_gz, year_gz) if with_events else []
+        })
+    return years
+
+
+def expand_luck_cycles(
+    luck: Tuple,
+    mode: str = "all",
+    years_from: Optional[int] = None,
+    years_to: Optional[int] = None,
+    offset: int = 0,
+    limit: int = MAX_LUCK_CYCLES
+) -> List[Dict[str, Any]]:
+    """
+    按需展开大运及流年
+    
+    Args:
+        luck: _luck_context 的结果
+        mode: summary 仅大运(不含流年) / current 仅含当前年份的大运 / all 全部大运
+        years_from, years_to: 流年窗口 (含两端), 窗口外的流年不计算
+        offset, limit: 大运分页 (在前 MAX_LUCK_CYCLES 步内)
+        
+    Returns:
+        大运列表
+    """
+    if mode not in LUCK_CYCLE_MODES:
+        raise ValueError(f"未知的大运展开方式: {mode}")
+    
+    indexes = range(1 + offset, 1 + min(offset + limit, MAX_LUCK_CYCLES))
+    
+    if mode == "current":
+        # 起运年份固定, 可直接算出当前年份所在的大运
+        index = (datetime.now().year - luck[0]) // 10 + 1
+        indexes = [index] if index in indexes else []
+    
+    cycles = [_luck_cycle(luck, index) for index in indexes]
+    if mode != "summary":
+        for cycle in cycles:
+            cycle["years"] = _liunian(luck, cycle, years_from, years_to)
+    return cycles
+
+
+def _pillar(position: str, position_cn: str, gan: int, zhi: int, ten_god: str, nayin: str) -> Dict[str, Any]:
+    """单柱输出 (编码 -> 汉字)"""
+    gan_name = TIAN_GAN[gan]
+    zhi_name = DI_ZHI[zhi]
+    return {
+        "position": position,
+        "position_cn": position_cn,
+        "gan": gan_name,
+        "zhi": zhi_name,
+        "gan_zhi": gan_name + zhi_name,
+        "gan_element": ELEMENTS[GAN_ELEMENT[gan]],
+        "zhi_element": ELEMENTS[ZHI_ELEMENT[zhi]],
+        "gan_yinyang": GAN_YIN_YANG[gan_name],
+        "ten_god": ten_god,
+        "hidden_stems": ZHI_CANG_GAN[zhi_name],
+        "nayin": nayin
+    }
+
+
+# 命盘缓存: 键为真太阳时校正后的 (年, 月, 日, 时, 分, 性别, 流派, 是否真太阳时)
+CHART_CACHE = LRUTTLCache(
+    maxsize=int(os.getenv("BAZI_CHART_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("BAZI_CHART_CACHE_TTL", "3600"))
+)
+
+
+def get_chart_cache_stats() -> Dict[str, Any]:
+    """命盘缓存命中统计"""
+    return CHART_CACHE.stats()
+
+
+# 四柱引擎: native 原生引擎 (预计算节气表), lunar 为 lunar-python 参考实现
+BAZI_ENGINES = ("native", "lunar")
+BAZI_ENGINE = os.getenv("BAZI_ENGINE", "native")
+
+
+def lunar_pillars(
+    year: int,
+    month: int,
+    day: int,
+    hour: int,
+    minute: int,
+    gender: int = 1,
+    sect: int = 1
+) -> Dict[str, Any]:
+    """
+    lunar-python 参考实现: 四柱及排盘所需的历法信息
+    
+    返回结构与 pillar_engine.compute_pillars 相同
+    """
+    solar = Solar.fromYmdHms(year, month, day, hour, minute, 0)
     lunar = solar.getLunar()
     eight_char = lunar.getEightChar()
     
+    # 设置流派（1：按子时换日）
+    eight_char.setSect(sect)
+    
     # 阳男阴女顺推，阴男阳女逆推
-    # lunar-python 库已经封装了逻辑
     yun = eight_char.getYun(gender)
+    prev_jieqi = lunar.getPrevJieQi()
+    next_jieqi = lunar.getNextJieQi()
     
-    da_yun_list = []
-    
-    # 获取大运
-    # getDaYun returns array of DaYun objects
-    dys = yun.getDaYun()
+    return {
+        "stems": [
+            GAN_CODE[eight_char.getYearGan()],
+            GAN_CODE[eight_char.getMonthGan()],
+            GAN_CODE[eight_char.getDayGan()],
+            GAN_CODE[eight_char.getTimeGan()],
+        ],
+        "branches": [
+            ZHI_CODE[eight_char.getYearZhi()],
+            ZHI_CODE[eight_char.getMonthZhi()],
+            ZHI_CODE[eight_char.getDayZhi()],
+            ZHI_CODE[eight_char.getTimeZhi()],
+        ],
+        "nayin": [
+            eight_char.getYearNaYin(),
+            eight_char.getMonthNaYin(),
+            eight_char.getDayNaYin(),
+            eight_char.getTimeNaYin(),
+        ],
+        "luck_start_year": yun.getStartSolar().getYear(),
+        "birth_year": year,
+        "forward": yun.isForward(),
+        "lunar_date": f"{lunar.getYearInChinese()}年{lunar.getMonthInChinese()}月{lunar.getDayInChinese()}",
+        "zodiac": lunar.getYearShengXiao(),
+        "constellation": solar.getXingZuo(),
+        "current_jieqi": prev_jieqi.getName() if prev_jieqi else None,
+        "next_jieqi": next_jieqi.getName() if next_jieqi else None
+    }
+
+
+def compute_pillars(
+    year: int,
+    month: int,
+    day: int,
+    hour: int,
+    minute: int,
+    gender: int = 1,
+    sect: int = 1,
+    engine: Optional[str] = None
+) -> Dict[str, Any]:
+    """按所选引擎计算四柱; 原生引擎超出预计算表范围时回退到 lunar-python"""
+    engine = engine or BAZI_ENGINE
+    if engine not in BAZI_ENGINES:
+        raise ValueError(f"未知的排盘引擎: {engine}")
+    if engine == "native" and pillar_engine.supports(datetime(year, month, day, hour, minute)):
+        return pillar_engine.compute_pillars(year, month, day, hour, minute, gender, sect)
+    return lunar_pillars(year, month, day, hour, minute, gender, sect)
+
+
+def _normalize_birth_time(
+    year: int,
+    month: int,
+    day: int,
+    hour: int,
+    minute: int,
+    longitude: float,
+    use_true_solar_time: bool
+) -> Tuple[datetime, Tuple[int, int, int, int, int], Optional[Dict[str, Any]]]:
+    """真太阳时校正, 返回 (原始时间, 校正后的年月日时分, 校正详情)"""
+    original_dt = datetime(year, month, day, hour, minute)
     
-    for i, dy in enumerate(dys):
-        if dy.getIndex() == 0:
-            # 跳过起运前的童限
-            continue
-            
-        start_year = dy.getStartYear()
-        start_age = dy.getStartAge()
-        end_year = dy.getEndYear()
-        
-        # 计算该大运内的10年流年
-        years = []
-        # getLiuNian returns a list of 10 objects
-        liu_nian_list = dy.getLiuNian()
-        
-        for ln in liu_nian_list:
-            current_year = ln.getYear()
-            current_age = ln.getAge()
-            gan_zhi = ln.getGanZhi()
-            gan = gan_zhi[0] # 流年天干           
-            # 计算流年十神 (相对于日主)
-            ten_god = get_ten_god(day_gan, gan)
-            
-            # 计算流年事件
-            events = calculate_liunian_events(gan_zhi, pillars) if pillars else []
-            
-            years.append({
-                "year": current_year,
-                "age": current_age,
-                "gan_zhi": gan_zhi,
-                "ten_god": ten_god,
-                "events": events
-            })
-            
-        da_yun_list.append({
-            "index": dy.getIndex(),
-            "start_age": start_age,
-            "end_age": dy.getEndAge(),
-            "start_year": start_year,
-            "end_year": end_year,
-            "gan_zhi": dy.getGanZhi(),
-            "years": years
-        })
-        
-        if len(da_yun_list) >= 8:
-            break
+    solar_correction = None
+    if use_true_solar_time:
+        true_dt, solar_correction = get_true_solar_time(original_dt, longitude)
+        year, month, day = true_dt.year, true_dt.month, true_dt.day
+        hour, minute = true_dt.hour, true_dt.minute
     
-    return da_yun_list
+    return original_dt, (year, month, day, hour, minute), solar_correction
+
+
+def _cached_chart(
+    ymdhm: Tuple[int, int, int, int, int],
+    gender: int,
+    sect: int,
+    use_true_solar_time: bool,
+    engine: Optional[str] = None
+) -> Tuple[str, Dict[str, Any], Tuple]:
+    """按校正后的出生时间取命盘 (经由命盘缓存)"""
+    engine = engine or BAZI_ENGINE
+    key = (*ymdhm, gender, sect, use_true_solar_time, engine)
+    cached = CHART_CACHE.get(key)
+    if cached is None:
+        cached = _compute_chart(*ymdhm, gender, sect, engine)
+        CHART_CACHE.set(key, cached)
+    return cached
 
 
 def generate_bazi_chart(
@@ -651,7 +909,12 @@ def generate_bazi_chart(
     longitude: float = 116.4,
     latitude: float = 39.9,
     gender: int = 1,
-    use_true_solar_time: bool = True
+    use_true_solar_time: bool = True,
+    sect: int = 1,
+    luck_cycles: str = "all",
+    years_from: Optional[int] = None,
+    years_to: Optional[int] = None,
+    engine: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     生成八字命盘
@@ -662,141 +925,186 @@ def generate_bazi_chart(
         latitude: 出生地纬度
         gender: 1男 0女
         use_true_solar_time: 是否使用真太阳时
+        sect: 子时流派（1：晚子时日柱算明天，2：晚子时日柱算当天）
+        luck_cycles: 大运展开方式 summary/current/all
+        years_from, years_to: 流年窗口（含两端），为空则不限
+        engine: 四柱引擎 native/lunar，默认取环境变量 BAZI_ENGINE
         
     Returns:
-        完整的八字命盘数据
+        完整的八字命盘数据（命盘部分来自缓存时为共享对象，调用方不得修改）
     """
-    # 原始时间
-    original_dt = datetime(year, month, day, hour, minute)
+    original_dt, ymdhm, solar_correction = _normalize_birth_time(
+        year, month, day, hour, minute, longitude, use_true_solar_time
+    )
+    lunar_date, chart, luck = _cached_chart(ymdhm, gender, sect, use_true_solar_time, engine)
+    year, month, day, hour, minute = ymdhm
     
-    # 真太阳时校正
-    solar_correction = None
-    if use_true_solar_time:
-        true_dt, solar_correction = get_true_solar_time(original_dt, longitude)
-        year, month, day = true_dt.year, true_dt.month, true_dt.day
-        hour, minute = true_dt.hour, true_dt.minute
+    return {
+        "birth_info": {
+            "solar_date": original_dt.strftime("%Y-%m-%d %H:%M"),
+            "true_solar_time": f"{year}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}" if use_true_solar_time else None,
+            "lunar_date": lunar_date,
+            "longitude": longitude,
+            "latitude": latitude,
+            "gender": "男" if gender == 1 else "女",
+            "solar_correction": solar_correction
+        },
+        **chart,
+        "luck_cycles": expand_luck_cycles(luck, luck_cycles, years_from, years_to)
+    }
+
+
+def get_bazi_luck_cycles(
+    year: int,
+    month: int,
+    day: int,
+    hour: int,
+    minute: int = 0,
+    longitude: float = 116.4,
+    gender: int = 1,
+    use_true_solar_time: bool = True,
+    sect: int = 1,
+    offset: int = 0,
+    limit: int = MAX_LUCK_CYCLES,
+    years_from: Optional[int] = None,
+    years_to: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    分页获取大运 (含流年), 供客户端按需加载
     
-    # 使用lunar-python计算八字
-    solar = Solar.fromYmdHms(year, month, day, hour, minute, 0)
-    lunar = solar.getLunar()
-    eight_char = lunar.getEightChar()
+    Returns:
+        {"total": 大运总步数, "offset", "limit", "luck_cycles": 本页大运}
+    """
+    _, ymdhm, _ = _normalize_birth_time(
+        year, month, day, hour, minute, longitude, use_true_solar_time
+    )
+    _, _, luck = _cached_chart(ymdhm, gender, sect, use_true_solar_time)
+    return {
+        "total": MAX_LUCK_CYCLES,
+        "offset": offset,
+        "limit": limit,
+        "luck_cycles": expand_luck_cycles(luck, "all", years_from, years_to, offset, limit)
+    }
+
+
+def _parse_gan_zhi(gan_zhi: str) -> int:
+    """干支字符串 -> 六十甲子序号"""
+    if len(gan_zhi) != 2 or gan_zhi[0] not in GAN_CODE or gan_zhi[1] not in ZHI_CODE:
+        raise ValueError(f"无效的干支: {gan_zhi}")
+    gan, zhi = GAN_CODE[gan_zhi[0]], ZHI_CODE[gan_zhi[1]]
+    if gan % 2 != zhi % 2:
+        raise ValueError(f"干支阴阳不配: {gan_zhi}")
+    return gan_zhi_code(gan, zhi)
+
+
+def find_bazi_birth_times(
+    year_pillar: str,
+    month_pillar: str,
+    day_pillar: str,
+    time_pillar: str,
+    year_from: int = 1900,
+    year_to: int = 2100,
+    sect: int = 1
+) -> Dict[str, Any]:
+    """
+    由四柱反查出生时间 (北京时间, 未做真太阳时校正)
+
+    Returns:
+        {"pillars": 四柱, "count": 窗口数, "windows": [{"start", "end"}]}，
+        窗口为左闭右开区间，精确到分钟
+    """
+    if year_from > year_to:
+        raise ValueError("起始年份不能晚于结束年份")
+    codes = [_parse_gan_zhi(p) for p in (year_pillar, month_pillar, day_pillar, time_pillar)]
+    windows = pillar_engine.find_datetimes(*codes, year_from, year_to, sect)
+    return {
+        "pillars": [JIA_ZI[c] for c in codes],
+        "count": len(windows),
+        "windows": [
+            {"start": start.strftime("%Y-%m-%d %H:%M"), "end": end.strftime("%Y-%m-%d %H:%M")}
+            for start, end in windows
+        ]
+    }
+
+
+def _compute_chart(
+    year: int,
+    month: int,
+    day: int,
+    hour: int,
+    minute: int,
+    gender: int,
+    sect: int,
+    engine: Optional[str] = None
+) -> Tuple[str, Dict[str, Any], Tuple]:
+    """
+    按(校正后)出生时间排盘, 返回 (农历日期, 命盘各部分, 大运参数)
     
-    # 设置流派（1：按子时换日）
-    eight_char.setSect(1)
-    
-    # 四柱
-    year_gan = eight_char.getYearGan()
-    year_zhi = eight_char.getYearZhi()
-    month_gan = eight_char.getMonthGan()
-    month_zhi = eight_char.getMonthZhi()
-    day_gan = eight_char.getDayGan()
-    day_zhi = eight_char.getDayZhi()
-    hour_gan = eight_char.getTimeGan()
-    hour_zhi = eight_char.getTimeZhi()
+    结果只依赖缓存键中的参数, 与经纬度等出生信息无关
+    """
+    pillar_data = compute_pillars(year, month, day, hour, minute, gender, sect, engine)
     
-    # 构建四柱数据
-    pillars = [
-        {
-            "position": "year",
-            "position_cn": "年柱",
-            "gan": year_gan,
-            "zhi": year_zhi,
-            "gan_zhi": f"{year_gan}{year_zhi}",
-            "gan_element": WU_XING[year_gan],
-            "zhi_element": WU_XING[year_zhi],
-            "gan_yinyang": GAN_YIN_YANG[year_gan],
-            "ten_god": get_ten_god(day_gan, year_gan),
-            "hidden_stems": ZHI_CANG_GAN[year_zhi],
-            "nayin": eight_char.getYearNaYin()
-        },
-        {
-            "position": "month",
-            "position_cn": "月柱",
-            "gan": month_gan,
-            "zhi": month_zhi,
-            "gan_zhi": f"{month_gan}{month_zhi}",
-            "gan_element": WU_XING[month_gan],
-            "zhi_element": WU_XING[month_zhi],
-            "gan_yinyang": GAN_YIN_YANG[month_gan],
-            "ten_god": get_ten_god(day_gan, month_gan),
-            "hidden_stems": ZHI_CANG_GAN[month_zhi],
-            "nayin": eight_char.getMonthNaYin()
-        },
-        {
-            "position": "day",
-            "position_cn": "日柱",
-            "gan": day_gan,
-            "zhi": day_zhi,
-            "gan_zhi": f"{day_gan}{day_zhi}",
-            "gan_element": WU_XING[day_gan],
-            "zhi_element": WU_XING[day_zhi],
-            "gan_yinyang": GAN_YIN_YANG[day_gan],
-            "ten_god": "日主",
-            "hidden_stems": ZHI_CANG_GAN[day_zhi],
-            "nayin": eight_char.getDayNaYin()
-        },
-        {
-            "position": "hour",
-            "position_cn": "时柱",
-            "gan": hour_gan,
-            "zhi": hour_zhi,
-            "gan_zhi": f"{hour_gan}{hour_zhi}",
-            "gan_element": WU_XING[hour_gan],
-            "zhi_element": WU_XING[hour_zhi],
-            "gan_yinyang": GAN_YIN_YANG[hour_gan],
-            "ten_god": get_ten_god(day_gan, hour_gan),
-            "hidden_stems": ZHI_CANG_GAN[hour_zhi],
-            "nayin": eight_char.getTimeNaYin()
-        }
-    ]
+    # 四柱编码 (年、月、日、时)
+    stems = pillar_data["stems"]
+    branches = pillar_data["branches"]
+    nayin = pillar_data["nayin"]
+    dg, mz = stems[2], branches[1]
+    day_element = GAN_ELEMENT[dg]
+    ten_gods = TEN_GOD_TABLE[dg]
     
-    # 大运
-    da_yun = get_da_yun(solar, gender, day_gan, pillars)
+    # 大运参数 (大运及流年在返回时按需展开)
+    luck = _luck_context(
+        pillar_data,
+        dg,
+        gan_zhi_code(dg, branches[2]),
+        gan_zhi_code(stems[0], branches[0])
+    )
     
     # 五行统计
-    elements_count = {"木": 0, "火": 0, "土": 0, "金": 0, "水": 0}
-    for pillar in pillars:
-        elements_count[pillar["gan_element"]] += 1
-        elements_count[pillar["zhi_element"]] += 1
+    counts = [0] * 5
+    for stem in stems:
+        counts[GAN_ELEMENT[stem]] += 1
+    for zhi in branches:
+        counts[ZHI_ELEMENT[zhi]] += 1
+    elements_count = dict(zip(ELEMENTS, counts))
     
-    # === 新增分析功能 ===
+    # === 分析功能 (编码版) ===
     # 身强身弱
-    strength_analysis = calculate_day_master_strength(day_gan, month_zhi, pillars)
+    score, level, details = _day_master_strength(dg, mz, [stems[0], stems[1], stems[3]], branches)
     
     # 喜用神
-    useful_gods = calculate_useful_gods(day_gan, strength_analysis, month_zhi)
+    useful_gods = _useful_gods(day_element, level, mz)
     
     # 格局
-    pattern_analysis = determine_pattern(day_gan, month_zhi, pillars, strength_analysis)
+    pattern_analysis = _pattern(dg, mz, stems, branches, score, level)
     
-    return {
-        "birth_info": {
-            "solar_date": original_dt.strftime("%Y-%m-%d %H:%M"),
-            "true_solar_time": f"{year}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}" if use_true_solar_time else None,
-            "lunar_date": f"{lunar.getYearInChinese()}年{lunar.getMonthInChinese()}月{lunar.getDayInChinese()}",
-            "longitude": longitude,
-            "latitude": latitude,
-            "gender": "男" if gender == 1 else "女",
-            "solar_correction": solar_correction
-        },
+    # 构建四柱数据
+    pillars = [
+        _pillar("year", "年柱", stems[0], branches[0], TEN_GOD_NAMES[ten_gods[stems[0]]], nayin[0]),
+        _pillar("month", "月柱", stems[1], branches[1], TEN_GOD_NAMES[ten_gods[stems[1]]], nayin[1]),
+        _pillar("day", "日柱", stems[2], branches[2], "日主", nayin[2]),
+        _pillar("hour", "时柱", stems[3], branches[3], TEN_GOD_NAMES[ten_gods[stems[3]]], nayin[3]),
+    ]
+    
+    day_gan = TIAN_GAN[dg]
+    return pillar_data["lunar_date"], {
         "chart": {
             "pillars": pillars,
             "day_master": {
                 "gan": day_gan,
-                "element": WU_XING[day_gan],
+                "element": ELEMENTS[day_element],
                 "yinyang": GAN_YIN_YANG[day_gan]
             },
             "elements_count": elements_count
         },
-        "strength_analysis": strength_analysis,
+        "strength_analysis": _strength_result(dg, score, level, details),
         "useful_gods": useful_gods,
         "pattern_analysis": pattern_analysis,
-        "luck_cycles": da_yun,
+        "luck_cycles": None,
         "additional_info": {
-            "zodiac": lunar.getYearShengXiao(),
-            "constellation": solar.getXingZuo(),
-            "current_jieqi": lunar.getPrevJieQi().getName() if lunar.getPrevJieQi() else None,
-            "next_jieqi": lunar.getNextJieQi().getName() if lunar.getNextJieQi() else None
+            "zodiac": pillar_data["zodiac"],
+            "constellation": pillar_data["constellation"],
+            "current_jieqi": pillar_data["current_jieqi"],
+            "next_jieqi": pillar_data["next_jieqi"]
         }
-    }
-
+    }, luck
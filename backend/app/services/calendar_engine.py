@@ -2,10 +2,19 @@
 万年历引擎
 Calendar Engine for Lunar/Solar conversion and JieQi calculation
 """
-from datetime import datetime
-from typing import Optional, Dict, Any
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Optional, Dict, Any, List, Tuple
 from lunar_python import Lunar, Solar
 
+from . import ephemeris, pillar_engine
+from .bazi_service import JIA_ZI
+
+# 日历区间单次最多天数
+MAX_RANGE_DAYS = 1100
+
+WEEKDAY_CN = "日一二三四五六"
+
 
 def solar_to_lunar(year: int, month: int, day: int) -> Dict[str, Any]:
     """
@@ -70,17 +79,20 @@ def get_jie_qi_list(year: int) -> list:
         year: 公历年份
         
     Returns:
-        节气列表，包含名称和精确时间
+        节气列表（小寒至冬至），包含名称和精确时间
     """
+    # 优先读取预计算星历（内存映射，无需逐年推算）
+    if ephemeris.covers_year(year):
+        return ephemeris.year_terms(year)
+    
     from lunar_python import LunarYear
     
-    lunar_year = LunarYear.fromYear(year)
     jie_qi_list = []
     
-    # 获取该年的所有节气
-    jq_map = lunar_year.getJieQiJulianDays()
+    # 节气表第2~25项为本公历年的小寒至冬至
+    julian_days = LunarYear.fromYear(year).getJieQiJulianDays()[2:26]
     
-    for name, jd in jq_map.items():
+    for name, jd in zip(ephemeris.TERM_NAMES, julian_days):
         solar = Solar.fromJulianDay(jd)
         jie_qi_list.append({
             "name": name,
@@ -91,6 +103,110 @@ def get_jie_qi_list(year: int) -> list:
     return jie_qi_list
 
 
+def get_calendar_range(start: date, end: date) -> List[Dict[str, Any]]:
+    """
+    获取日期区间内每日的干支、农历与节气（用于月历、年历网格）
+    
+    Args:
+        start, end: 起止公历日期（含两端）
+        
+    Returns:
+        逐日信息列表
+    """
+    if end < start:
+        raise ValueError("结束日期不能早于开始日期")
+    if (end - start).days + 1 > MAX_RANGE_DAYS:
+        raise ValueError(f"日期区间不能超过{MAX_RANGE_DAYS}天")
+    
+    if not (pillar_engine.TABLE_LOADED and ephemeris.covers_year(start.year) and ephemeris.covers_year(end.year)):
+        return [_lunar_day_info(date.fromordinal(o)) for o in range(start.toordinal(), end.toordinal() + 1)]
+    
+    first, last = start.toordinal(), end.toordinal()
+    
+    # 日柱: 儒略日序号整体取模
+    day_gz = [(o + pillar_engine.ORDINAL_TO_DAY_GZ) % 60 for o in range(first, last + 1)]
+    
+    # 农历月: 在朔日表上定位一次, 之后顺序推进
+    month_starts = pillar_engine.MONTH_STARTS
+    m = bisect_right(month_starts, first) - 1
+    
+    # 节气: 定位区间起点后的第一个节气, 之后顺序推进
+    terms = ephemeris.TERMS
+    epoch = ephemeris.EPOCH.toordinal()
+    k = bisect_left(terms, (first - epoch) * 86400)
+    
+    days = []
+    for i, o in enumerate(range(first, last + 1)):
+        while m + 1 < len(month_starts) and month_starts[m + 1] <= o:
+            m += 1
+        lunar_month = pillar_engine.MONTH_NUMBERS[m]
+        lunar_day = o - month_starts[m] + 1
+        
+        jie_qi = jie_qi_time = None
+        if k < len(terms) and terms[k] < (o + 1 - epoch) * 86400:
+            jie_qi = ephemeris.term_name(k)
+            jie_qi_time = ephemeris.term_time(k).strftime("%H:%M:%S")
+            k += 1
+        
+        d = date.fromordinal(o)
+        days.append({
+            "solar_date": d.isoformat(),
+            "weekday": d.isoweekday() % 7,
+            "weekday_cn": WEEKDAY_CN[d.isoweekday() % 7],
+            "day_gan_zhi": JIA_ZI[day_gz[i]],
+            "lunar_year": pillar_engine.MONTH_YEARS[m],
+            "lunar_month": lunar_month,
+            "lunar_day": lunar_day,
+            "lunar_month_cn": ("闰" if lunar_month < 0 else "") + pillar_engine.LUNAR_MONTHS[abs(lunar_month)],
+            "lunar_day_cn": pillar_engine.LUNAR_DAYS[lunar_day],
+            "is_leap_month": lunar_month < 0,
+            "jie_qi": jie_qi,
+            "jie_qi_time": jie_qi_time
+        })
+    
+    return days
+
+
+def lunar_date(d: date) -> Tuple[int, int, int]:
+    """
+    公历日期 -> (农历年, 农历月(闰月为负), 农历日)
+    
+    预计算表覆盖范围内为一次二分查找，否则用 lunar-python
+    """
+    o = d.toordinal()
+    month_starts = pillar_engine.MONTH_STARTS
+    if pillar_engine.TABLE_LOADED and ephemeris.covers_year(d.year) and month_starts[0] <= o:
+        m = bisect_right(month_starts, o) - 1
+        return pillar_engine.MONTH_YEARS[m], pillar_engine.MONTH_NUMBERS[m], o - month_starts[m] + 1
+    lunar = Solar.fromYmd(d.year, d.month, d.day).getLunar()
+    return lunar.getYear(), lunar.getMonth(), lunar.getDay()
+
+
+def _lunar_day_info(d: date) -> Dict[str, Any]:
+    """lunar-python 逐日计算（超出预计算表范围时使用）"""
+    solar = Solar.fromYmd(d.year, d.month, d.day)
+    lunar = solar.getLunar()
+    jie_qi = lunar.getJieQi()
+    # 节气表中冬至等名称会重复出现（上一年与本年），按日期取当日那一个
+    jie_qi_solar = next(
+        (v for v in lunar.getJieQiTable().values() if v.toYmd() == solar.toYmd()), None
+    ) if jie_qi else None
+    return {
+        "solar_date": d.isoformat(),
+        "weekday": solar.getWeek(),
+        "weekday_cn": solar.getWeekInChinese(),
+        "day_gan_zhi": lunar.getDayInGanZhi(),
+        "lunar_year": lunar.getYear(),
+        "lunar_month": lunar.getMonth(),
+        "lunar_day": lunar.getDay(),
+        "lunar_month_cn": lunar.getMonthInChinese(),
+        "lunar_day_cn": lunar.getDayInChinese(),
+        "is_leap_month": lunar.getMonth() < 0,
+        "jie_qi": jie_qi or None,
+        "jie_qi_time": jie_qi_solar.toYmdHms()[11:] if jie_qi_solar else None
+    }
+
+
 def get_today_info() -> Dict[str, Any]:
     """
     获取今日综合信息
@@ -0,0 +1,317 @@
+"""
+合婚配对服务
+Bulk compatibility (合婚) scoring between many BaZi charts
+
+每张命盘编码为若干整数特征, 两两配对的得分由查表与矩阵乘法整体算出:
+- 日柱 × 年支: 日干五合/相冲、日支(夫妻宫)与年支(生肖)的合冲刑害, 合并为一张 720×720 查分表
+- 四柱地支交叉: 地支计数向量 A(N×12) · 关系矩阵(12×12) · B(M×12)ᵀ
+- 五行互补: 一方喜用五行在另一方命局中的多寡, 减去忌神五行, 双向相加
+
+得分对称, 按行分块计算 N×M 矩阵并取每行 top-k, 内存占用只与块大小有关.
+"""
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .bazi_service import (
+    DI_ZHI, TIAN_GAN, ELEMENTS, GAN_CODE, ZHI_CODE, ELEMENT_CODE,
+    GAN_ELEMENT, ZHI_ELEMENT, ZHI_CHONG, ZHI_HE,
+    gan_zhi_code, generate_bazi_chart
+)
+
+
+# 单次配对每侧最多命盘数
+COMPAT_MAX_ITEMS = int(os.getenv("COMPAT_MAX_ITEMS", "10000"))
+
+# 分块计算时每块的行数
+COMPAT_CHUNK_ROWS = int(os.getenv("COMPAT_CHUNK_ROWS", "512"))
+
+
+# ========== 关系表 ==========
+
+# 六害
+LIU_HAI = [("子", "未"), ("丑", "午"), ("寅", "巳"), ("卯", "辰"), ("申", "亥"), ("酉", "戌")]
+
+# 相刑: 子卯无礼之刑, 寅巳申无恩之刑, 丑戌未恃势之刑
+XIANG_XING = [("子", "卯"), ("寅", "巳"), ("巳", "申"), ("申", "寅"), ("丑", "戌"), ("戌", "未"), ("未", "丑")]
+
+# 自刑
+ZI_XING = ["辰", "午", "酉", "亥"]
+
+# 三合局 (两两相见为半合)
+SAN_HE = [("申", "子", "辰"), ("亥", "卯", "未"), ("寅", "午", "戌"), ("巳", "酉", "丑")]
+
+BRANCH_SCORES = {"六合": 10, "三合": 6, "六冲": -10, "六害": -6, "相刑": -6, "自刑": -3}
+STEM_SCORES = {"五合": 10, "相冲": -6}
+
+# 各项权重
+WEIGHT_DAY_BRANCH = 3.0     # 日支 (夫妻宫)
+WEIGHT_YEAR_BRANCH = 1.0    # 年支 (生肖)
+WEIGHT_DAY_STEM = 2.0       # 日干
+WEIGHT_ALL_BRANCHES = 0.5   # 四柱地支交叉
+WEIGHT_ELEMENTS = 4.0       # 五行互补 (每个五行计数)
+
+
+def _branch_relations() -> List[List[List[str]]]:
+    relations = [[[] for _ in range(12)] for _ in range(12)]
+
+    def mark(a: int, b: int, name: str):
+        relations[a][b].append(name)
+        if a != b:
+            relations[b][a].append(name)
+
+    for z in range(12):
+        if ZHI_HE[z] > z:
+            mark(z, ZHI_HE[z], "六合")
+        if ZHI_CHONG[z] > z:
+            mark(z, ZHI_CHONG[z], "六冲")
+    for group in SAN_HE:
+        codes = [ZHI_CODE[z] for z in group]
+        for i in range(3):
+            mark(codes[i], codes[(i + 1) % 3], "三合")
+    for a, b in LIU_HAI:
+        mark(ZHI_CODE[a], ZHI_CODE[b], "六害")
+    for a, b in XIANG_XING:
+        mark(ZHI_CODE[a], ZHI_CODE[b], "相刑")
+    for z in ZI_XING:
+        mark(ZHI_CODE[z], ZHI_CODE[z], "自刑")
+    return relations
+
+
+def _stem_relations() -> List[List[List[str]]]:
+    relations = [[[] for _ in range(10)] for _ in range(10)]
+    for a in range(10):
+        # 甲己、乙庚、丙辛、丁壬、戊癸相合
+        relations[a][(a + 5) % 10].append("五合")
+    for a in range(4):
+        # 甲庚、乙辛、丙壬、丁癸相冲 (戊己居中无冲)
+        relations[a][a + 6].append("相冲")
+        relations[a + 6][a].append("相冲")
+    return relations
+
+
+BRANCH_RELATIONS = _branch_relations()
+STEM_RELATIONS = _stem_relations()
+
+BRANCH_MATRIX = np.array(
+    [[sum(BRANCH_SCORES[r] for r in cell) for cell in row] for row in BRANCH_RELATIONS],
+    dtype=np.float32
+)
+STEM_MATRIX = np.array(
+    [[sum(STEM_SCORES[r] for r in cell) for cell in row] for row in STEM_RELATIONS],
+    dtype=np.float32
+)
+
+# 日柱(六十甲子) × 年支 合并查分表: 键 = 日柱序号 * 12 + 年支
+_day_stems = np.arange(720) // 12 % 10
+_day_branches = np.arange(720) // 12 % 12
+_year_branches = np.arange(720) % 12
+PILLAR_PAIR_TABLE = (
+    WEIGHT_DAY_STEM * STEM_MATRIX[_day_stems[:, None], _day_stems[None, :]]
+    + WEIGHT_DAY_BRANCH * BRANCH_MATRIX[_day_branches[:, None], _day_branches[None, :]]
+    + WEIGHT_YEAR_BRANCH * BRANCH_MATRIX[_year_branches[:, None], _year_branches[None, :]]
+).astype(np.float32)
+
+
+# ========== 特征编码 ==========
+
+_GAN_ELEMENT = np.array(GAN_ELEMENT, dtype=np.int8)
+_ZHI_ELEMENT = np.array(ZHI_ELEMENT, dtype=np.int8)
+
+
+class ChartFeatures:
+    """
+    一组命盘的整数特征 (每行一张命盘)
+
+    - pillar_key: 日柱序号 * 12 + 年支
+    - branch_counts: 四柱地支计数 (N×12)
+    - element_counts: 天干地支五行计数 (N×5)
+    - favorable / unfavorable: 喜用 / 忌神五行标记 (N×5, 0/1)
+    """
+    __slots__ = ("stems", "branches", "pillar_key", "branch_counts", "element_counts", "favorable", "unfavorable")
+
+    def __init__(self, stems: np.ndarray, branches: np.ndarray, favorable: np.ndarray, unfavorable: np.ndarray):
+        n = len(stems)
+        rows = np.arange(n)[:, None]
+        self.stems = stems
+        self.branches = branches
+        codes = stems.astype(np.int32), branches.astype(np.int32)
+        self.pillar_key = gan_zhi_code(codes[0][:, 2], codes[1][:, 2]) * 12 + codes[1][:, 0]
+
+        self.branch_counts = np.zeros((n, 12), dtype=np.float32)
+        np.add.at(self.branch_counts, (rows, branches), 1)
+
+        self.element_counts = np.zeros((n, 5), dtype=np.float32)
+        np.add.at(self.element_counts, (rows, _GAN_ELEMENT[stems]), 1)
+        np.add.at(self.element_counts, (rows, _ZHI_ELEMENT[branches]), 1)
+
+        self.favorable = favorable.astype(np.float32)
+        self.unfavorable = unfavorable.astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.stems)
+
+
+def encode_charts(charts: List[Dict[str, Any]]) -> ChartFeatures:
+    """由 generate_bazi_chart 的结果编码特征"""
+    n = len(charts)
+    stems = np.zeros((n, 4), dtype=np.int8)
+    branches = np.zeros((n, 4), dtype=np.int8)
+    favorable = np.zeros((n, 5), dtype=np.int8)
+    unfavorable = np.zeros((n, 5), dtype=np.int8)
+    for i, chart in enumerate(charts):
+        for j, pillar in enumerate(chart["chart"]["pillars"]):
+            stems[i, j] = GAN_CODE[pillar["gan"]]
+            branches[i, j] = ZHI_CODE[pillar["zhi"]]
+        useful_gods = chart["useful_gods"]
+        for e in useful_gods["xi_shen"]:
+            favorable[i, ELEMENT_CODE[e]] = 1
+        for e in useful_gods["ji_shen"]:
+            unfavorable[i, ELEMENT_CODE[e]] = 1
+    return ChartFeatures(stems, branches, favorable, unfavorable)
+
+
+def encode_requests(requests: List[Dict[str, Any]]) -> ChartFeatures:
+    """由出生信息 (BaziRequest 字段) 排盘并编码特征"""
+    return encode_charts([
+        generate_bazi_chart(
+            year=r["birth_year"],
+            month=r["birth_month"],
+            day=r["birth_day"],
+            hour=r["birth_hour"],
+            minute=r["birth_minute"],
+            longitude=r["longitude"],
+            latitude=r["latitude"],
+            gender=r["gender"],
+            use_true_solar_time=r["use_true_solar_time"],
+            sect=r["sect"],
+            luck_cycles="summary"
+        )
+        for r in requests
+    ])
+
+
+# ========== 配对计算 ==========
+
+def _score_block(a: ChartFeatures, rows: slice, b: ChartFeatures) -> np.ndarray:
+    """a 的若干行与 b 全部命盘的得分 (行数×M)"""
+    scores = PILLAR_PAIR_TABLE[a.pillar_key[rows, None], b.pillar_key[None, :]]
+    scores += WEIGHT_ALL_BRANCHES * (a.branch_counts[rows] @ BRANCH_MATRIX @ b.branch_counts.T)
+    scores += WEIGHT_ELEMENTS * (
+        (a.favorable[rows] - a.unfavorable[rows]) @ b.element_counts.T
+        + a.element_counts[rows] @ (b.favorable - b.unfavorable).T
+    )
+    return scores
+
+
+def compatibility_matrix(a: ChartFeatures, b: ChartFeatures) -> np.ndarray:
+    """完整 N×M 得分矩阵 (float32)"""
+    result = np.empty((len(a), len(b)), dtype=np.float32)
+    for start in range(0, len(a), COMPAT_CHUNK_ROWS):
+        rows = slice(start, start + COMPAT_CHUNK_ROWS)
+        result[rows] = _score_block(a, rows, b)
+    return result
+
+
+def top_k_matches(
+    a: ChartFeatures,
+    b: Optional[ChartFeatures] = None,
+    k: int = 10
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    每张命盘得分最高的 k 个配对
+
+    b 为空时在 a 内部两两配对 (排除自身)
+
+    Returns:
+        (索引 N×k, 得分 N×k), 按得分降序
+    """
+    same = b is None
+    b = a if same else b
+    k = min(k, len(b) - (1 if same else 0))
+    indices = np.empty((len(a), k), dtype=np.int64)
+    values = np.empty((len(a), k), dtype=np.float32)
+    if k <= 0:
+        return indices, values
+
+    for start in range(0, len(a), COMPAT_CHUNK_ROWS):
+        rows = slice(start, start + COMPAT_CHUNK_ROWS)
+        scores = _score_block(a, rows, b)
+        if same:
+            n = scores.shape[0]
+            scores[np.arange(n), np.arange(start, start + n)] = -np.inf
+        if k < scores.shape[1]:
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.lexsort((part, -part_scores), axis=1)
+        indices[rows] = np.take_along_axis(part, order, axis=1)
+        values[rows] = np.take_along_axis(part_scores, order, axis=1)
+    return indices, values
+
+
+def explain_pair(a: ChartFeatures, i: int, b: ChartFeatures, j: int) -> Dict[str, Any]:
+    """单个配对的得分明细 (与矩阵计算使用同一套关系表与权重)"""
+    sa, ba, sb, bb = a.stems[i], a.branches[i], b.stems[j], b.branches[j]
+    relations = []
+
+    def describe(label: str, names: List[str], x: str, y: str):
+        for name in names:
+            relations.append(f"{label}{x}{y}{name}")
+
+    describe("日干", STEM_RELATIONS[sa[2]][sb[2]], TIAN_GAN[sa[2]], TIAN_GAN[sb[2]])
+    describe("日支", BRANCH_RELATIONS[ba[2]][bb[2]], DI_ZHI[ba[2]], DI_ZHI[bb[2]])
+    describe("年支", BRANCH_RELATIONS[ba[0]][bb[0]], DI_ZHI[ba[0]], DI_ZHI[bb[0]])
+
+    complement = [
+        ELEMENTS[e] for e in range(5)
+        if (a.favorable[i, e] and b.element_counts[j, e]) or (b.favorable[j, e] and a.element_counts[i, e])
+    ]
+    return {
+        "pillars": float(PILLAR_PAIR_TABLE[a.pillar_key[i], b.pillar_key[j]]),
+        "branches": float(WEIGHT_ALL_BRANCHES * (a.branch_counts[i] @ BRANCH_MATRIX @ b.branch_counts[j])),
+        "elements": float(WEIGHT_ELEMENTS * (
+            (a.favorable[i] - a.unfavorable[i]) @ b.element_counts[j]
+            + a.element_counts[i] @ (b.favorable[j] - b.unfavorable[j])
+        )),
+        "relations": relations,
+        "complementary_elements": complement
+    }
+
+
+def match_charts(
+    left: List[Dict[str, Any]],
+    right: Optional[List[Dict[str, Any]]] = None,
+    top_k: int = 10
+) -> Dict[str, Any]:
+    """
+    批量合婚配对
+
+    Args:
+        left: 出生信息列表 (BaziRequest 字段)
+        right: 候选出生信息列表, 为空时 left 内部两两配对
+        top_k: 每人返回的最佳配对数
+
+    Returns:
+        {"count", "top_k", "matches": [{"index", "candidates": [{"index", "score", "detail"}]}]}
+    """
+    a = encode_requests(left)
+    b = encode_requests(right) if right is not None else None
+    indices, values = top_k_matches(a, b, top_k)
+    b = a if b is None else b
+    return {
+        "count": len(a),
+        "top_k": indices.shape[1],
+        "matches": [
+            {
+                "index": i,
+                "candidates": [
+                    {"index": int(j), "score": round(float(s), 2), "detail": explain_pair(a, i, b, int(j))}
+                    for j, s in zip(indices[i], values[i])
+                ]
+            }
+            for i in range(len(a))
+        ]
+    }
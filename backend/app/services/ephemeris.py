@@ -0,0 +1,146 @@
+"""
+节气星历
+Memory-mapped solar-term ephemeris for 1899-2101
+
+二十四节气的交接时刻离线计算后写入定长二进制文件 (app/data/solar_terms.bin),
+运行时以 mmap 只读映射, 时刻数组直接是映射内存上的 memoryview, 不做拷贝、不做解析.
+
+文件布局 (小端):
+    表头 16 字节: 魔数 b"ZYST", 版本, 首年, 年数, 每年节气数 (24), 4 字节填充
+    记录区: 年数 × 24 个 int64, 第 i 年第 k 个节气位于下标 i*24+k
+
+每年固定 24 条, 自小寒起至冬至; 年份索引即 (year - 首年) * 24, 无需另存偏移表.
+时刻以 1899-01-01 00:00 (北京时间) 起算的秒数表示.
+
+文件由 lunar-python 生成:
+    python -m app.services.ephemeris
+"""
+import mmap
+import os
+import struct
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+
+EPHEMERIS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'solar_terms.bin')
+
+_HEADER = struct.Struct("<4sHHHH4x")
+_MAGIC = b"ZYST"
+_VERSION = 1
+
+# 覆盖的公历年份 (排盘真太阳时校正跨年及起运需要前后各一年的节气)
+FIRST_YEAR = 1899
+LAST_YEAR = 2101
+TERMS_PER_YEAR = 24
+
+# 每年24节气, 自小寒起; 偶数位为"节" (定月令), 奇数位为"气"
+TERM_NAMES = [
+    "小寒", "大寒", "立春", "雨水", "惊蛰", "春分", "清明", "谷雨",
+    "立夏", "小满", "芒种", "夏至", "小暑", "大暑", "立秋", "处暑",
+    "白露", "秋分", "寒露", "霜降", "立冬", "小雪", "大雪", "冬至"
+]
+
+EPOCH = datetime(FIRST_YEAR, 1, 1)
+
+
+def to_seconds(dt: datetime) -> int:
+    return (dt - EPOCH) // timedelta(seconds=1)
+
+
+def from_seconds(seconds: int) -> datetime:
+    return EPOCH + timedelta(seconds=seconds)
+
+
+# ========== 加载 ==========
+
+TERMS: memoryview = memoryview(b"").cast('q')  # 各节气时刻 (秒), 共 年数×24
+_mapping: Optional[mmap.mmap] = None
+
+
+def load_ephemeris(path: str = EPHEMERIS_FILE) -> bool:
+    """映射星历文件, 文件不存在或格式不符时返回 False"""
+    global TERMS, _mapping
+    try:
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return False
+
+    if len(mapping) < _HEADER.size:
+        mapping.close()
+        return False
+    magic, version, first_year, year_count, per_year = _HEADER.unpack_from(mapping, 0)
+    size = year_count * per_year * 8
+    if (magic != _MAGIC or version != _VERSION or first_year != FIRST_YEAR
+            or year_count != LAST_YEAR - FIRST_YEAR + 1 or per_year != TERMS_PER_YEAR
+            or len(mapping) < _HEADER.size + size):
+        mapping.close()
+        return False
+
+    TERMS = memoryview(mapping)[_HEADER.size:_HEADER.size + size].cast('q')
+    _mapping = mapping
+    return True
+
+
+def build_ephemeris(path: str = EPHEMERIS_FILE):
+    """由 lunar-python 生成星历文件 (离线执行)"""
+    from array import array
+    from lunar_python import LunarYear, Solar
+
+    terms = array('q')
+    for year in range(FIRST_YEAR, LAST_YEAR + 1):
+        # 该年节气表中第2~25项为本公历年的小寒至冬至
+        for jd in LunarYear.fromYear(year).getJieQiJulianDays()[2:26]:
+            s = Solar.fromJulianDay(jd)
+            dt = datetime(s.getYear(), s.getMonth(), 1) + timedelta(
+                days=s.getDay() - 1, hours=s.getHour(), minutes=s.getMinute(), seconds=s.getSecond()
+            )
+            terms.append(to_seconds(dt))
+
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, FIRST_YEAR, LAST_YEAR - FIRST_YEAR + 1, TERMS_PER_YEAR))
+        f.write(terms.tobytes())
+    os.replace(tmp, path)
+
+
+EPHEMERIS_LOADED = load_ephemeris()
+
+
+# ========== 查询 ==========
+
+def covers_year(year: int) -> bool:
+    return EPHEMERIS_LOADED and FIRST_YEAR <= year <= LAST_YEAR
+
+
+def term_index(dt: datetime) -> int:
+    """dt 所在节气的全局下标 (交接时刻当刻即属新节气), 早于首个节气时为 -1"""
+    return bisect_right(TERMS, to_seconds(dt)) - 1
+
+
+def term_name(index: int) -> str:
+    return TERM_NAMES[index % TERMS_PER_YEAR]
+
+
+def term_time(index: int) -> datetime:
+    return from_seconds(TERMS[index])
+
+
+def year_terms(year: int) -> List[Dict[str, str]]:
+    """某公历年小寒至冬至的二十四节气"""
+    base = (year - FIRST_YEAR) * TERMS_PER_YEAR
+    result = []
+    for k, name in enumerate(TERM_NAMES):
+        dt = from_seconds(TERMS[base + k])
+        result.append({
+            "name": name,
+            "solar_date": dt.strftime("%Y-%m-%d"),
+            "time": dt.strftime("%H:%M:%S")
+        })
+    return result
+
+
+if __name__ == "__main__":
+    build_ephemeris()
+    print(f"已生成 {EPHEMERIS_FILE}")
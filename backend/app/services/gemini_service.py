@@ -2,24 +2,15 @@
 Gemini AI 解卦服务
 AI-powered Hexagram Interpretation using Google Gemini
 """
-import os
-from typing import Dict, Any, Optional
-from dotenv import load_dotenv
-import google.generativeai as genai
+import asyncio
+from typing import AsyncIterator, Dict, Any, Optional
+from starlette.concurrency import run_in_threadpool
 
-# 加载环境变量
-load_dotenv()
-
-# Gemini API 配置
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
-
-# 初始化 Gemini
-def init_gemini():
-    """初始化 Gemini API"""
-    if GEMINI_API_KEY:
-        genai.configure(api_key=GEMINI_API_KEY)
-        return True
-    return False
+from .ai_cache import AI_CACHE, cache_key
+from .bazi_prompt import bazi_reading_prompt, year_analysis_prompt
+from .llm_client import get_client
+from .singleflight import SingleFlight, SharedStreams
+from .sse import aclosing
 
 
 # 解卦系统提示词
@@ -68,45 +59,144 @@ async def generate_ai_interpretation(
     Returns:
         AI 生成的解读
     """
-    if not init_gemini():
-        return {
-            "success": False,
-            "error": "Gemini API key not configured",
-            "content": None
-        }
-    
-    moving_positions = moving_positions or []
-    
-    # 构建提示词
-    prompt = _build_interpretation_prompt(
+    prompt = build_interpretation_prompt(
         question=question,
         hexagram_name=hexagram_name,
         changed_hexagram_name=changed_hexagram_name,
-        moving_positions=moving_positions,
+        moving_positions=moving_positions or [],
         yaos_data=yaos_data,
         interpretation_data=interpretation_data
     )
-    
+    return await complete(prompt)
+
+
+# ========== 模型调用 ==========
+
+# 相同提示词的并发请求合并 (键同 AI 解读缓存)
+_FLIGHTS = SingleFlight()
+_STREAMS = SharedStreams()
+
+
+def _not_configured() -> Dict[str, Any]:
+    return {
+        "success": False,
+        "error": "Gemini API key not configured",
+        "content": None,
+        "cached": False
+    }
+
+
+async def _cached(key: str) -> Optional[str]:
+    """查 AI 解读缓存, 内存层未命中时在线程池中查磁盘层"""
+    content = AI_CACHE.get_memory(key)
+    if content is None:
+        content = await run_in_threadpool(AI_CACHE.get_disk, key)
+    return content
+
+
+async def complete(prompt: str) -> Dict[str, Any]:
+    """
+    调用模型生成完整回复
+
+    同一提示词 (规整后) 的成功回复经 AI 解读缓存复用, 此时 cached 为 True;
+    未命中缓存时, 同时进行的相同提示词请求合并为一次模型调用, 共享同一结果
+
+    Returns:
+        {"success": bool, "error": 错误信息, "content": 回复文本, "cached": bool}
+        （合并请求共享同一对象，勿修改）
+    """
+    client = get_client()
+    key = cache_key(prompt, client.model)
+    content = await _cached(key)
+    if content is not None:
+        return {"success": True, "error": None, "content": content, "cached": True}
+
+    if not client.configured:
+        return _not_configured()
+    return await _FLIGHTS.do(key, lambda: _generate(client, key, prompt))
+
+
+async def _generate(client, key: str, prompt: str) -> Dict[str, Any]:
     try:
-        # 调用 Gemini API (Gemma 模型不支持 system_instruction，合并到 prompt)
-        model = genai.GenerativeModel(model_name="gemma-3-1b-it")
-        
-        full_prompt = INTERPRETATION_SYSTEM_PROMPT + "\n\n" + prompt
-        response = await model.generate_content_async(full_prompt)
-        
-        return {
-            "success": True,
-            "error": None,
-            "content": response.text
-        }
-        
+        content = await client.generate(prompt)
     except Exception as e:
         return {
             "success": False,
             "error": str(e),
-            "content": None
+            "content": None,
+            "cached": False
         }
 
+    await run_in_threadpool(AI_CACHE.set, key, client.model, content)
+    return {
+        "success": True,
+        "error": None,
+        "content": content,
+        "cached": False
+    }
+
+
+async def stream_completion(prompt: str) -> AsyncIterator[str]:
+    """
+    调用模型并逐段产出回复文本
+
+    缓存命中时一次产出全文; 否则同时进行的相同提示词请求共用一次上游流式调用,
+    后到者先补发已到达的片段. 上游读完后写入缓存 (中途出错不写入).
+    客户端断开只结束该订阅; 全部订阅者都断开时取消上游调用
+    
+    Raises:
+        LLMError: 未配置、熔断中或超时 (均为 RuntimeError)
+    """
+    client = get_client()
+    key = cache_key(prompt, client.model)
+    content = await _cached(key)
+    if content is not None:
+        yield content
+        return
+
+    async with aclosing(_STREAMS.subscribe(key, lambda: _stream(client, key, prompt))) as chunks:
+        async for text in chunks:
+            yield text
+
+
+async def _stream(client, key: str, prompt: str) -> AsyncIterator[str]:
+    parts = []
+    async for text in client.stream(prompt):
+        parts.append(text)
+        yield text
+    if parts:
+        await run_in_threadpool(AI_CACHE.set, key, client.model, "".join(parts))
+
+
+def flight_stats() -> Dict[str, Any]:
+    """请求合并统计"""
+    return {"complete": _FLIGHTS.stats(), "stream": _STREAMS.stats()}
+
+
+def ai_configured() -> bool:
+    return get_client().configured
+
+
+# ========== 提示词 ==========
+
+def build_interpretation_prompt(
+    question: str,
+    hexagram_name: str,
+    changed_hexagram_name: Optional[str] = None,
+    moving_positions: list = None,
+    yaos_data: list = None,
+    interpretation_data: Dict = None
+) -> str:
+    """六爻解卦完整提示词（含系统提示词）"""
+    return INTERPRETATION_SYSTEM_PROMPT + "\n\n" + _build_interpretation_prompt(
+        question=question,
+        hexagram_name=hexagram_name,
+        changed_hexagram_name=changed_hexagram_name,
+        moving_positions=moving_positions or [],
+        yaos_data=yaos_data,
+        interpretation_data=interpretation_data
+    )
+
 
 def _build_interpretation_prompt(
     question: str,
@@ -157,98 +247,46 @@ def _build_interpretation_prompt(
 
 
 
-async def generate_bazi_year_analysis(chart_data: Dict, target_year: int) -> Dict[str, Any]:
+def build_year_analysis_prompt(chart_data: Dict, target_year: int) -> str:
     """
-    生成指定流年的命理分析
-    """
-    if not init_gemini():
-        return {
-            "success": False,
-            "error": "Gemini API key not configured",
-            "content": None
-        }
-        
-    # 提取关键信息构建Prompt
-    day_master = chart_data['chart']['day_master']['gan']
-    pattern = chart_data['pattern_analysis']['main_pattern']['name']
-    strong_weak = chart_data['strength_analysis']['level']
-    useful_gods = chart_data['useful_gods']['yong_shen']
-    xi_shen = chart_data['useful_gods']['xi_shen']
-    
-    # 找到该流年的信息
-    year_info = None
-    luck_cycle = None
+    流年分析完整提示词（含系统提示词）, 见 bazi_prompt.year_analysis_prompt
     
-    for cycle in chart_data.get('luck_cycles', []):
-        if cycle['start_year'] <= target_year <= cycle['end_year']:
-            luck_cycle = cycle
-            for y in cycle.get('years', []):
-                if y['year'] == target_year:
-                    year_info = y
-                    break
-            break
-            
-    if not year_info:
-        return {"success": False, "error": f"找不到{target_year}年的流年数据", "content": None}
-
-    # 提取流年干支的详细信息
-    ln_gan = year_info['gan_zhi'][0]
-    ln_zhi = year_info['gan_zhi'][1]
-    
-    # 地支对应的五行和生肖
-    ZHI_WUXING = {'子': '水', '丑': '土', '寅': '木', '卯': '木', '辰': '土', '巳': '火',
-                  '午': '火', '未': '土', '申': '金', '酉': '金', '戌': '土', '亥': '水'}
-    ZHI_SHENGXIAO = {'子': '鼠', '丑': '牛', '寅': '虎', '卯': '兔', '辰': '龙', '巳': '蛇',
-                    '午': '马', '未': '羊', '申': '猴', '酉': '鸡', '戌': '狗', '亥': '猪'}
-    
-    ln_zhi_wx = ZHI_WUXING.get(ln_zhi, '')
-    ln_shengxiao = ZHI_SHENGXIAO.get(ln_zhi, '')
+    Raises:
+        ValueError: 命盘中没有该流年
+    """
+    return year_analysis_prompt(chart_data, target_year)["prompt"]
+
 
-    prompt = f"""
-    请根据以下八字命盘，详细分析【{target_year}年】的流年运势。
+async def generate_bazi_year_analysis(chart_data: Dict, target_year: int) -> Dict[str, Any]:
+    """
+    生成指定流年的命理分析
 
-    ⚠️ 重要：本年流年干支为【{year_info['gan_zhi']}】（{ln_shengxiao}年，{ln_zhi}{ln_zhi_wx}），请严格按照此信息分析，不要使用其他干支！
+    Returns:
+        同 complete, 另含 prompt_tokens (提示词预估 token 数)
 
-    【命主信息】
-    日主：{day_master} ({strong_weak})
-    格局：{pattern}
-    喜用神：{useful_gods} (喜: {', '.join(xi_shen)})
+    Raises:
+        ValueError: 命盘中没有该流年
+    """
+    prompt = year_analysis_prompt(chart_data, target_year)
+    result = await complete(prompt["prompt"])
+    return {**result, "prompt_tokens": prompt["estimated_tokens"]}
 
-    【当前大运】
-    {luck_cycle['gan_zhi']}大运 ({luck_cycle['start_year']}~{luck_cycle['end_year']})
 
-    【{target_year}年流年信息】
-    干支：{year_info['gan_zhi']}（{ln_gan}{ln_zhi}，{ln_shengxiao}年）
-    流年天干：{ln_gan}
-    流年地支：{ln_zhi}（{ln_zhi_wx}）
-    流年十神：{year_info['ten_god']}
-    流年神煞/事件：{', '.join(year_info.get('events', [])) if year_info.get('events') else '无特殊冲合'}
+def build_bazi_prompt(chart_data: Dict) -> str:
+    """八字解读完整提示词（含系统提示词）, 见 bazi_prompt.bazi_reading_prompt"""
+    return bazi_reading_prompt(chart_data)["prompt"]
 
-    【分析要求】
-    1. **吉凶判断**：结合{year_info['gan_zhi']}流年干支与命局的关系，综合判断运势得分(0-100)。
-    2. **重点领域**：分析事业、财运、感情、健康中哪一方面最受影响。
-    3. **关键事件**：根据流年十神（{year_info['ten_god']}）预测可能发生的事情。
-    4. **趋吉避凶**：给出具体的行动建议。
 
-    请保持语气专业、客观，使用正确的流年干支【{year_info['gan_zhi']}】进行分析。
+async def generate_bazi_ai_interpretation(chart_data: Dict) -> Dict[str, Any]:
     """
+    生成八字命盘的 AI 解读
 
-    try:
-        model = genai.GenerativeModel(model_name="gemma-3-1b-it")
-        full_prompt = INTERPRETATION_SYSTEM_PROMPT + "\n\n" + prompt
-        response = await model.generate_content_async(full_prompt)
-        
-        return {
-            "success": True,
-            "error": None,
-            "content": response.text
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "content": None
-        }
+    Returns:
+        同 complete, 另含 prompt_tokens (提示词预估 token 数)
+    """
+    prompt = bazi_reading_prompt(chart_data)
+    result = await complete(prompt["prompt"])
+    return {**result, "prompt_tokens": prompt["estimated_tokens"]}
 
 # Previous sync function...
 def generate_ai_interpretation_sync(
@@ -259,41 +297,16 @@ def generate_ai_interpretation_sync(
     yaos_data: list = None,
     interpretation_data: Dict = None
 ) -> Dict[str, Any]:
-    """同步版本的 AI 解卦"""
-    
-    if not init_gemini():
-        return {
-            "success": False,
-            "error": "Gemini API key not configured",
-            "content": None
-        }
-    
-    moving_positions = moving_positions or []
-    
-    prompt = _build_interpretation_prompt(
+    """
+    同步版本的 AI 解卦
+
+    不可在事件循环中调用 (会阻塞整个循环), 异步代码请用 generate_ai_interpretation
+    """
+    return asyncio.run(generate_ai_interpretation(
         question=question,
         hexagram_name=hexagram_name,
         changed_hexagram_name=changed_hexagram_name,
         moving_positions=moving_positions,
         yaos_data=yaos_data,
         interpretation_data=interpretation_data
-    )
-    
-    try:
-        model = genai.GenerativeModel(model_name="gemma-3-1b-it")
-        
-        full_prompt = INTERPRETATION_SYSTEM_PROMPT + "\n\n" + prompt
-        response = model.generate_content(full_prompt)
-        
-        return {
-            "success": True,
-            "error": None,
-            "content": response.text
-        }
-        
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "content": None
-        }
+    ))
@@ -0,0 +1,193 @@
+"""
+卦象编码
+Six-bit hexagram value type and precomputed 64-entry tables
+
+卦以 6 位整数表示: 第 i 位 (i=0..5) 为第 i+1 爻, 1 为阳、0 为阴, 初爻在最低位.
+- 下卦 = bits & 7, 上卦 = bits >> 3 (三位卦同样以最低位为初爻)
+- 变卦 = bits ^ 动爻掩码
+卦名、卦序、卦符、所属八宫等均为按 bits 下标的 64 项静态表.
+"""
+from typing import Dict, List, Optional, Tuple
+
+
+# 八卦, 下标为三位卦编码 (最低位为初爻)
+TRIGRAM_NAMES = ["坤", "震", "坎", "兑", "艮", "离", "巽", "乾"]
+TRIGRAM_SYMBOLS = ["☷", "☳", "☵", "☱", "☶", "☲", "☴", "☰"]
+TRIGRAM_NATURES = ["地", "雷", "水", "泽", "山", "火", "风", "天"]
+TRIGRAM_CODE = {name: i for i, name in enumerate(TRIGRAM_NAMES)}
+
+# 文王卦序
+KING_WEN_ORDER = [
+    "乾为天", "坤为地", "水雷屯", "山水蒙", "水天需", "天水讼", "地水师", "水地比",
+    "风天小畜", "天泽履", "地天泰", "天地否", "天火同人", "火天大有", "地山谦", "雷地豫",
+    "泽雷随", "山风蛊", "地泽临", "风地观", "火雷噬嗑", "山火贲", "山地剥", "地雷复",
+    "天雷无妄", "山天大畜", "山雷颐", "泽风大过", "坎为水", "离为火", "泽山咸", "雷风恒",
+    "天山遁", "雷天大壮", "火地晋", "地火明夷", "风火家人", "火泽睽", "水山蹇", "雷水解",
+    "山泽损", "风雷益", "泽天夬", "天风姤", "泽地萃", "地风升", "泽水困", "水风井",
+    "泽火革", "火风鼎", "震为雷", "艮为山", "风山渐", "雷泽归妹", "雷火丰", "火山旅",
+    "巽为风", "兑为泽", "风水涣", "水泽节", "风泽中孚", "雷山小过", "水火既济", "火水未济"
+]
+
+# 八宫世代: 本宫、一世至五世、游魂、归魂
+GENERATION_NAMES = ["本宫", "一世", "二世", "三世", "四世", "五世", "游魂", "归魂"]
+
+_NATURE_CODE = {nature: i for i, nature in enumerate(TRIGRAM_NATURES)}
+
+
+def _bits_of_name(full_name: str) -> int:
+    """由卦名取上下卦: "乾为天" 为八纯卦, 其余前两字为上、下卦之象"""
+    if full_name[1] == "为":
+        upper = lower = TRIGRAM_CODE[full_name[0]]
+    else:
+        upper, lower = _NATURE_CODE[full_name[0]], _NATURE_CODE[full_name[1]]
+    return upper << 3 | lower
+
+
+def _palace_table() -> Tuple[List[int], List[int]]:
+    """八宫卦变: 自本宫起依次变初爻至五爻, 再复四爻为游魂, 复下卦为归魂"""
+    palace, generation = [0] * 64, [0] * 64
+    for trigram in range(8):
+        bits = trigram << 3 | trigram
+        sequence = [bits]
+        for line in range(5):
+            bits ^= 1 << line
+            sequence.append(bits)
+        bits ^= 1 << 3
+        sequence.append(bits)
+        bits = (bits & 0b111000) | trigram
+        sequence.append(bits)
+        for g, b in enumerate(sequence):
+            palace[b], generation[b] = trigram, g
+    return palace, generation
+
+
+NAMES: List[str] = [""] * 64          # 卦名 (如 "水雷屯")
+SHORT_NAMES: List[str] = [""] * 64    # 简称 (如 "屯")
+NUMBERS: List[int] = [0] * 64         # 文王卦序 1-64
+SYMBOLS: List[str] = [""] * 64        # 卦符 (U+4DC0 起)
+for _number, _name in enumerate(KING_WEN_ORDER, start=1):
+    _bits = _bits_of_name(_name)
+    NAMES[_bits] = _name
+    SHORT_NAMES[_bits] = _name[0] if _name[1] == "为" else _name[2:]
+    NUMBERS[_bits] = _number
+    SYMBOLS[_bits] = chr(0x4DC0 + _number - 1)
+
+PALACES, GENERATIONS = _palace_table()   # 所属八宫 (三位卦编码)、世代
+
+# 卦名 (全称、简称) -> bits
+NAME_TO_BITS: Dict[str, int] = {}
+for _bits in range(64):
+    NAME_TO_BITS[NAMES[_bits]] = _bits
+    NAME_TO_BITS[SHORT_NAMES[_bits]] = _bits
+
+
+class Hexagram:
+    """
+    六爻卦 (不可变值类型)
+
+    64 个实例在导入时创建, 通过 Hexagram.of / from_lines / from_name 取得, 不再另行分配
+    """
+    __slots__ = ("_bits",)
+
+    def __init__(self, bits: int):
+        object.__setattr__(self, "_bits", bits & 0x3F)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Hexagram is immutable")
+
+    @staticmethod
+    def of(bits: int) -> "Hexagram":
+        return ALL_HEXAGRAMS[bits & 0x3F]
+
+    @staticmethod
+    def from_lines(lines: List[int]) -> "Hexagram":
+        """由六爻阴阳 (初爻在前, 1阳0阴) 取卦"""
+        bits = 0
+        for i, value in enumerate(lines):
+            bits |= (value & 1) << i
+        return ALL_HEXAGRAMS[bits]
+
+    @staticmethod
+    def from_trigrams(upper: int, lower: int) -> "Hexagram":
+        return ALL_HEXAGRAMS[(upper & 7) << 3 | (lower & 7)]
+
+    @staticmethod
+    def from_name(name: str) -> Optional["Hexagram"]:
+        """由卦名 (全称或简称) 取卦, 未知卦名返回 None"""
+        bits = NAME_TO_BITS.get(name)
+        return None if bits is None else ALL_HEXAGRAMS[bits]
+
+    @property
+    def bits(self) -> int:
+        return self._bits
+
+    @property
+    def lower(self) -> int:
+        return self._bits & 7
+
+    @property
+    def upper(self) -> int:
+        return self._bits >> 3
+
+    @property
+    def name(self) -> str:
+        return NAMES[self._bits]
+
+    @property
+    def short_name(self) -> str:
+        return SHORT_NAMES[self._bits]
+
+    @property
+    def number(self) -> int:
+        return NUMBERS[self._bits]
+
+    @property
+    def symbol(self) -> str:
+        return SYMBOLS[self._bits]
+
+    @property
+    def palace(self) -> int:
+        return PALACES[self._bits]
+
+    @property
+    def generation(self) -> int:
+        return GENERATIONS[self._bits]
+
+    @property
+    def lines(self) -> List[int]:
+        """六爻阴阳, 初爻在前"""
+        return [self._bits >> i & 1 for i in range(6)]
+
+    def line(self, position: int) -> int:
+        """第 position 爻 (1-6) 的阴阳"""
+        return self._bits >> (position - 1) & 1
+
+    def change(self, mask: int) -> "Hexagram":
+        """按动爻掩码 (第 i 位为第 i+1 爻) 取变卦"""
+        return ALL_HEXAGRAMS[self._bits ^ (mask & 0x3F)]
+
+    def __int__(self) -> int:
+        return self._bits
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Hexagram) and other._bits == self._bits
+
+    def __hash__(self) -> int:
+        return self._bits
+
+    def __reduce__(self):
+        return Hexagram.of, (self._bits,)
+
+    def __repr__(self) -> str:
+        return f"Hexagram({self._bits:06b} {self.name})"
+
+
+ALL_HEXAGRAMS: Tuple[Hexagram, ...] = tuple(Hexagram(bits) for bits in range(64))
+
+
+def moving_mask(positions: List[int]) -> int:
+    """动爻位置 (1-6) -> 掩码"""
+    mask = 0
+    for position in positions:
+        mask |= 1 << (position - 1)
+    return mask
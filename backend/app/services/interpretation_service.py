@@ -4,42 +4,74 @@ Hexagram Interpretation Service
 """
 import json
 import os
-from typing import Dict, Any, List, Optional
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from .hexagram import Hexagram, NAME_TO_BITS, NAMES
+from .text_store import (
+    HexagramTextStore, MappedTextStore, EMPTY_STORE, CORPUS_FILE, SOURCE_FILES,
+    compile_corpus, sources_newer
+)
+
+# 数据文件轮询间隔 (秒), 0 为不监视
+WATCH_INTERVAL = float(os.getenv("HEXAGRAM_WATCH_INTERVAL", "0"))
+
+# 启动及热更新时预先生成全部 64×64 种解读片段
+PRECOMPUTE_INTERPRETATIONS = os.getenv("INTERPRETATION_PRECOMPUTE", "0") == "1"
+
+# 卦爻辞索引 (整体替换, 不原地修改)
+TEXT_STORE = EMPTY_STORE
+
+
+def _open_store():
+    """优先映射编译文件, 源数据较新时先重新编译, 缺失、格式不符或无法编译时解析 JSON 源数据"""
+    try:
+        if sources_newer():
+            print(f"Warning: Hexagram source data newer than compiled corpus, recompiling {CORPUS_FILE}")
+            compile_corpus()
+        return MappedTextStore.open()
+    except (OSError, ValueError) as e:
+        print(f"Warning: Compiled hexagram corpus unavailable ({CORPUS_FILE}): {e}")
+    return HexagramTextStore.from_files()
 
-# 加载卦辞数据
-DATA_DIR = os.path.dirname(__file__).replace('/services', '/data')
-HEXAGRAM_DATA: Dict = {}
 
 def load_hexagram_data():
-    """加载64卦爻辞数据"""
-    global HEXAGRAM_DATA
-    data_file = os.path.join(DATA_DIR, 'hexagram_texts.json')
+    """加载64卦爻辞数据, 失败时保留现有数据"""
+    global TEXT_STORE
     try:
-        with open(data_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            HEXAGRAM_DATA = data.get('hexagrams', {})
-    except FileNotFoundError:
-        print(f"Warning: Hexagram data file not found: {data_file}")
-        HEXAGRAM_DATA = {}
+        store = _open_store()
+    except FileNotFoundError as e:
+        print(f"Warning: Hexagram data file not found: {e.filename}")
+        return
     except json.JSONDecodeError as e:
         print(f"Error parsing hexagram data: {e}")
-        HEXAGRAM_DATA = {}
+        return
+    except ValueError as e:
+        print(f"Error validating hexagram data: {e}")
+        return
+    # 单次引用赋值, 进行中的请求继续使用旧索引
+    TEXT_STORE = store
 
 # 初始化加载
 load_hexagram_data()
 
 
+def data_version() -> int:
+    """当前卦辞数据版本, 可用作 ETag"""
+    return TEXT_STORE.version
+
+
 def get_hexagram_text(hexagram_name: str) -> Optional[Dict]:
     """
     获取指定卦的完整文本数据
     
     Args:
-        hexagram_name: 卦名，如 "乾为天"、"水雷屯"
+        hexagram_name: 卦名，如 "乾为天"、"水雷屯"（也可用简称 "乾"、"屯"）
         
     Returns:
-        卦辞数据字典，包含卦辞、爻辞等
+        卦辞数据字典，包含卦辞、爻辞等（共享对象，勿修改）
     """
-    return HEXAGRAM_DATA.get(hexagram_name)
+    return TEXT_STORE.by_name(hexagram_name)
 
 
 def get_yao_text(hexagram_name: str, position: int) -> Optional[Dict]:
@@ -53,22 +85,16 @@ def get_yao_text(hexagram_name: str, position: int) -> Optional[Dict]:
     Returns:
         爻辞数据
     """
-    hexagram = HEXAGRAM_DATA.get(hexagram_name)
-    if not hexagram:
-        return None
-    
-    yao_ci = hexagram.get('yaoCi', [])
-    for yao in yao_ci:
-        if yao.get('position') == position:
-            return yao
-    return None
+    bits = NAME_TO_BITS.get(hexagram_name)
+    return None if bits is None else TEXT_STORE.yao(bits, position)
 
 
 def generate_interpretation(
     hexagram_name: str,
     changed_hexagram_name: Optional[str] = None,
     moving_positions: List[int] = None,
-    question: str = ""
+    question: str = "",
+    store=None
 ) -> Dict[str, Any]:
     """
     生成卦象解读
@@ -77,12 +103,17 @@ def generate_interpretation(
         hexagram_name: 本卦名称
         changed_hexagram_name: 变卦名称（如有动爻）
         moving_positions: 动爻位置列表
-        question: 所问之事
+        question: 所问之事（目前不参与解读）
+        store: 卦辞索引，默认取当前索引（同一次解读只读一个版本）
         
     Returns:
         解读数据，包含卦辞、爻辞解读
     """
+    if store is None:
+        store = TEXT_STORE
     moving_positions = moving_positions or []
+    hexagram = Hexagram.from_name(hexagram_name)
+    changed = Hexagram.from_name(changed_hexagram_name) if changed_hexagram_name else None
     
     result = {
         "original_hexagram": None,
@@ -93,39 +124,42 @@ def generate_interpretation(
     }
     
     # 获取本卦数据
-    original = get_hexagram_text(hexagram_name)
+    original = store.by_name(hexagram_name)
     if original:
         result["original_hexagram"] = {
             "name": hexagram_name,
-            "symbol": original.get("symbol", ""),
+            "symbol": original.get("symbol") or (hexagram.symbol if hexagram else ""),
             "keywords": original.get("keywords", []),
             "guaCi": original.get("guaCi", ""),
             "guaCiExplain": original.get("guaCiExplain", ""),
             "xiangCi": original.get("xiangCi", "")
         }
     
-    # 获取变卦数据
-    if changed_hexagram_name and changed_hexagram_name != hexagram_name:
-        changed = get_hexagram_text(changed_hexagram_name)
-        if changed:
+    # 获取变卦数据 (同一卦的全称、简称视为同卦)
+    is_changed = changed_hexagram_name and changed_hexagram_name != hexagram_name and (
+        changed is None or changed != hexagram
+    )
+    if is_changed:
+        changed_text = store.by_name(changed_hexagram_name)
+        if changed_text:
             result["changed_hexagram"] = {
                 "name": changed_hexagram_name,
-                "symbol": changed.get("symbol", ""),
-                "keywords": changed.get("keywords", []),
-                "guaCi": changed.get("guaCi", ""),
-                "guaCiExplain": changed.get("guaCiExplain", "")
+                "symbol": changed_text.get("symbol") or (changed.symbol if changed else ""),
+                "keywords": changed_text.get("keywords", []),
+                "guaCi": changed_text.get("guaCi", ""),
+                "guaCiExplain": changed_text.get("guaCiExplain", "")
             }
     
     # 获取动爻爻辞
     for pos in moving_positions:
-        yao = get_yao_text(hexagram_name, pos)
+        yao = store.yao(hexagram.bits, pos) if hexagram else None
         if yao:
             result["moving_yaos"].append(yao)
     
     # 生成解读摘要
     result["interpretation_summary"] = _generate_summary(
         hexagram_name, 
-        changed_hexagram_name, 
+        changed_hexagram_name if is_changed else None, 
         moving_positions,
         original
     )
@@ -188,7 +222,140 @@ def _generate_advice(hexagram_data: Optional[Dict], moving_positions: List[int])
     return "行事宜谨慎，顺应天时。"
 
 
-def reload_hexagram_data():
-    """重新加载卦辞数据（用于热更新）"""
-    load_hexagram_data()
-    return len(HEXAGRAM_DATA)
+# ========== 解读片段 ==========
+# 起卦所得解读只取决于 (本卦, 动爻掩码), 共 64×64 种; 按卦辞索引各存一份
+# 序列化后的 JSON (bytes, 不可变), 由路由直接拼入响应, 免去重复生成与序列化.
+
+_FRAGMENTS: Tuple[Any, List[Optional[bytes]]] = (None, [])
+
+
+def _encode_fragment(bits: int, mask: int, store) -> bytes:
+    interpretation = generate_interpretation(
+        NAMES[bits],
+        NAMES[bits ^ mask] if mask else None,
+        [i + 1 for i in range(6) if mask >> i & 1],
+        store=store
+    )
+    return json.dumps(interpretation, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _fragment_table(store) -> List[Optional[bytes]]:
+    """卦辞索引对应的片段表; 只为当前索引保留, 替换前后仍在用旧索引的请求不覆盖新表"""
+    global _FRAGMENTS
+    owner, table = _FRAGMENTS
+    if owner is store:
+        return table
+    table = [None] * 4096
+    if store is TEXT_STORE:
+        _FRAGMENTS = (store, table)
+    return table
+
+
+def _fill_fragments(table: List[Optional[bytes]], store) -> int:
+    count = 0
+    for key in range(4096):
+        if table[key] is None:
+            table[key] = _encode_fragment(key >> 6, key & 0x3F, store)
+            count += 1
+    return count
+
+
+def interpretation_fragment(bits: int, mask: int, store=None) -> bytes:
+    """
+    起卦解读的 JSON 片段, 等同于 generate_interpretation(本卦全称, 变卦全称, 升序动爻) 序列化结果
+
+    Args:
+        bits: 本卦 (Hexagram.bits)
+        mask: 动爻掩码 (第 i 位为第 i+1 爻)
+    """
+    if store is None:
+        store = TEXT_STORE
+    table = _fragment_table(store)
+    key = (bits & 0x3F) << 6 | (mask & 0x3F)
+    fragment = table[key]
+    if fragment is None:
+        # 并发首次生成只会得到相同字节串, 无需加锁
+        fragment = table[key] = _encode_fragment(bits & 0x3F, mask & 0x3F, store)
+    return fragment
+
+
+def precompute_interpretations() -> int:
+    """为当前卦辞索引生成全部 4096 种解读片段, 返回新生成数"""
+    store = TEXT_STORE
+    return _fill_fragments(_fragment_table(store), store)
+
+
+# ========== 热更新 ==========
+
+_RELOAD_LOCK = threading.Lock()
+_watch_stop = threading.Event()
+_watcher: Optional[threading.Thread] = None
+
+
+def reload_hexagram_data() -> Dict[str, Any]:
+    """
+    重新加载卦辞数据（用于热更新）
+
+    JSON 源数据比编译文件新时先重新编译 (含校验), 再映射新文件并以单次引用赋值替换;
+    进行中的请求继续使用旧索引. 失败时抛出异常, 现有数据不变.
+
+    Returns:
+        {"version": 数据版本, "hexagrams": 卦数, "changed": 是否替换}
+    """
+    global TEXT_STORE, _FRAGMENTS
+    with _RELOAD_LOCK:
+        if sources_newer():
+            compile_corpus()
+        store = MappedTextStore.open()
+        changed = not isinstance(TEXT_STORE, MappedTextStore) or store.version != TEXT_STORE.version
+        if changed:
+            table = [None] * 4096
+            if PRECOMPUTE_INTERPRETATIONS:
+                _fill_fragments(table, store)
+            TEXT_STORE = store
+            _FRAGMENTS = (store, table)
+        return {"version": TEXT_STORE.version, "hexagrams": len(TEXT_STORE), "changed": changed}
+
+
+def _file_stamp():
+    stamps = []
+    for path in (*SOURCE_FILES, CORPUS_FILE):
+        try:
+            stamps.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+def _watch(interval: float):
+    stamp = _file_stamp()
+    while not _watch_stop.wait(interval):
+        if _file_stamp() == stamp:
+            continue
+        try:
+            result = reload_hexagram_data()
+            if result["changed"]:
+                print(f"Hexagram data reloaded: version {result['version']}")
+        except Exception as e:
+            print(f"Error reloading hexagram data: {e}")
+        # 编辑器保存中途的半截文件校验失败, 下次修改后再试
+        stamp = _file_stamp()
+
+
+def start_watcher(interval: float = WATCH_INTERVAL) -> bool:
+    """启动后台线程轮询数据文件, 有修改即热更新; interval 为 0 时不启动"""
+    global _watcher
+    if interval <= 0 or (_watcher is not None and _watcher.is_alive()):
+        return False
+    _watch_stop.clear()
+    _watcher = threading.Thread(target=_watch, args=(interval,), name="hexagram-watcher", daemon=True)
+    _watcher.start()
+    return True
+
+
+def stop_watcher():
+    global _watcher
+    _watch_stop.set()
+    if _watcher is not None:
+        _watcher.join(timeout=5)
+        _watcher = None
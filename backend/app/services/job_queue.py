@@ -0,0 +1,481 @@
+"""
+AI 后台任务
+Background job queue for slow AI calls: priorities, bounded workers, polling and push
+
+提交即返回任务号, 模型调用在后台完成, HTTP 请求不再等待模型:
+- 优先级: 0-9, 数值小者先执行, 同级先到先得
+- 排队上限 JOB_MAX_PENDING, 超出时提交失败 (QueueFull)
+- 结果保留 JOB_RESULT_TTL 秒 (最多 JOB_MAX_RESULTS 条), 过期即不可查
+- 取结果: 轮询 get, 或以 watch 订阅状态变化 (供 SSE 推送)
+
+两种运行方式 (JOB_BACKEND):
+- local: 同进程内 JOB_WORKERS 个协程执行任务 (默认)
+- sqlite: 任务写入本地 SQLite 队列 (JOB_QUEUE_PATH), 由独立的工作进程执行:
+  python -m app.services.job_queue
+  Web 进程只负责入队与查询, 慢速模型调用与排盘接口互不影响; 可同时运行多个工作进程
+
+任务内容为已生成的提示词 (排盘与提示词在提交时完成, 出错即时返回), 执行时调用 gemini_service.complete.
+"""
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .cache import LRUTTLCache
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+JOB_BACKEND = os.getenv("JOB_BACKEND", "local")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "1000"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_MAX_RESULTS = int(os.getenv("JOB_MAX_RESULTS", "10000"))
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(DATA_DIR, "jobs.sqlite3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.25"))
+# 执行中超过此秒数的任务视为工作进程已中断, 重新排队 (应大于 LLM_TIMEOUT)
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "300"))
+
+DEFAULT_PRIORITY = 5
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class QueueFull(RuntimeError):
+    """排队任务已达上限"""
+
+
+# ========== 任务类型 ==========
+
+async def _completion_job(params: Dict[str, Any]) -> Dict[str, Any]:
+    """以提示词调用模型, params: {"prompt", "meta": 附加到结果的字段}"""
+    from .gemini_service import complete
+    result = await complete(params["prompt"])
+    if not result["success"]:
+        raise RuntimeError(result["error"])
+    return {"content": result["content"], "cached": result.get("cached", False), **params.get("meta", {})}
+
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = {
+    "liuyao_interpret": _completion_job,
+    "bazi_reading": _completion_job,
+    "bazi_year": _completion_job,
+}
+
+
+async def run_handler(kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    return await JOB_HANDLERS[kind](params)
+
+
+def _timestamp(t: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(t).isoformat(timespec="milliseconds") if t else None
+
+
+def _job_dict(job_id: str, kind: str, priority: int, status: str, created: float,
+              started: Optional[float], finished: Optional[float],
+              result: Optional[Dict[str, Any]], error: Optional[str]) -> Dict[str, Any]:
+    return {
+        "id": job_id,
+        "kind": kind,
+        "priority": priority,
+        "status": status,
+        "created_at": _timestamp(created),
+        "started_at": _timestamp(started),
+        "finished_at": _timestamp(finished),
+        "result": result,
+        "error": error
+    }
+
+
+# ========== 同进程队列 ==========
+
+class _Job:
+    __slots__ = ("id", "kind", "params", "priority", "status", "created", "started", "finished",
+                 "result", "error", "changed")
+
+    def __init__(self, kind: str, params: Dict[str, Any], priority: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.priority = priority
+        self.status = QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.changed = asyncio.Event()
+
+    def set_status(self, status: str):
+        self.status = status
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return _job_dict(self.id, self.kind, self.priority, self.status, self.created,
+                         self.started, self.finished, self.result, self.error)
+
+
+class LocalJobQueue:
+    """
+    同进程任务队列 (仅在事件循环线程中使用)
+
+    排队与执行中的任务保存在内存, 结束后移入 LRUTTLCache (带 TTL 与条数上限)
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING,
+                 result_ttl: float = JOB_RESULT_TTL, max_results: int = JOB_MAX_RESULTS):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self._active: Dict[str, _Job] = {}
+        self._results = LRUTTLCache(maxsize=max_results, ttl=result_ttl)
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks = []
+        self._seq = itertools.count()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """启动工作协程 (需在事件循环中调用, 重复调用无效)"""
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def _pending(self) -> int:
+        return sum(1 for job in self._active.values() if job.status == QUEUED)
+
+    async def submit(self, kind: str, params: Dict[str, Any], priority: int = DEFAULT_PRIORITY) -> Dict[str, Any]:
+        """
+        提交任务
+
+        Raises:
+            QueueFull: 排队任务已达上限
+        """
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"未知任务类型: {kind}")
+        self.start()
+        if self._pending() >= self.max_pending:
+            self.rejected += 1
+            raise QueueFull(f"排队任务已达上限 {self.max_pending}")
+        job = _Job(kind, params, priority)
+        self._active[job.id] = job
+        self._queue.put_nowait((priority, next(self._seq), job.id))
+        self.submitted += 1
+        return job.to_dict()
+
+    def _find(self, job_id: str) -> Optional[_Job]:
+        job = self._active.get(job_id)
+        return job if job is not None else self._results.get(job_id)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._find(job_id)
+        return job.to_dict() if job is not None else None
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """取消排队中的任务; 已开始或已结束的任务不受影响, 返回其当前状态"""
+        job = self._find(job_id)
+        if job is None:
+            return None
+        if job.status == QUEUED:
+            self._finish(job, CANCELLED)
+        return job.to_dict()
+
+    async def watch(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """先产出当前状态, 之后每次状态变化产出一次, 结束状态后停止"""
+        job = self._find(job_id)
+        if job is None:
+            return
+        while True:
+            changed = job.changed
+            yield job.to_dict()
+            if job.status in FINISHED:
+                return
+            await changed.wait()
+
+    def _finish(self, job: _Job, status: str):
+        job.finished = time.time()
+        job.params = None
+        self._active.pop(job.id, None)
+        self._results.set(job.id, job)
+        job.set_status(status)
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._active.get(job_id)
+            if job is None or job.status != QUEUED:
+                continue
+            job.started = time.time()
+            job.set_status(RUNNING)
+            try:
+                job.result = await run_handler(job.kind, job.params)
+            except asyncio.CancelledError:
+                job.error = "服务停止，任务中断"
+                self._finish(job, FAILED)
+                raise
+            except Exception as e:
+                job.error = str(e)
+                self.failed += 1
+                self._finish(job, FAILED)
+            else:
+                self.completed += 1
+                self._finish(job, DONE)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "local",
+            "workers": self.workers,
+            "queued": self._pending(),
+            "running": sum(1 for job in self._active.values() if job.status == RUNNING),
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "results": self._results.stats()
+        }
+
+
+# ========== SQLite 队列 (独立工作进程) ==========
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority, created);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished);
+"""
+
+
+class SQLiteJobQueue:
+    """
+    SQLite 任务队列, Web 进程入队与查询, 工作进程 (run_worker) 认领与执行
+
+    多个进程可同时打开同一文件 (WAL); 认领在 BEGIN IMMEDIATE 事务中完成, 同一任务只会被一个工作进程取得
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, max_pending: int = JOB_MAX_PENDING,
+                 result_ttl: float = JOB_RESULT_TTL, poll_interval: float = JOB_POLL_INTERVAL):
+        self.path = path
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row_dict(row) -> Dict[str, Any]:
+        job_id, kind, priority, status, created, started, finished, result, error = row
+        return _job_dict(job_id, kind, priority, status, created, started, finished,
+                         json.loads(result) if result else None, error)
+
+    _COLUMNS = "id, kind, priority, status, created, started, finished, result, error"
+
+    # ----- Web 进程 -----
+
+    def submit_sync(self, kind: str, params: Dict[str, Any], priority: int = DEFAULT_PRIORITY) -> Dict[str, Any]:
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"未知任务类型: {kind}")
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+                if pending >= self.max_pending:
+                    raise QueueFull(f"排队任务已达上限 {self.max_pending}")
+                job_id, now = uuid.uuid4().hex, time.time()
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, params, priority, status, created) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, json.dumps(params, ensure_ascii=False), priority, QUEUED, now)
+                )
+                # 顺带清除过期结果
+                conn.execute("DELETE FROM jobs WHERE finished < ?", (now - self.result_ttl,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return _job_dict(job_id, kind, priority, QUEUED, now, None, None, None, None)
+
+    def get_sync(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = self._row_dict(row)
+        finished = row[6]
+        return None if finished and finished < time.time() - self.result_ttl else job
+
+    def cancel_sync(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._connect().execute(
+                "UPDATE jobs SET status = ?, finished = ?, params = NULL WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED)
+            )
+        return self.get_sync(job_id)
+
+    async def submit(self, kind: str, params: Dict[str, Any], priority: int = DEFAULT_PRIORITY) -> Dict[str, Any]:
+        return await run_in_threadpool(self.submit_sync, kind, params, priority)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await run_in_threadpool(self.get_sync, job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await run_in_threadpool(self.cancel_sync, job_id)
+
+    async def watch(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """轮询任务状态, 状态变化时产出, 结束状态后停止"""
+        last = None
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            if job["status"] != last:
+                last = job["status"]
+                yield job
+            if last in FINISHED:
+                return
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        """Web 进程不执行任务, 由工作进程执行"""
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "max_pending": self.max_pending,
+            "result_ttl": self.result_ttl,
+            **{status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+        }
+
+    # ----- 工作进程 -----
+
+    def claim(self):
+        """认领优先级最高的排队任务, 返回 (id, kind, params) 或 None"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, kind, params FROM jobs WHERE status = ? ORDER BY priority, created LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ?", (RUNNING, time.time(), row[0]))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return (row[0], row[1], json.loads(row[2])) if row else None
+
+    def complete(self, job_id: str, result: Optional[Dict[str, Any]], error: Optional[str]):
+        with self._lock:
+            self._connect().execute(
+                "UPDATE jobs SET status = ?, finished = ?, result = ?, error = ?, params = NULL WHERE id = ?",
+                (FAILED if error is not None else DONE, time.time(),
+                 json.dumps(result, ensure_ascii=False) if result is not None else None, error, job_id)
+            )
+
+    def requeue_stale(self, stale_after: float = JOB_STALE_AFTER) -> int:
+        """执行中超过 stale_after 秒的任务 (工作进程已中断) 重新排队, 返回条数"""
+        with self._lock:
+            return self._connect().execute(
+                "UPDATE jobs SET status = ?, started = NULL WHERE status = ? AND started < ?",
+                (QUEUED, RUNNING, time.time() - stale_after)
+            ).rowcount
+
+
+async def run_worker(queue: SQLiteJobQueue, workers: int = JOB_WORKERS):
+    """工作进程主循环: workers 个协程轮流认领并执行任务"""
+    from . import llm_client
+    llm_client.configure()
+    last_check = 0.0
+
+    async def loop():
+        nonlocal last_check
+        while True:
+            claimed = await run_in_threadpool(queue.claim)
+            if claimed is None:
+                # 空闲时每分钟检查一次中断的任务
+                if time.monotonic() - last_check > 60:
+                    last_check = time.monotonic()
+                    await run_in_threadpool(queue.requeue_stale)
+                await asyncio.sleep(queue.poll_interval)
+                continue
+            job_id, kind, params = claimed
+            try:
+                result, error = await run_handler(kind, params), None
+            except Exception as e:
+                result, error = None, str(e)
+            await run_in_threadpool(queue.complete, job_id, result, error)
+
+    await asyncio.gather(*(loop() for _ in range(max(1, workers))))
+
+
+# ========== 全局队列 ==========
+
+def _create_queue():
+    if JOB_BACKEND == "sqlite":
+        return SQLiteJobQueue()
+    if JOB_BACKEND != "local":
+        raise ValueError(f"未知 JOB_BACKEND: {JOB_BACKEND}")
+    return LocalJobQueue()
+
+
+JOB_QUEUE = _create_queue()
+
+
+if __name__ == "__main__":
+    queue = SQLiteJobQueue()
+    print(f"任务工作进程启动: {queue.path}, 并发 {JOB_WORKERS}")
+    try:
+        asyncio.run(run_worker(queue))
+    except KeyboardInterrupt:
+        pass
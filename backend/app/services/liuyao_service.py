@@ -2,55 +2,36 @@
 六爻排盘服务
 Liuyao (Six Lines) Divination Service
 """
-from typing import Dict, Any, List, Tuple
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+import os
 import random
 
+import numpy as np
 
-# 八卦基本信息
+from .hexagram import Hexagram, ALL_HEXAGRAMS, TRIGRAM_NAMES, NAMES, NUMBERS
+from .najia_engine import (
+    SIX_BEASTS, SIX_RELATIVES, WORLD, RESPONSE, palace_info, line_details, day_info
+)
+
+
+# 八卦基本信息 (lines 自初爻起)
 BAGUA = {
     "乾": {"symbol": "☰", "nature": "天", "direction": "西北", "element": "金", "lines": [1, 1, 1]},
-    "兑": {"symbol": "☱", "nature": "泽", "direction": "西", "element": "金", "lines": [0, 1, 1]},
+    "兑": {"symbol": "☱", "nature": "泽", "direction": "西", "element": "金", "lines": [1, 1, 0]},
     "离": {"symbol": "☲", "nature": "火", "direction": "南", "element": "火", "lines": [1, 0, 1]},
-    "震": {"symbol": "☳", "nature": "雷", "direction": "东", "element": "木", "lines": [0, 0, 1]},
-    "巽": {"symbol": "☴", "nature": "风", "direction": "东南", "element": "木", "lines": [1, 1, 0]},
+    "震": {"symbol": "☳", "nature": "雷", "direction": "东", "element": "木", "lines": [1, 0, 0]},
+    "巽": {"symbol": "☴", "nature": "风", "direction": "东南", "element": "木", "lines": [0, 1, 1]},
     "坎": {"symbol": "☵", "nature": "水", "direction": "北", "element": "水", "lines": [0, 1, 0]},
-    "艮": {"symbol": "☶", "nature": "山", "direction": "东北", "element": "土", "lines": [1, 0, 0]},
+    "艮": {"symbol": "☶", "nature": "山", "direction": "东北", "element": "土", "lines": [0, 0, 1]},
     "坤": {"symbol": "☷", "nature": "地", "direction": "西南", "element": "土", "lines": [0, 0, 0]},
 }
 
 # 64卦名称索引 (上卦, 下卦) -> 卦名
 HEXAGRAMS = {
-    ("乾", "乾"): "乾为天", ("坤", "乾"): "地天泰", ("坎", "乾"): "水天需", ("离", "乾"): "火天大有",
-    ("震", "乾"): "雷天大壮", ("巽", "乾"): "风天小畜", ("艮", "乾"): "山天大畜", ("兑", "乾"): "泽天夬",
-    ("乾", "坤"): "天地否", ("坤", "坤"): "坤为地", ("坎", "坤"): "水地比", ("离", "坤"): "火地晋",
-    ("震", "坤"): "雷地豫", ("巽", "坤"): "风地观", ("艮", "坤"): "山地剥", ("兑", "坤"): "泽地萃",
-    ("乾", "坎"): "天水讼", ("坤", "坎"): "地水师", ("坎", "坎"): "坎为水", ("离", "坎"): "火水未济",
-    ("震", "坎"): "雷水解", ("巽", "坎"): "风水涣", ("艮", "坎"): "山水蒙", ("兑", "坎"): "泽水困",
-    ("乾", "离"): "天火同人", ("坤", "离"): "地火明夷", ("坎", "离"): "水火既济", ("离", "离"): "离为火",
-    ("震", "离"): "雷火丰", ("巽", "离"): "风火家人", ("艮", "离"): "山火贲", ("兑", "离"): "泽火革",
-    ("乾", "震"): "天雷无妄", ("坤", "震"): "地雷复", ("坎", "震"): "水雷屯", ("离", "震"): "火雷噬嗑",
-    ("震", "震"): "震为雷", ("巽", "震"): "风雷益", ("艮", "震"): "山雷颐", ("兑", "震"): "泽雷随",
-    ("乾", "巽"): "天风姤", ("坤", "巽"): "地风升", ("坎", "巽"): "水风井", ("离", "巽"): "火风鼎",
-    ("震", "巽"): "雷风恒", ("巽", "巽"): "巽为风", ("艮", "巽"): "山风蛊", ("兑", "巽"): "泽风大过",
-    ("乾", "艮"): "天山遁", ("坤", "艮"): "地山谦", ("坎", "艮"): "水山蹇", ("离", "艮"): "火山旅",
-    ("震", "艮"): "雷山小过", ("巽", "艮"): "风山渐", ("艮", "艮"): "艮为山", ("兑", "艮"): "泽山咸",
-    ("乾", "兑"): "天泽履", ("坤", "兑"): "地泽临", ("坎", "兑"): "水泽节", ("离", "兑"): "火泽睽",
-    ("震", "兑"): "雷泽归妹", ("巽", "兑"): "风泽中孚", ("艮", "兑"): "山泽损", ("兑", "兑"): "兑为泽",
-}
-
-# 六兽
-SIX_BEASTS = ["青龙", "朱雀", "勾陈", "螣蛇", "白虎", "玄武"]
-
-# 六亲 (以日干为主)
-SIX_RELATIVES = {
-    "生我": "父母",
-    "我生": "子孙", 
-    "克我": "官鬼",
-    "我克": "妻财",
-    "同我": "兄弟"
+    (TRIGRAM_NAMES[h.upper], TRIGRAM_NAMES[h.lower]): h.name for h in ALL_HEXAGRAMS
 }
 
-
 def simulate_coin_toss() -> int:
     """
     模拟抛三枚铜钱
@@ -82,12 +63,11 @@ def coin_result_to_yao(value: int) -> Dict[str, Any]:
 
 def lines_to_trigram(lines: List[int]) -> str:
     """
-    根据三个爻值找到对应的卦名
+    根据三个爻值（初爻在前）找到对应的卦名
     """
-    for name, info in BAGUA.items():
-        if info["lines"] == lines:
-            return name
-    return "乾"
+    if len(lines) != 3 or any(v not in (0, 1) for v in lines):
+        return "乾"
+    return TRIGRAM_NAMES[lines[0] | lines[1] << 1 | lines[2] << 2]
 
 
 def get_hexagram_name(upper: str, lower: str) -> str:
@@ -101,26 +81,18 @@ def calculate_world_response(hexagram_lines: List[int]) -> Tuple[int, int]:
     """
     安世应
     
-    根据卦的结构确定世爻和应爻的位置
-    简化算法: 根据上下卦的关系计算
+    按八宫卦序: 本宫世在六爻, 一世至五世依次在初爻至五爻,
+    游魂世在四爻, 归魂世在三爻; 应爻与世爻相隔三位
     """
-    # 简化处理: 世爻在初爻到六爻之间,应爻与世爻相隔三位
-    lower = hexagram_lines[:3]
-    upper = hexagram_lines[3:]
-    
-    # 计算变化位置
-    diff_count = sum(1 for i in range(3) if lower[i] != upper[i])
-    
-    world_positions = {0: 6, 1: 1, 2: 2, 3: 3}
-    world = world_positions.get(diff_count, 4)
-    response = (world + 2) % 6 + 1 if world <= 3 else (world - 2) if world > 3 else 4
-    
-    return world, response
+    bits = Hexagram.from_lines(hexagram_lines).bits
+    return WORLD[bits], RESPONSE[bits]
 
 
 def generate_liuyao_chart(
     coin_results: List[int] = None,
-    question: str = ""
+    question: str = "",
+    cast_time: Optional[datetime] = None,
+    seed: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     生成六爻卦象
@@ -128,23 +100,53 @@ def generate_liuyao_chart(
     Args:
         coin_results: 六次抛币结果 [6-9], 如果为None则自动模拟
         question: 所问之事
+        cast_time: 起卦时间 (定日干安六兽), 默认当前时间
+        seed: 自动模拟时的随机种子, 相同种子得到相同卦象; 为空则随机选取
         
     Returns:
-        完整的卦象数据
+        完整的卦象数据（卦象部分取自预计算表，为共享对象，调用方不得修改）
+        自动模拟时 seed 字段为所用种子, 可据此复现
     """
-    # 如果没有提供结果,自动模拟
-    if coin_results is None:
-        coin_results = [simulate_coin_toss() for _ in range(6)]
+    # 如果没有提供结果(或不足6个), 用可复现的生成器自动模拟
+    if coin_results is None or len(coin_results) != 6:
+        if seed is None:
+            seed = random.getrandbits(63)
+        coin_results = draw_casts(coin_generator(seed), 1)[0].tolist()
+    else:
+        seed = None
     
-    # 确保有6个结果
-    if len(coin_results) != 6:
-        coin_results = [simulate_coin_toss() for _ in range(6)]
+    # 合法抛币结果直接查表, 其余(非6-9)按原规则逐爻推导
+    if all(v in COIN_VALUES for v in coin_results):
+        chart = CAST_TABLE[cast_index(coin_results)]
+    else:
+        chart = _derive_chart(coin_results)
     
-    # 解析每一爻
+    # 六兽随起卦日干而定, 只复制各爻
+    day = day_info(cast_time or datetime.now())
+    beasts = day["six_beasts"]
+    return {
+        "question": question,
+        **chart,
+        "yaos": [{**yao, "beast": beasts[i]} for i, yao in enumerate(chart["yaos"])],
+        "day_gan_zhi": day["day_gan_zhi"],
+        "xun_kong": day["xun_kong"],
+        "seed": seed
+    }
+
+
+def cast_index(coin_results: List[int]) -> int:
+    """六次抛币结果 -> 预计算表下标 (每爻2位, 初爻在最低位)"""
+    index = 0
+    for i, value in enumerate(coin_results):
+        index |= (value - 6) << (2 * i)
+    return index
+
+
+def _derive_chart(coin_results: List[int]) -> Dict[str, Any]:
+    """由六次抛币结果推导卦象 (不含所问之事)"""
+    # 解析每一爻: 阴阳与动爻各记一位, 初爻在最低位
     yaos = []
-    original_lines = []
-    changed_lines = []
-    moving_positions = []
+    bits = mask = 0
     
     for i, result in enumerate(coin_results):
         yao = coin_result_to_yao(result)
@@ -153,56 +155,31 @@ def generate_liuyao_chart(
         yao["coin_value"] = result
         yaos.append(yao)
         
-        original_lines.append(yao["value"])
-        
-        # 计算变爻后的值
+        bits |= yao["value"] << i
         if yao["changing"]:
-            moving_positions.append(i + 1)
-            changed_lines.append(1 - yao["value"])  # 阴阳互换
-        else:
-            changed_lines.append(yao["value"])
+            mask |= 1 << i
     
-    # 确定上下卦
-    lower_trigram = lines_to_trigram(original_lines[:3])
-    upper_trigram = lines_to_trigram(original_lines[3:])
-    
-    # 本卦
-    original_hexagram = {
-        "name": get_hexagram_name(upper_trigram, lower_trigram),
-        "upper": upper_trigram,
-        "lower": lower_trigram,
-        "upper_symbol": BAGUA[upper_trigram]["symbol"],
-        "lower_symbol": BAGUA[lower_trigram]["symbol"],
-        "lines": original_lines
-    }
-    
-    # 变卦 (如果有动爻)
-    changed_hexagram = None
-    if moving_positions:
-        changed_lower = lines_to_trigram(changed_lines[:3])
-        changed_upper = lines_to_trigram(changed_lines[3:])
-        changed_hexagram = {
-            "name": get_hexagram_name(changed_upper, changed_lower),
-            "upper": changed_upper,
-            "lower": changed_lower,
-            "upper_symbol": BAGUA[changed_upper]["symbol"],
-            "lower_symbol": BAGUA[changed_lower]["symbol"],
-            "lines": changed_lines
-        }
+    # 本卦; 变卦为本卦与动爻掩码异或 (如果有动爻)
+    original = Hexagram.of(bits)
+    original_hexagram = _hexagram_info(original)
+    changed_hexagram = _hexagram_info(original.change(mask)) if mask else None
+    moving_positions = [i + 1 for i in range(6) if mask >> i & 1]
     
-    # 安世应
-    world_pos, response_pos = calculate_world_response(original_lines)
+    # 安世应 (八宫卦序)
+    world_pos, response_pos = WORLD[bits], RESPONSE[bits]
     
-    # 安六兽 (简化: 从初爻开始依次安)
+    # 纳甲、六亲、伏神、变爻; 六兽在起卦时按日干安
+    details = line_details(bits, original.change(mask).bits)
     for i, yao in enumerate(yaos):
-        yao["beast"] = SIX_BEASTS[i]
+        yao["beast"] = None
         yao["is_world"] = (i + 1) == world_pos
         yao["is_response"] = (i + 1) == response_pos
+        yao.update(details[i])
     
     return {
-        "question": question,
-        "coin_results": coin_results,
+        "coin_results": list(coin_results),
         "yaos": yaos,
+        "palace": palace_info(bits),
         "original_hexagram": original_hexagram,
         "changed_hexagram": changed_hexagram,
         "moving_positions": moving_positions,
@@ -212,6 +189,18 @@ def generate_liuyao_chart(
     }
 
 
+def _hexagram_info(hexagram: Hexagram) -> Dict[str, Any]:
+    upper, lower = TRIGRAM_NAMES[hexagram.upper], TRIGRAM_NAMES[hexagram.lower]
+    return {
+        "name": hexagram.name,
+        "upper": upper,
+        "lower": lower,
+        "upper_symbol": BAGUA[upper]["symbol"],
+        "lower_symbol": BAGUA[lower]["symbol"],
+        "lines": hexagram.lines
+    }
+
+
 def _get_interpretation_hint(hexagram_name: str, moving_positions: List[int]) -> str:
     """
     生成解卦提示
@@ -230,3 +219,118 @@ def _get_interpretation_hint(hexagram_name: str, moving_positions: List[int]) ->
         return "五爻变动，以变卦不变之爻爻辞为主。"
     else:
         return "六爻皆变，用变卦卦辞断之。"
+
+
+# ========== 预计算起卦表 ==========
+
+COIN_VALUES = (6, 7, 8, 9)
+
+# 全部 4^6 = 4096 种抛币序列的卦象, 下标见 cast_index
+CAST_TABLE = tuple(
+    _derive_chart([6 + (index >> (2 * i) & 3) for i in range(6)])
+    for index in range(4 ** 6)
+)
+
+
+# ========== 可复现的批量抛币 ==========
+# 每次起卦取一个 18 位随机数, 每 3 位为一爻的三枚铜钱 (1为正面);
+# 正面数 0-3 对应 6-9, 即预计算表下标中该爻的 2 位.
+
+# 单次模拟最多起卦次数
+SIMULATE_MAX_CASTS = int(os.getenv("LIUYAO_SIMULATE_MAX_CASTS", "50000000"))
+
+# 分块大小, 限制内存占用
+SIMULATE_CHUNK = 1 << 20
+
+_HEADS = np.array([bin(i).count("1") for i in range(8)], dtype=np.int64)
+
+# 按预计算表下标展开的本卦、变卦、动爻数
+_INDEX_LINES = (np.arange(4096)[:, None] >> (2 * np.arange(6))) & 3
+_INDEX_ORIGINAL = ((_INDEX_LINES & 1) << np.arange(6)).sum(axis=1)
+_INDEX_MASK = (((_INDEX_LINES == 0) | (_INDEX_LINES == 3)) << np.arange(6)).sum(axis=1)
+_INDEX_CHANGED = _INDEX_ORIGINAL ^ _INDEX_MASK
+_INDEX_MOVING = ((_INDEX_LINES == 0) | (_INDEX_LINES == 3)).sum(axis=1)
+
+# 公平铜钱下各下标的理论概率 (每爻 6/7/8/9 为 1/8, 3/8, 3/8, 1/8)
+_INDEX_PROBABILITY = np.prod(np.array([1, 3, 3, 1])[_INDEX_LINES] / 8.0, axis=1)
+
+# 卦按文王卦序排列的 bits
+_KING_WEN_BITS = np.argsort(np.array(NUMBERS))
+
+
+def coin_generator(seed: Optional[int] = None) -> np.random.Generator:
+    """可设定种子的随机数生成器 (PCG64)"""
+    return np.random.default_rng(seed)
+
+
+def _draw_indices(rng: np.random.Generator, n: int) -> np.ndarray:
+    """n 次起卦的预计算表下标"""
+    coins = rng.integers(0, 1 << 18, size=n, dtype=np.int64)
+    index = np.zeros(n, dtype=np.int64)
+    for line in range(6):
+        index |= _HEADS[(coins >> (3 * line)) & 7] << (2 * line)
+    return index
+
+
+def draw_casts(rng: np.random.Generator, n: int) -> np.ndarray:
+    """n 次起卦的抛币结果 (n×6, 值为 6-9, 初爻在前)"""
+    index = _draw_indices(rng, n)
+    return 6 + ((index[:, None] >> (2 * np.arange(6))) & 3)
+
+
+def _chi_square(observed: np.ndarray, expected: np.ndarray) -> float:
+    return float(((observed - expected) ** 2 / expected).sum())
+
+
+def simulate_casts(n: int, seed: Optional[int] = None) -> Dict[str, Any]:
+    """
+    模拟 n 次起卦并统计分布
+
+    Returns:
+        casts, seed: 次数与所用种子 (相同种子结果相同)
+        hexagrams: 本卦分布 (文王卦序)
+        moving_line_counts: 动爻数 0-6 的分布
+        transitions: 本卦 -> 变卦 次数矩阵 (64×64, 文王卦序, 无动爻计入对角)
+        chi_square: 本卦与抛币序列相对理论分布的卡方统计量及自由度
+    """
+    if seed is None:
+        seed = random.getrandbits(63)
+    rng = coin_generator(seed)
+
+    counts = np.zeros(4096, dtype=np.int64)
+    remaining = n
+    while remaining > 0:
+        size = min(remaining, SIMULATE_CHUNK)
+        counts += np.bincount(_draw_indices(rng, size), minlength=4096)
+        remaining -= size
+
+    hexagram_counts = np.bincount(_INDEX_ORIGINAL, weights=counts, minlength=64).astype(np.int64)
+    moving_counts = np.bincount(_INDEX_MOVING, weights=counts, minlength=7).astype(np.int64)
+    transitions = np.zeros((64, 64), dtype=np.int64)
+    np.add.at(transitions, (_INDEX_ORIGINAL, _INDEX_CHANGED), counts)
+    transitions = transitions[_KING_WEN_BITS][:, _KING_WEN_BITS]
+
+    return {
+        "casts": n,
+        "seed": seed,
+        "hexagrams": [
+            {
+                "number": int(NUMBERS[bits]),
+                "name": NAMES[bits],
+                "count": int(hexagram_counts[bits]),
+                "frequency": round(float(hexagram_counts[bits]) / n, 6)
+            }
+            for bits in _KING_WEN_BITS
+        ],
+        "moving_line_counts": [
+            {"moving": k, "count": int(c), "frequency": round(float(c) / n, 6)}
+            for k, c in enumerate(moving_counts)
+        ],
+        "transitions": transitions.tolist(),
+        "chi_square": {
+            "hexagrams": round(_chi_square(hexagram_counts, np.full(64, n / 64)), 3),
+            "hexagrams_dof": 63,
+            "sequences": round(_chi_square(counts, _INDEX_PROBABILITY * n), 3),
+            "sequences_dof": 4095
+        }
+    }
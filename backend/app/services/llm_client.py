@@ -0,0 +1,495 @@
+"""
+大模型调用客户端
+Shared LLM client: pluggable backends, concurrency limit, deadlines, retries, circuit breaker
+
+全部 AI 调用经由同一个 LLMClient (启动时 configure 一次):
+- 后端: GeminiBackend (启动时 genai.configure 一次, 复用同一模型句柄) 或 StubBackend
+  (本地桩, 按提示词生成确定的回复, 不访问网络, 供压测与 CI 使用), 由 LLM_BACKEND 选择
+- 并发: 信号量限制同时进行的上游调用数, 超出的请求排队等待
+- 时限: 每次调用 (含排队、重试与退避) 不超过 LLM_TIMEOUT 秒; 流式调用首段同此时限,
+  其后相邻两段间隔不超过 LLM_STREAM_IDLE_TIMEOUT 秒
+- 重试: 仅对超时与上游暂时性错误 (限流、5xx) 重试, 退避为带完全抖动的指数退避;
+  流式调用只在产出首段前重试
+- 熔断: 连续 LLM_BREAKER_THRESHOLD 次暂时性失败后熔断 LLM_BREAKER_RESET 秒, 期间直接失败;
+  到期后放行一次试探调用, 成功则恢复, 失败则继续熔断
+"""
+import abc
+import asyncio
+import hashlib
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemma-3-1b-it")
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+LLM_STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", "0.05"))
+LLM_STUB_FAILURE_RATE = float(os.getenv("LLM_STUB_FAILURE_RATE", "0"))
+
+
+class LLMError(RuntimeError):
+    """大模型调用失败"""
+
+
+class LLMNotConfigured(LLMError):
+    """后端未配置 (如缺少 API key)"""
+
+
+class LLMUnavailable(LLMError):
+    """熔断中, 暂停调用上游"""
+
+
+class LLMTimeout(LLMError):
+    """超过调用时限"""
+
+
+class TransientBackendError(LLMError):
+    """上游暂时性错误, 可重试"""
+
+
+# ========== 后端 ==========
+
+class LLMBackend(abc.ABC):
+    """
+    后端接口
+
+    子类实现 generate (完整回复) 与 stream (逐段回复), 并以 is_transient 区分可重试的错误.
+    model 参与 AI 解读缓存的键, 换模型即不复用旧回复.
+    """
+
+    name = "base"
+    model = ""
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    @abc.abstractmethod
+    async def generate(self, prompt: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        ...
+
+    def is_transient(self, exc: BaseException) -> bool:
+        return isinstance(exc, (TransientBackendError, LLMTimeout, ConnectionError, TimeoutError))
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini (google-generativeai), 创建时配置一次并复用模型句柄"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str = GEMINI_API_KEY, model: str = GEMINI_MODEL):
+        self.model = model
+        self._model = None
+        if api_key:
+            try:
+                import google.generativeai as genai
+            except ImportError:
+                print("Warning: google-generativeai 未安装, AI 解读不可用")
+                return
+            genai.configure(api_key=api_key)
+            # Gemma 模型不支持 system_instruction，系统提示词已合并到 prompt
+            self._model = genai.GenerativeModel(model_name=model)
+
+    @property
+    def configured(self) -> bool:
+        return self._model is not None
+
+    async def generate(self, prompt: str) -> str:
+        response = await self._model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self._model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            text = chunk.text
+            if text:
+                yield text
+
+    def is_transient(self, exc: BaseException) -> bool:
+        try:
+            from google.api_core import exceptions as api_exceptions
+        except ImportError:
+            return super().is_transient(exc)
+        return super().is_transient(exc) or isinstance(exc, (
+            api_exceptions.TooManyRequests,
+            api_exceptions.ResourceExhausted,
+            api_exceptions.ServerError,
+            api_exceptions.DeadlineExceeded,
+        ))
+
+
+class StubBackend(LLMBackend):
+    """
+    本地桩后端
+
+    回复由提示词摘要确定 (同一提示词回复相同), 每段延迟 latency 秒;
+    failure_rate > 0 时按比例抛出暂时性错误, 用于演练重试与熔断
+    """
+
+    name = "stub"
+    model = "stub"
+
+    def __init__(self, latency: float = LLM_STUB_LATENCY, failure_rate: float = LLM_STUB_FAILURE_RATE,
+                 chunks: int = 4):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.chunks = chunks
+
+    def _maybe_fail(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise TransientBackendError("stub backend transient failure")
+
+    def _parts(self, prompt: str):
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        return [f"【桩回复 {digest}】第{i + 1}段。\n" for i in range(self.chunks)]
+
+    async def generate(self, prompt: str) -> str:
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        return "".join(self._parts(prompt))
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        for i, part in enumerate(self._parts(prompt)):
+            await asyncio.sleep(self.latency / self.chunks)
+            if i == 0:
+                self._maybe_fail()
+            yield part
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "stub": StubBackend,
+}
+
+
+# ========== 熔断器 ==========
+
+class CircuitBreaker:
+    """
+    连续失败计数熔断器 (仅在事件循环线程中使用)
+
+    closed -> 连续 threshold 次失败 -> open -> reset_after 秒后 half_open (放行一次试探)
+    -> 试探成功 closed / 失败 open
+    """
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, reset_after: float = LLM_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """是否放行本次调用; 半开时只放行一次试探"""
+        if self.opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self.opened_at < self.reset_after:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or (self.threshold > 0 and self.failures >= self.threshold):
+            if self.opened_at is None or self._probing:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """试探调用未得出结果 (被取消或非暂时性错误) 时交还试探机会"""
+        self._probing = False
+
+
+# ========== 客户端 ==========
+
+class LLMClient:
+    """
+    带并发限制、时限、重试与熔断的大模型客户端
+
+    信号量按事件循环创建, 同步代码经 asyncio.run 调用时也受限制
+    """
+
+    def __init__(
+        self,
+        backend: LLMBackend,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        timeout: float = LLM_TIMEOUT,
+        stream_idle_timeout: float = LLM_STREAM_IDLE_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.backend = backend
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.stream_idle_timeout = stream_idle_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    @property
+    def model(self) -> str:
+        return self.backend.model
+
+    @property
+    def configured(self) -> bool:
+        return self.backend.configured
+
+    def _slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待秒数 (完全抖动)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _acquire(self, slots: asyncio.Semaphore, deadline: float) -> bool:
+        """
+        在 deadline 前取得并发名额, 超时返回 False
+
+        用 asyncio.wait 而非 wait_for: 取得名额与超时同时发生时 wait_for 会丢弃结果, 名额随之泄漏
+        """
+        acquire = asyncio.ensure_future(slots.acquire())
+        self.waiting += 1
+        try:
+            await asyncio.wait((acquire,), timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.CancelledError:
+            if not acquire.cancel():
+                slots.release()
+            raise
+        finally:
+            self.waiting -= 1
+        if acquire.done():
+            return True
+        acquire.cancel()
+        return False
+
+    def _queue_timed_out(self) -> LLMTimeout:
+        """记录排队等待名额超时 (本地拥塞, 不计入熔断) 并返回待抛出的异常"""
+        self.timeouts += 1
+        return LLMTimeout(f"AI 调用超时（{self.timeout:g} 秒）")
+
+    def _timed_out(self, seconds: float) -> LLMTimeout:
+        """记录上游调用超时 (计入熔断) 并返回待抛出的异常"""
+        self.timeouts += 1
+        self.failures += 1
+        self.breaker.record_failure()
+        return LLMTimeout(f"AI 调用超时（{seconds:g} 秒）")
+
+    def _check(self):
+        """排队前检查: 未配置或熔断中直接失败"""
+        if not self.backend.configured:
+            raise LLMNotConfigured(f"{self.backend.name} backend not configured")
+        if self.breaker.state == "open":
+            self.rejected += 1
+            raise LLMUnavailable("AI 服务暂时不可用，请稍后再试")
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise LLMUnavailable("AI 服务暂时不可用，请稍后再试")
+
+    async def _retry_wait(self, attempt: int, exc: BaseException, deadline: float) -> bool:
+        """可重试时等待退避并返回 True; 次数用尽或时限不足时返回 False"""
+        if attempt >= self.max_retries or not self.backend.is_transient(exc):
+            return False
+        delay = self.backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return False
+        self.retries += 1
+        await asyncio.sleep(delay)
+        return True
+
+    def _fail(self, exc: BaseException):
+        """记录失败; 只有暂时性错误计入熔断"""
+        self.failures += 1
+        if self.backend.is_transient(exc):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+
+    async def generate(self, prompt: str) -> str:
+        """
+        生成完整回复
+
+        Raises:
+            LLMNotConfigured, LLMUnavailable, LLMTimeout, 以及后端的非暂时性错误
+        """
+        self._check()
+        self.calls += 1
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        slots = self._slots()
+        if not await self._acquire(slots, deadline):
+            raise self._queue_timed_out()
+        self.in_flight += 1
+        try:
+            while True:
+                self._admit()
+                try:
+                    text = await asyncio.wait_for(self.backend.generate(prompt), deadline - time.monotonic())
+                except asyncio.CancelledError:
+                    self.breaker.release()
+                    raise
+                except Exception as e:
+                    # 到时限才算超时, 后端自身抛出的 TimeoutError 按一般错误处理
+                    if isinstance(e, asyncio.TimeoutError) and time.monotonic() >= deadline:
+                        raise self._timed_out(self.timeout)
+                    self._fail(e)
+                    if await self._retry_wait(attempt, e, deadline):
+                        attempt += 1
+                        continue
+                    raise
+                self.breaker.record_success()
+                return text
+        finally:
+            self.in_flight -= 1
+            slots.release()
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        逐段生成回复; 只在产出首段前重试, 之后的错误直接抛出
+
+        Raises:
+            同 generate
+        """
+        self._check()
+        self.calls += 1
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        slots = self._slots()
+        if not await self._acquire(slots, deadline):
+            raise self._queue_timed_out()
+        self.in_flight += 1
+        try:
+            while True:
+                self._admit()
+                chunks = self.backend.stream(prompt)
+                started = False
+                try:
+                    while True:
+                        limit = deadline if not started else time.monotonic() + self.stream_idle_timeout
+                        try:
+                            text = await asyncio.wait_for(chunks.__anext__(), limit - time.monotonic())
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            if time.monotonic() < limit:
+                                raise
+                            self.timeouts += 1
+                            seconds = self.stream_idle_timeout if started else self.timeout
+                            raise LLMTimeout(f"AI 调用超时（{seconds:g} 秒）")
+                        started = True
+                        yield text
+                except (asyncio.CancelledError, GeneratorExit):
+                    # 客户端断开
+                    self.breaker.release()
+                    raise
+                except Exception as e:
+                    self._fail(e)
+                    if not started and await self._retry_wait(attempt, e, deadline):
+                        attempt += 1
+                        continue
+                    raise
+                finally:
+                    await chunks.aclose()
+                self.breaker.record_success()
+                return
+        finally:
+            self.in_flight -= 1
+            slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "model": self.model,
+            "configured": self.configured,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "breaker": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "trips": self.breaker.trips
+            }
+        }
+
+
+# ========== 全局客户端 ==========
+
+_client: Optional[LLMClient] = None
+
+
+def configure(backend: Optional[LLMBackend] = None, **options) -> LLMClient:
+    """
+    创建全局客户端 (服务启动时调用一次)
+
+    Args:
+        backend: 后端实例, 默认按 LLM_BACKEND 创建
+        options: 传给 LLMClient 的其余参数
+    """
+    global _client
+    if backend is None:
+        if LLM_BACKEND not in BACKENDS:
+            raise ValueError(f"未知 LLM_BACKEND: {LLM_BACKEND}")
+        backend = BACKENDS[LLM_BACKEND]()
+    _client = LLMClient(backend, **options)
+    return _client
+
+
+def get_client() -> LLMClient:
+    """全局客户端, 未配置时按环境变量创建"""
+    return _client if _client is not None else configure()
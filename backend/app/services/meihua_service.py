@@ -0,0 +1,209 @@
+"""
+梅花易数起卦服务
+Plum-blossom (梅花易数) time- and number-based casting
+
+以先天八卦数 (乾一 兑二 离三 震四 巽五 坎六 艮七 坤八) 取卦:
+- 时间起卦: 年支数 + 农历月 + 农历日 除八取上卦, 再加时辰数除八取下卦, 总数除六取动爻
+- 报数起卦: 前数除八取上卦, 后数除八取下卦, 两数之和 (可加时辰数) 除六取动爻
+余数为 0 时取满数 (八或六).
+
+同一时辰内时间起卦的结果对所有人相同, ShichenCastCache 预先算好当前与下一时辰,
+跨过时辰边界时顺延, 请求不再重复推算农历.
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from .bazi_service import DI_ZHI, ELEMENT_CODE, ELEMENT_RELATIONS
+from .calendar_engine import lunar_date
+from .hexagram import Hexagram, TRIGRAM_NAMES, TRIGRAM_SYMBOLS, TRIGRAM_CODE
+from .najia_engine import TRIGRAM_ELEMENTS
+from .solar_time import get_shichen_from_hour
+
+
+# 先天八卦数 1-8 -> 三位卦编码
+XIANTIAN_ORDER = ["乾", "兑", "离", "震", "巽", "坎", "艮", "坤"]
+XIANTIAN_TRIGRAMS = [None] + [TRIGRAM_CODE[name] for name in XIANTIAN_ORDER]
+
+# 用卦对体卦的生克, 与 ELEMENT_RELATIONS 顺序一致 (以体卦为"我"): 生我、我生、克我、我克、同我
+TI_YONG_RELATIONS = [
+    ("用生体", "吉"),
+    ("体生用", "泄"),
+    ("用克体", "凶"),
+    ("体克用", "吉"),
+    ("比和", "吉"),
+]
+
+
+def _remainder(n: int, m: int) -> int:
+    """除 m 取余, 整除时取 m"""
+    return (n - 1) % m + 1
+
+
+def _hexagram_info(hexagram: Hexagram) -> Dict[str, Any]:
+    return {
+        "name": hexagram.name,
+        "number": hexagram.number,
+        "symbol": hexagram.symbol,
+        "upper": TRIGRAM_NAMES[hexagram.upper],
+        "lower": TRIGRAM_NAMES[hexagram.lower],
+        "upper_symbol": TRIGRAM_SYMBOLS[hexagram.upper],
+        "lower_symbol": TRIGRAM_SYMBOLS[hexagram.lower],
+        "lines": hexagram.lines
+    }
+
+
+def _ti_yong(hexagram: Hexagram, moving: int) -> Dict[str, Any]:
+    """动爻所在之卦为用, 另一卦为体"""
+    ti, yong = (hexagram.upper, hexagram.lower) if moving <= 3 else (hexagram.lower, hexagram.upper)
+    ti_element = TRIGRAM_ELEMENTS[TRIGRAM_NAMES[ti]]
+    yong_element = TRIGRAM_ELEMENTS[TRIGRAM_NAMES[yong]]
+    relation, fortune = TI_YONG_RELATIONS[
+        ELEMENT_RELATIONS[ELEMENT_CODE[ti_element]].index(ELEMENT_CODE[yong_element])
+    ]
+    return {
+        "ti": TRIGRAM_NAMES[ti],
+        "yong": TRIGRAM_NAMES[yong],
+        "ti_element": ti_element,
+        "yong_element": yong_element,
+        "relation": relation,
+        "fortune": fortune
+    }
+
+
+def cast_by_numbers(upper_number: int, lower_number: int, moving_number: int) -> Dict[str, Any]:
+    """
+    由三个数起卦
+
+    Args:
+        upper_number: 取上卦之数 (除八)
+        lower_number: 取下卦之数 (除八)
+        moving_number: 取动爻之数 (除六)
+
+    Returns:
+        本卦、互卦、变卦、动爻与体用
+    """
+    upper = XIANTIAN_TRIGRAMS[_remainder(upper_number, 8)]
+    lower = XIANTIAN_TRIGRAMS[_remainder(lower_number, 8)]
+    moving = _remainder(moving_number, 6)
+
+    original = Hexagram.from_trigrams(upper, lower)
+    # 互卦: 二三四爻为下卦, 三四五爻为上卦
+    mutual = Hexagram.from_trigrams(original.bits >> 2 & 7, original.bits >> 1 & 7)
+    changed = original.change(1 << (moving - 1))
+
+    return {
+        "original_hexagram": _hexagram_info(original),
+        "mutual_hexagram": _hexagram_info(mutual),
+        "changed_hexagram": _hexagram_info(changed),
+        "moving_position": moving,
+        "ti_yong": _ti_yong(original, moving)
+    }
+
+
+def shichen_number(hour: int) -> int:
+    """时辰数: 子一 丑二 ... 亥十二"""
+    return DI_ZHI.index(get_shichen_from_hour(hour)[0]) + 1
+
+
+def cast_by_time(cast_time: datetime) -> Dict[str, Any]:
+    """
+    时间起卦 (农历年月日时)
+
+    23 点起属次日子时, 按次日农历日期起卦
+    """
+    day = cast_time.date() + timedelta(days=1) if cast_time.hour == 23 else cast_time.date()
+    lunar_year, lunar_month, lunar_day = lunar_date(day)
+    year_number = (lunar_year - 4) % 12 + 1
+    month_number = abs(lunar_month)
+    hour_number = shichen_number(cast_time.hour)
+
+    total = year_number + month_number + lunar_day
+    result = cast_by_numbers(total, total + hour_number, total + hour_number)
+    result["method"] = "time"
+    result["basis"] = {
+        "lunar_year": lunar_year,
+        "lunar_month": lunar_month,
+        "lunar_day": lunar_day,
+        "year_zhi": DI_ZHI[year_number - 1],
+        "shichen": DI_ZHI[hour_number - 1],
+        "year_number": year_number,
+        "month_number": month_number,
+        "day_number": lunar_day,
+        "hour_number": hour_number
+    }
+    return result
+
+
+def cast_by_reported_numbers(first: int, second: int, cast_time: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    报数起卦
+
+    Args:
+        first: 前数, 取上卦
+        second: 后数, 取下卦
+        cast_time: 起卦时间, 给出时动爻加时辰数
+    """
+    hour_number = shichen_number(cast_time.hour) if cast_time else 0
+    result = cast_by_numbers(first, second, first + second + hour_number)
+    result["method"] = "number"
+    result["basis"] = {
+        "first": first,
+        "second": second,
+        "hour_number": hour_number or None
+    }
+    return result
+
+
+# ========== 时辰卦缓存 ==========
+
+def shichen_start(dt: datetime) -> datetime:
+    """dt 所在时辰的起始时刻 (子时起于 23 点)"""
+    start = dt.replace(minute=0, second=0, microsecond=0)
+    return start if start.hour % 2 == 1 else start - timedelta(hours=1)
+
+
+class ShichenCastCache:
+    """
+    时辰卦缓存
+
+    保存当前与下一时辰的起卦结果 (共享对象, 调用方不得修改);
+    跨过时辰边界时下一时辰顺延为当前, 再预先算出新的下一时辰.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._periods: Dict[datetime, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _compute(start: datetime) -> Dict[str, Any]:
+        result = cast_by_time(start)
+        result["period_start"] = start.isoformat()
+        result["period_end"] = (start + timedelta(hours=2)).isoformat()
+        return result
+
+    def get(self, now: Optional[datetime] = None) -> Tuple[Dict[str, Any], datetime]:
+        """返回 (当前时辰卦, 时辰结束时刻)"""
+        now = now or datetime.now()
+        start = shichen_start(now)
+        end = start + timedelta(hours=2)
+        periods = self._periods
+        result = periods.get(start)
+        if result is not None and end in periods:
+            return result, end
+        with self._lock:
+            periods = {
+                s: self._periods.get(s) or self._compute(s)
+                for s in (start, end)
+            }
+            # 整体替换, 读取方无需加锁
+            self._periods = periods
+            return periods[start], end
+
+    def lookup(self, cast_time: datetime) -> Dict[str, Any]:
+        """cast_time 落在已缓存时辰内时直接返回, 否则现算 (不入缓存)"""
+        result = self._periods.get(shichen_start(cast_time))
+        return result if result is not None else self._compute(shichen_start(cast_time))
+
+
+SHICHEN_CACHE = ShichenCastCache()
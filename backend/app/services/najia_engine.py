@@ -0,0 +1,170 @@
+"""
+八宫纳甲引擎
+Palace (八宫) and na-jia (纳甲) tables for liuyao charts
+
+导入时一次性算出 64 卦的静态表 (按 Hexagram.bits 下标):
+- 所属八宫、宫五行、世代, 世应爻位
+- 各爻纳甲干支、五行, 以宫五行定六亲
+- 伏神: 本卦六亲不全时, 取本宫纯卦同位之爻伏于其下
+起卦时只需按日干安六兽 (六神).
+"""
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from .bazi_service import (
+    TIAN_GAN, DI_ZHI, ELEMENTS, GAN_CODE, ZHI_CODE, ELEMENT_CODE,
+    ZHI_ELEMENT, ELEMENT_RELATIONS, JIA_ZI
+)
+from .hexagram import TRIGRAM_NAMES, PALACES, GENERATIONS, GENERATION_NAMES
+from .pillar_engine import ORDINAL_TO_DAY_GZ
+
+
+# 六亲 (以宫五行为主)
+SIX_RELATIVES = {
+    "生我": "父母",
+    "我生": "子孙",
+    "克我": "官鬼",
+    "我克": "妻财",
+    "同我": "兄弟"
+}
+
+# 六亲编码, 与 ELEMENT_RELATIONS 顺序一致: 生我、我生、克我、我克、同我
+RELATIVE_NAMES = [SIX_RELATIVES[k] for k in ("生我", "我生", "克我", "我克", "同我")]
+
+# 六兽 (六神)
+SIX_BEASTS = ["青龙", "朱雀", "勾陈", "螣蛇", "白虎", "玄武"]
+
+# 日干起六兽: 甲乙青龙, 丙丁朱雀, 戊勾陈, 己螣蛇, 庚辛白虎, 壬癸玄武 (自初爻起)
+SPIRIT_START = (0, 0, 1, 1, 2, 3, 4, 4, 5, 5)
+
+# 八卦五行
+TRIGRAM_ELEMENTS = {
+    "乾": "金", "兑": "金", "离": "火", "震": "木",
+    "巽": "木", "坎": "水", "艮": "土", "坤": "土"
+}
+
+# 纳甲: 卦 -> (内卦天干, 外卦天干, 内卦三爻地支, 外卦三爻地支)
+NAJIA = {
+    "乾": ("甲", "壬", "子寅辰", "午申戌"),
+    "坎": ("戊", "戊", "寅辰午", "申戌子"),
+    "艮": ("丙", "丙", "辰午申", "戌子寅"),
+    "震": ("庚", "庚", "子寅辰", "午申戌"),
+    "巽": ("辛", "辛", "丑亥酉", "未巳卯"),
+    "离": ("己", "己", "卯丑亥", "酉未巳"),
+    "坤": ("乙", "癸", "未巳卯", "丑亥酉"),
+    "兑": ("丁", "丁", "巳卯丑", "亥酉未"),
+}
+
+# 世爻: 本宫六世, 一世至五世依次, 游魂四世, 归魂三世
+WORLD_BY_GENERATION = (6, 1, 2, 3, 4, 5, 4, 3)
+
+
+def _relative(element: int, palace_element: int) -> int:
+    """爻五行相对宫五行的六亲编码"""
+    return ELEMENT_RELATIONS[palace_element].index(element)
+
+
+def _najia_lines(bits: int) -> Tuple[Tuple[int, int], ...]:
+    """各爻纳甲 (天干, 地支), 初爻在前"""
+    lines = []
+    for outer, trigram in ((False, bits & 7), (True, bits >> 3)):
+        inner_gan, outer_gan, inner_zhi, outer_zhi = NAJIA[TRIGRAM_NAMES[trigram]]
+        gan, zhis = (outer_gan, outer_zhi) if outer else (inner_gan, inner_zhi)
+        lines.extend((GAN_CODE[gan], ZHI_CODE[z]) for z in zhis)
+    return tuple(lines)
+
+
+PALACE_ELEMENTS = tuple(ELEMENT_CODE[TRIGRAM_ELEMENTS[name]] for name in TRIGRAM_NAMES)
+
+NAJIA_LINES = tuple(_najia_lines(bits) for bits in range(64))
+LINE_ELEMENTS = tuple(tuple(ZHI_ELEMENT[zhi] for _, zhi in NAJIA_LINES[bits]) for bits in range(64))
+RELATIVES = tuple(
+    tuple(_relative(e, PALACE_ELEMENTS[PALACES[bits]]) for e in LINE_ELEMENTS[bits])
+    for bits in range(64)
+)
+WORLD = tuple(WORLD_BY_GENERATION[GENERATIONS[bits]] for bits in range(64))
+RESPONSE = tuple((w + 2) % 6 + 1 for w in WORLD)
+
+
+def _hidden_spirits(bits: int) -> Tuple[int, ...]:
+    """伏神所在爻位: 本卦所缺六亲在本宫纯卦中的爻位, 不缺时为空"""
+    palace = PALACES[bits]
+    pure = palace << 3 | palace
+    present = set(RELATIVES[bits])
+    return tuple(i + 1 for i, relative in enumerate(RELATIVES[pure]) if relative not in present)
+
+
+HIDDEN_SPIRITS = tuple(_hidden_spirits(bits) for bits in range(64))
+
+
+# ========== 输出 ==========
+
+def _line_info(gan: int, zhi: int, relative: int) -> Dict[str, Any]:
+    return {
+        "gan": TIAN_GAN[gan],
+        "zhi": DI_ZHI[zhi],
+        "element": ELEMENTS[ZHI_ELEMENT[zhi]],
+        "relative": RELATIVE_NAMES[relative]
+    }
+
+
+def palace_info(bits: int) -> Dict[str, Any]:
+    """卦的八宫信息"""
+    palace = PALACES[bits]
+    return {
+        "name": TRIGRAM_NAMES[palace] + "宫",
+        "element": ELEMENTS[PALACE_ELEMENTS[palace]],
+        "generation": GENERATION_NAMES[GENERATIONS[bits]]
+    }
+
+
+def line_details(bits: int, changed_bits: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    各爻纳甲、六亲、伏神及变爻 (初爻在前)
+
+    变爻的六亲仍以本卦宫五行论
+    """
+    palace = PALACES[bits]
+    palace_element = PALACE_ELEMENTS[palace]
+    pure = palace << 3 | palace
+    hidden = HIDDEN_SPIRITS[bits]
+    moving = (bits ^ changed_bits) if changed_bits is not None else 0
+
+    details = []
+    for i, (gan, zhi) in enumerate(NAJIA_LINES[bits]):
+        info = _line_info(gan, zhi, RELATIVES[bits][i])
+        if i + 1 in hidden:
+            h_gan, h_zhi = NAJIA_LINES[pure][i]
+            info["hidden"] = _line_info(h_gan, h_zhi, RELATIVES[pure][i])
+        else:
+            info["hidden"] = None
+        if moving >> i & 1:
+            c_gan, c_zhi = NAJIA_LINES[changed_bits][i]
+            info["changed"] = _line_info(c_gan, c_zhi, _relative(ZHI_ELEMENT[c_zhi], palace_element))
+        else:
+            info["changed"] = None
+        details.append(info)
+    return details
+
+
+def day_gan_zhi(cast_time: datetime) -> int:
+    """起卦日干支 (六十甲子序号), 23点起算次日"""
+    gz = (cast_time.date().toordinal() + ORDINAL_TO_DAY_GZ) % 60
+    return (gz + 1) % 60 if cast_time.hour == 23 else gz
+
+
+def six_beasts(day_gan: int) -> List[str]:
+    """按日干安六兽, 自初爻起"""
+    start = SPIRIT_START[day_gan]
+    return [SIX_BEASTS[(start + i) % 6] for i in range(6)]
+
+
+def day_info(cast_time: datetime) -> Dict[str, Any]:
+    """起卦日干支与旬空"""
+    gz = day_gan_zhi(cast_time)
+    xun = gz - gz % 10  # 旬首
+    return {
+        "day_gan_zhi": JIA_ZI[gz],
+        "xun_kong": [DI_ZHI[(xun + 10) % 12], DI_ZHI[(xun + 11) % 12]],
+        "six_beasts": six_beasts(gz % 10)
+    }
@@ -0,0 +1,322 @@
+"""
+原生四柱引擎
+Native four-pillars engine backed by the solar-term ephemeris and a lunar-month table
+
+只依赖节气星历 (app/data/solar_terms.bin, 见 ephemeris)、农历月表 (app/data/calendar_table.bin) 与整数运算:
+- 年柱、月柱: 在节气时刻表上二分查找 (以立春、各"节"交接时刻为准)
+- 日柱: 儒略日序号取模六十
+- 时柱: 五鼠遁
+- 起运: 与 lunar-python 相同的"三天一年"规则
+
+两个表均由 lunar-python 生成, 结果与其逐项一致, lunar-python 仍作为参考实现:
+    python -m app.services.ephemeris
+    python -m app.services.pillar_engine
+"""
+import calendar
+import os
+import struct
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Tuple, Optional
+
+from . import ephemeris
+from .ephemeris import (
+    FIRST_YEAR, LAST_YEAR, TERMS_PER_YEAR, to_seconds as _seconds, from_seconds as _from_seconds
+)
+
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'calendar_table.bin')
+
+# 表头: 魔数, 版本, 首年, 农历月数
+_HEADER = struct.Struct("<4sHHH")
+_MAGIC = b"ZYCT"
+_VERSION = 2
+
+# 纳音 (六十甲子两两一组)
+NAYIN = [
+    "海中金", "炉中火", "大林木", "路旁土", "剑锋金", "山头火",
+    "涧下水", "城头土", "白蜡金", "杨柳木", "泉中水", "屋上土",
+    "霹雳火", "松柏木", "长流水", "沙中金", "山下火", "平地木",
+    "壁上土", "金箔金", "覆灯火", "天河水", "大驿土", "钗钏金",
+    "桑柘木", "大溪水", "沙中土", "天上火", "石榴木", "大海水"
+]
+
+SHENG_XIAO = ["鼠", "牛", "虎", "兔", "龙", "蛇", "马", "羊", "猴", "鸡", "狗", "猪"]
+XING_ZUO = ["白羊", "金牛", "双子", "巨蟹", "狮子", "处女", "天秤", "天蝎", "射手", "摩羯", "水瓶", "双鱼"]
+CN_DIGITS = "〇一二三四五六七八九"
+LUNAR_MONTHS = ["", "正", "二", "三", "四", "五", "六", "七", "八", "九", "十", "冬", "腊"]
+LUNAR_DAYS = [
+    "", "初一", "初二", "初三", "初四", "初五", "初六", "初七", "初八", "初九", "初十",
+    "十一", "十二", "十三", "十四", "十五", "十六", "十七", "十八", "十九", "二十",
+    "廿一", "廿二", "廿三", "廿四", "廿五", "廿六", "廿七", "廿八", "廿九", "三十"
+]
+
+# 小寒(1899)所在的丑月为乙丑 (六十甲子序号1), 此后每过一节月柱进一
+_FIRST_MONTH_GZ = 1
+
+# 公历日序号 (date.toordinal) 与儒略日序号之差, 日柱 = (儒略日 - 11) % 60
+ORDINAL_TO_DAY_GZ = 1721425 - 11
+
+
+# ========== 预计算表 ==========
+
+MONTH_STARTS = array('i')   # 农历每月初一的公历日序号
+MONTH_YEARS = array('h')    # 该月所属农历年
+MONTH_NUMBERS = array('b')  # 农历月份, 负数为闰月
+
+
+def load_table(path: str = TABLE_FILE) -> bool:
+    """加载农历月表, 表不存在或格式不符时返回 False"""
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return False
+
+    magic, version, first_year, month_count = _HEADER.unpack_from(raw, 0)
+    if magic != _MAGIC or version != _VERSION or first_year != FIRST_YEAR:
+        return False
+
+    offset = _HEADER.size
+    sections = []
+    for typecode, count in (('i', month_count), ('h', month_count), ('b', month_count)):
+        arr = array(typecode)
+        size = arr.itemsize * count
+        arr.frombytes(raw[offset:offset + size])
+        offset += size
+        sections.append(arr)
+
+    MONTH_STARTS[:], MONTH_YEARS[:], MONTH_NUMBERS[:] = sections
+    return True
+
+
+def build_table(path: str = TABLE_FILE):
+    """由 lunar-python 生成农历月表 (离线执行)"""
+    from lunar_python import LunarYear, Solar
+
+    months = {}
+    for year in range(FIRST_YEAR - 1, LAST_YEAR + 2):
+        for m in LunarYear.fromYear(year).getMonths():
+            s = Solar.fromJulianDay(m.getFirstJulianDay())
+            months[date(s.getYear(), s.getMonth(), s.getDay()).toordinal()] = (m.getYear(), m.getMonth())
+
+    starts = sorted(months)
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, FIRST_YEAR, len(starts)))
+        f.write(array('i', starts).tobytes())
+        f.write(array('h', [months[o][0] for o in starts]).tobytes())
+        f.write(array('b', [months[o][1] for o in starts]).tobytes())
+
+
+TABLE_LOADED = load_table()
+
+
+def supports(dt: datetime) -> bool:
+    """时刻是否在预计算表覆盖范围内 (需前后各有一个"节")"""
+    if not (TABLE_LOADED and ephemeris.EPHEMERIS_LOADED):
+        return False
+    t = _seconds(dt)
+    return ephemeris.TERMS[0] <= t < ephemeris.TERMS[-2]
+
+
+# ========== 四柱计算 ==========
+
+def _time_zhi(hour: int) -> int:
+    """时支: 23:00-00:59 子时"""
+    return (hour + 1) // 2 % 12
+
+
+def _yun_time_zhi(dt: datetime) -> int:
+    # 起运计算沿用 lunar-python 的时辰序号 (23点记为11)
+    return 11 if dt.hour == 23 else _time_zhi(dt.hour)
+
+
+def _yun_start_year(birth: datetime, forward: bool, prev_jie: datetime, next_jie: datetime) -> int:
+    """
+    起运年份 (三天折一年, 一天折四个月, 一时辰折十天)
+
+    出生到下一节 (顺排) 或上一节到出生 (逆排) 的间隔折算为岁数, 加到出生日期上
+    """
+    start, end = (birth, next_jie) if forward else (prev_jie, birth)
+    hour_diff = _yun_time_zhi(end) - _yun_time_zhi(start)
+    day_diff = (end.date() - start.date()).days
+    if hour_diff < 0:
+        hour_diff += 12
+        day_diff -= 1
+    month_diff = hour_diff * 10 // 30
+    months = day_diff * 4 + month_diff
+    days = hour_diff * 10 - month_diff * 30
+    years, months = divmod(months, 12)
+
+    y, m, d = birth.year + years, birth.month, birth.day
+    if m == 2 and d > 28 and not calendar.isleap(y):
+        d = 28
+    y, m = divmod(y * 12 + m - 1 + months, 12)
+    m += 1
+    d = min(d, calendar.monthrange(y, m)[1])
+    return (date(y, m, d) + timedelta(days=days)).year
+
+
+def _lunar_date(ordinal: int) -> Tuple[int, int, int]:
+    """公历日序号 -> (农历年, 农历月(闰月为负), 农历日)"""
+    i = bisect_right(MONTH_STARTS, ordinal) - 1
+    return MONTH_YEARS[i], MONTH_NUMBERS[i], ordinal - MONTH_STARTS[i] + 1
+
+
+def _xing_zuo(month: int, day: int) -> str:
+    md = month * 100 + day
+    bounds = (321, 420, 521, 622, 723, 823, 923, 1024, 1123, 1222)
+    if 120 <= md <= 320:
+        return XING_ZUO[10] if md <= 218 else XING_ZUO[11]
+    for i in range(len(bounds) - 1, -1, -1):
+        if md >= bounds[i]:
+            return XING_ZUO[i]
+    return XING_ZUO[9]
+
+
+def compute_pillars(
+    year: int,
+    month: int,
+    day: int,
+    hour: int,
+    minute: int,
+    gender: int = 1,
+    sect: int = 1
+) -> Dict[str, Any]:
+    """
+    计算四柱及排盘所需的历法信息
+
+    Returns:
+        stems/branches: 年月日时干支编码 (天干0-9, 地支0-11)
+        nayin: 四柱纳音
+        luck_start_year, birth_year, forward: 起运年份、出生年份、大运是否顺排
+        lunar_date, zodiac, constellation, current_jieqi, next_jieqi: 附加信息
+    """
+    dt = datetime(year, month, day, hour, minute)
+
+    # 上一个节气 (含交接时刻), 偶数位为"节"
+    g = ephemeris.term_index(dt)
+    jie = g - (g % 2)
+    jie_count = jie // 2
+
+    # 年柱: 以立春交接 (每年第2项) 为界
+    year_gz = (FIRST_YEAR + (jie - 2) // TERMS_PER_YEAR - 4) % 60
+    # 月柱: 每过一节进一
+    month_gz = (_FIRST_MONTH_GZ + jie_count) % 60
+
+    # 日柱: 流派1晚子时(23点)日柱算明天
+    day_gz = (dt.date().toordinal() + ORDINAL_TO_DAY_GZ) % 60
+    next_day_gz = (day_gz + 1) % 60 if hour == 23 else day_gz
+    if sect != 2:
+        day_gz = next_day_gz
+
+    # 时柱: 五鼠遁 (按晚子时换日后的日干起)
+    time_zhi = _time_zhi(hour)
+    time_gan = (next_day_gz % 5 * 2 + time_zhi) % 10
+    time_gz = (6 * time_gan - 5 * time_zhi) % 60
+
+    # 起运: 阳男阴女顺推, 阴男阳女逆推
+    forward = (year_gz % 2 == 0) == (gender == 1)
+    luck_start_year = _yun_start_year(
+        dt,
+        forward,
+        ephemeris.term_time(jie),
+        ephemeris.term_time(jie + 2)
+    )
+
+    lunar_year, lunar_month, lunar_day = _lunar_date(dt.date().toordinal())
+    lunar_date = "".join(CN_DIGITS[int(c)] for c in str(lunar_year)) + "年" \
+        + ("闰" if lunar_month < 0 else "") + LUNAR_MONTHS[abs(lunar_month)] + "月" \
+        + LUNAR_DAYS[lunar_day]
+
+    gz = (year_gz, month_gz, day_gz, time_gz)
+    return {
+        "stems": [i % 10 for i in gz],
+        "branches": [i % 12 for i in gz],
+        "nayin": [NAYIN[i // 2] for i in gz],
+        "luck_start_year": luck_start_year,
+        "birth_year": year,
+        "forward": forward,
+        "lunar_date": lunar_date,
+        "zodiac": SHENG_XIAO[(lunar_year - 4) % 12],
+        "constellation": _xing_zuo(month, day),
+        "current_jieqi": ephemeris.term_name(g),
+        "next_jieqi": ephemeris.term_name(g + 1)
+    }
+
+
+# ========== 反查 ==========
+
+def _ceil_minute(seconds: int) -> int:
+    return -(-seconds // 60) * 60
+
+
+def find_datetimes(
+    year_gz: int,
+    month_gz: int,
+    day_gz: int,
+    time_gz: int,
+    year_from: int,
+    year_to: int,
+    sect: int = 1
+) -> List[Tuple[datetime, datetime]]:
+    """
+    由四柱六十甲子序号反查出生时间窗口 [起, 止), 精确到分钟
+
+    - 年柱: 六十年一轮, 候选年份为 (年 - 4) % 60 == 年柱 的立春年
+    - 月柱: 由月支定位该年对应的"节", 月干由年干决定 (五虎遁), 不符则无解
+    - 日柱: 月令区间内按日序号取模六十定位 (一个月令不足六十日, 至多一日)
+    - 时柱: 时支定时段, 时干由日干决定 (五鼠遁); 子时分早子、晚子两段
+    """
+    if not ephemeris.EPHEMERIS_LOADED:
+        raise RuntimeError("节气星历未加载")
+
+    terms = ephemeris.TERMS
+    lower = max(_seconds(datetime(year_from, 1, 1)), terms[0])
+    upper = min(_seconds(datetime(year_to + 1, 1, 1)), terms[-1])
+
+    # 时辰段: (起始小时, 结束小时, 日柱相对当日的偏移, 时干所依日干相对当日的偏移)
+    time_zhi = time_gz % 12
+    if time_zhi == 0:
+        slots = [(0, 1, 0, 0), (23, 24, 1 if sect != 2 else 0, 1)]
+    else:
+        slots = [(time_zhi * 2 - 1, time_zhi * 2 + 1, 0, 0)]
+    slots = [
+        slot for slot in slots
+        if ((day_gz - slot[2] + slot[3]) % 5 * 2 + time_zhi) % 10 == time_gz % 10
+    ]
+
+    windows = []
+    month_index = (month_gz % 12 - 2) % 12  # 寅月为0
+    first = FIRST_YEAR + (year_gz - FIRST_YEAR + 4) % 60
+    for year in range(first, year_to + 1, 60):
+        # 该年立春为第 (year - FIRST_YEAR) 年的第2项节气
+        jie = (year - FIRST_YEAR) * TERMS_PER_YEAR + 2 + month_index * 2
+        if jie + 2 >= len(terms) or (_FIRST_MONTH_GZ + jie // 2) % 60 != month_gz:
+            continue
+        start = max(terms[jie], lower)
+        end = min(terms[jie + 2], upper)
+        if start >= end:
+            continue
+
+        lo = _from_seconds(start).toordinal() - 1
+        hi = _from_seconds(end).toordinal()
+        for h0, h1, day_offset, _ in slots:
+            target = (day_gz - day_offset) % 60
+            ordinal = lo + (target - lo - ORDINAL_TO_DAY_GZ) % 60
+            while ordinal <= hi:
+                midnight = _seconds(datetime.fromordinal(ordinal))
+                w0 = _ceil_minute(max(midnight + h0 * 3600, start))
+                w1 = _ceil_minute(min(midnight + h1 * 3600, end))
+                if w0 < w1:
+                    windows.append((_from_seconds(w0), _from_seconds(w1)))
+                ordinal += 60
+
+    windows.sort()
+    return windows
+
+
+if __name__ == "__main__":
+    build_table()
+    print(f"已生成 {TABLE_FILE}")
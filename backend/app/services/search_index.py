@@ -0,0 +1,218 @@
+"""
+卦爻辞全文检索
+Character-bigram inverted index over the hexagram text corpus
+
+文档为各卦的卦辞、卦辞白话、彖辞、象辞及六爻爻辞、爻辞白话, 约一千条.
+索引以相邻两字 (bigram) 为键, 单字查询另用单字索引; 倒排表为文档编号集合.
+
+查询按空白与标点切成若干词, 词间为"与"关系:
+- 每个词取其 bigram 倒排表求交集得候选文档, 再以子串计数去除假阳性
+- 得分 = 字段权重 × (命中次数 + 命中字数 / 文本长度), 同分按卦序、字段、爻位
+- 只对前 limit 条计算高亮
+索引与卦辞索引 (TEXT_STORE) 绑定, 热更新后首次查询时重建.
+边输入边查询时前缀重复多, 结果另以 LRU 缓存 (键含数据版本).
+"""
+import heapq
+import os
+import re
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .cache import LRUTTLCache
+from .hexagram import NAMES, NUMBERS
+from . import interpretation_service
+
+
+# 检索字段及权重: (字段, 权重), 爻辞字段位于 yaoCi 内
+GUA_FIELDS = (("guaCi", 3.0), ("tuanCi", 2.0), ("xiangCi", 2.0), ("guaCiExplain", 1.0))
+YAO_FIELDS = (("text", 3.0), ("explain", 1.0))
+
+MAX_QUERY_LENGTH = 50
+
+# 查询切词: 空白与常见标点
+_SEPARATORS = re.compile(r"[\s,.;:!?'\"()\[\]，。、；：！？「」『』“”‘’（）《》〈〉…—·]+")
+
+HIGHLIGHT_OPEN = "<em>"
+HIGHLIGHT_CLOSE = "</em>"
+
+
+class _Document:
+    __slots__ = ("bits", "field", "position", "text", "folded", "weight", "order")
+
+    def __init__(self, bits: int, field: str, position: Optional[int], text: str, weight: float, order: int):
+        self.bits = bits
+        self.field = field
+        self.position = position
+        self.text = text
+        self.folded = text.lower()
+        self.weight = weight
+        self.order = order  # 同分排序: 卦序, 字段, 爻位
+
+
+class SearchIndex:
+    """某一版本卦辞数据的倒排索引 (只读)"""
+
+    def __init__(self, store):
+        self.store = store
+        self.version: int = store.version
+        self.documents: List[_Document] = []
+        self._unigrams: Dict[str, Set[int]] = {}
+        self._bigrams: Dict[str, Set[int]] = {}
+
+        for bits in sorted(range(64), key=NUMBERS.__getitem__):
+            entry = store.get(bits)
+            if entry is None:
+                continue
+            base = NUMBERS[bits] * 100
+            for k, (field, weight) in enumerate(GUA_FIELDS):
+                self._add(bits, field, None, entry.get(field), weight, base + k)
+            for yao in entry.get("yaoCi", []):
+                for k, (field, weight) in enumerate(YAO_FIELDS):
+                    self._add(bits, field, yao["position"], yao.get(field), weight,
+                              base + 10 + yao["position"] * 2 + k)
+
+    def _add(self, bits: int, field: str, position: Optional[int], text: Optional[str], weight: float, order: int):
+        if not text:
+            return
+        doc_id = len(self.documents)
+        doc = _Document(bits, field, position, text, weight, order)
+        self.documents.append(doc)
+        text = doc.folded
+        for i, char in enumerate(text):
+            self._unigrams.setdefault(sys.intern(char), set()).add(doc_id)
+            if i + 1 < len(text):
+                self._bigrams.setdefault(sys.intern(text[i:i + 2]), set()).add(doc_id)
+
+    def _candidates(self, term: str) -> Set[int]:
+        """term 所有 bigram 倒排表的交集 (自最短者起)"""
+        if len(term) == 1:
+            return self._unigrams.get(term, set())
+        postings = []
+        for i in range(len(term) - 1):
+            posting = self._bigrams.get(term[i:i + 2])
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def search(self, query: str, limit: int = 20) -> Tuple[int, List[Dict[str, Any]]]:
+        """返回 (命中总数, 前 limit 条结果)"""
+        terms = list(dict.fromkeys(t for t in _SEPARATORS.split(query.lower()) if t))
+        if not terms:
+            return 0, []
+
+        candidates: Optional[Set[int]] = None
+        for term in sorted(terms, key=len, reverse=True):  # 长词倒排表通常更短
+            found = self._candidates(term)
+            candidates = found if candidates is None else candidates & found
+            if not candidates:
+                return 0, []
+
+        scored = []
+        documents = self.documents
+        for doc_id in candidates:
+            doc = documents[doc_id]
+            hits = covered = 0
+            for term in terms:
+                count = doc.folded.count(term)
+                if not count:
+                    break
+                hits += count
+                covered += count * len(term)
+            else:
+                scored.append((-doc.weight * (hits + min(covered, len(doc.folded)) / len(doc.folded)), doc.order, doc_id))
+
+        top = heapq.nsmallest(limit, scored) if limit < len(scored) else sorted(scored)
+        return len(scored), [_hit(documents[doc_id], terms, -neg_score) for neg_score, _, doc_id in top]
+
+
+def _merge(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[List[int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def _hit(doc: _Document, terms: List[str], score: float) -> Dict[str, Any]:
+    spans = []
+    for term in terms:
+        start = doc.folded.find(term)
+        while start >= 0:
+            spans.append((start, start + len(term)))
+            start = doc.folded.find(term, start + len(term))
+    matches = _merge(spans)
+    parts, last = [], 0
+    for start, end in matches:
+        parts.extend((doc.text[last:start], HIGHLIGHT_OPEN, doc.text[start:end], HIGHLIGHT_CLOSE))
+        last = end
+    parts.append(doc.text[last:])
+    return {
+        "hexagram": NAMES[doc.bits],
+        "number": NUMBERS[doc.bits],
+        "field": doc.field,
+        "position": doc.position,
+        "text": doc.text,
+        "highlight": "".join(parts),
+        "matches": [list(m) for m in matches],
+        "score": round(score, 4)
+    }
+
+
+# ========== 当前索引 ==========
+
+_index: Optional[SearchIndex] = None
+_lock = threading.Lock()
+
+# 检索结果缓存: 键为 (数据版本, 查询词, 条数)
+SEARCH_CACHE = LRUTTLCache(
+    maxsize=int(os.getenv("HEXAGRAM_SEARCH_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("HEXAGRAM_SEARCH_CACHE_TTL", "3600"))
+)
+
+
+def get_index(store=None) -> SearchIndex:
+    """当前卦辞数据的索引, 数据热更新后重建"""
+    global _index
+    if store is None:
+        store = interpretation_service.TEXT_STORE
+    index = _index
+    if index is not None and index.store is store:
+        return index
+    with _lock:
+        if _index is None or _index.store is not store:
+            _index = SearchIndex(store)
+            SEARCH_CACHE.clear()
+        return _index
+
+
+def search_texts(query: str, limit: int = 20, store=None) -> Dict[str, Any]:
+    """
+    全文检索卦辞、彖辞、象辞、爻辞
+
+    Args:
+        query: 查询词，空格或标点分隔的多个词须同时命中
+        limit: 返回条数
+
+    Returns:
+        {"query", "version", "total", "hits": [{hexagram, number, field, position, text, highlight, matches, score}]}
+        （缓存共享对象，勿修改）
+    """
+    index = get_index(store)
+    query = query[:MAX_QUERY_LENGTH]
+    key = (index.version, query, limit)
+    result = SEARCH_CACHE.get(key)
+    if result is None:
+        total, hits = index.search(query, limit)
+        result = {"query": query, "version": index.version, "total": total, "hits": hits}
+        SEARCH_CACHE.set(key, result)
+    return result
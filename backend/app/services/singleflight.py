@@ -0,0 +1,151 @@
+"""
+相同请求合并 (single flight)
+Coalesce concurrent identical calls into one upstream call
+
+同一键的调用进行中时, 后到者不再发起新调用, 而是等待同一结果 (或订阅同一输出流):
+- 结果与异常原样交给全部等待者; 调用结束即移除, 之后的调用重新发起 (不缓存结果, 缓存另见 ai_cache)
+- 某个等待者被取消只影响它自己; 全部等待者都离开时才取消上游调用
+- 流式订阅者从头读取已到达的片段, 再随上游逐段读取
+仅在事件循环线程中使用.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合并同一键的并发调用"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行 call() 或等待进行中的同键调用
+
+        Returns:
+            call() 的结果 (多个调用方共享同一对象, 不得修改)
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        flight.waiters += 1
+        try:
+            # shield: 等待者被取消不波及共享调用
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers
+        }
+
+
+class _StreamFlight:
+    __slots__ = ("chunks", "done", "error", "updated", "task", "subscribers")
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.updated = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+
+    def notify(self):
+        updated, self.updated = self.updated, asyncio.Event()
+        updated.set()
+
+
+class SharedStreams:
+    """合并同一键的并发流式调用, 上游只读一次, 片段分发给全部订阅者"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _StreamFlight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def _forget(self, key: Hashable, flight: _StreamFlight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def _produce(self, key: Hashable, flight: _StreamFlight, open_stream: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for chunk in open_stream():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = RuntimeError("上游调用已取消")
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._forget(key, flight)
+            flight.notify()
+
+    async def subscribe(self, key: Hashable, open_stream: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        订阅 open_stream() 的输出, 同键进行中时共用同一上游流
+
+        上游出错时每个订阅者读完已到达的片段后收到同一异常
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(self._produce(key, flight, open_stream))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        flight.subscribers += 1
+        try:
+            i = 0
+            while True:
+                if i < len(flight.chunks):
+                    yield flight.chunks[i]
+                    i += 1
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.updated.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers
+        }
@@ -0,0 +1,48 @@
+"""
+Server-Sent Events 编码
+SSE framing for streamed responses
+
+事件:
+- start: 连接建立, 立即发送 (便于代理与客户端及早开始读取)
+- chunk: {"text": 文本片段}
+- done:  {"length": 全文字数}
+- error: {"error": 错误信息}
+客户端断开时生成器随任务取消而终止, 取消 (CancelledError) 不转换为 error 事件.
+"""
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # 关闭 nginx 缓冲
+}
+
+
+@asynccontextmanager
+async def aclosing(agen):
+    """退出时关闭异步生成器 (同 Python 3.10 的 contextlib.aclosing)"""
+    try:
+        yield agen
+    finally:
+        await agen.aclose()
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_text_stream(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """将文本片段流转为 SSE 事件流"""
+    yield sse_event("start", {})
+    length = 0
+    try:
+        # aclosing: 断开时立即关闭上游生成器, 不等垃圾回收
+        async with aclosing(chunks):
+            async for text in chunks:
+                length += len(text)
+                yield sse_event("chunk", {"text": text})
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+        return
+    yield sse_event("done", {"length": length})
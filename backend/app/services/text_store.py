@@ -0,0 +1,397 @@
+"""
+卦爻辞索引
+Indexed hexagram text store, compiled to a memory-mapped binary corpus
+
+卦辞数据按 Hexagram.bits 下标存放, 以下查询均为 O(1):
+- 全称 / 简称 -> bits (hexagram.NAME_TO_BITS)
+- 文王卦序 -> bits
+- (上卦, 下卦) -> bits = upper << 3 | lower
+- (卦, 爻位) -> 爻辞
+
+JSON 源数据依次合并, 后者按字段覆盖前者 (hexagrams_9_20.json 为第九至二十卦的修订稿).
+卦名、卦序、上下卦、爻位与卦象编码不符时在编译/加载时报错, 不留到请求时才返回 None.
+
+运行时读取离线编译的 app/data/hexagram_texts.bin, 以 mmap 只读映射, 多个 worker 经系统
+页缓存共享同一份物理内存; 只在首次查询某卦时解码该卦的字符串.
+
+文件布局 (小端):
+    表头 24 字节: 魔数 b"ZYHT", 格式版本, 每卦字段数, 卦数 (64), 字符串区字节数, 数据版本
+    偏移表: 64 × 字段数 个 (偏移, 长度) uint32 对, 偏移为 0xFFFFFFFF 表示缺该字段
+    字符串区: UTF-8, 关键词以 \\x1f 分隔
+
+数据版本每次编译出不同内容时加一, 写入文件后各 worker 映射同一文件即得同一版本,
+可直接用作 ETag. 直接解析 JSON 时 (无编译文件) 版本为 0.
+
+卦序、卦名、上下卦由卦象编码推出, 不入文件. 修改 JSON 后需重新编译:
+    python -m app.services.text_store
+"""
+import abc
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from .hexagram import NAME_TO_BITS, NAMES, SHORT_NAMES, NUMBERS, TRIGRAM_NAMES, TRIGRAM_CODE
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
+# JSON 数据源, 按顺序合并
+SOURCE_FILES = [
+    os.path.join(DATA_DIR, 'hexagram_texts.json'),
+    os.path.join(DATA_DIR, 'hexagrams_9_20.json'),
+]
+CORPUS_FILE = os.path.join(DATA_DIR, 'hexagram_texts.bin')
+
+_HEADER = struct.Struct("<4sHHIIQ")
+_MAGIC = b"ZYHT"
+_VERSION = 2
+_ABSENT = 0xFFFFFFFF
+_KEYWORD_SEP = "\x1f"
+
+# 每卦字段: 卦级文本, 其后为六爻 (爻辞, 白话)
+GUA_FIELDS = ("symbol", "keywords", "guaCi", "guaCiExplain", "tuanCi", "xiangCi")
+YAO_FIELDS = ("text", "explain")
+FIELD_COUNT = len(GUA_FIELDS) + 6 * len(YAO_FIELDS)
+
+# 由卦象编码推出的字段
+_DERIVED_FIELDS = {"number", "name", "fullName", "upper", "lower", "yaoCi"}
+
+# 文王卦序 -> bits
+NUMBER_TO_BITS = [0] * 65
+for _bits in range(64):
+    NUMBER_TO_BITS[NUMBERS[_bits]] = _bits
+
+
+def _intern(value: Any) -> Any:
+    """递归驻留字符串 (键与值)"""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {sys.intern(k): _intern(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_intern(v) for v in value]
+    return value
+
+
+def _check_entry(full_name: str, entry: Dict, errors: List[str]) -> Optional[int]:
+    """校验条目与卦象编码一致, 返回 bits; 不符时记入 errors"""
+    bits = NAME_TO_BITS.get(full_name)
+    if bits is None or NAMES[bits] != full_name:
+        errors.append(f"未知卦名: {full_name}")
+        return None
+
+    expected = {
+        "fullName": full_name,
+        "name": SHORT_NAMES[bits],
+        "number": NUMBERS[bits],
+        "upper": TRIGRAM_NAMES[bits >> 3],
+        "lower": TRIGRAM_NAMES[bits & 7],
+    }
+    for field, value in expected.items():
+        if field in entry and entry[field] != value:
+            errors.append(f"{full_name}: {field} 应为 {value}, 实为 {entry[field]}")
+
+    unknown = set(entry) - _DERIVED_FIELDS - set(GUA_FIELDS)
+    if unknown:
+        errors.append(f"{full_name}: 未知字段 {sorted(unknown)}")
+
+    positions = [yao.get("position") for yao in entry.get("yaoCi", [])]
+    if len(positions) > 6 or set(positions) != set(range(1, len(positions) + 1)):
+        errors.append(f"{full_name}: 爻位有误 {positions}")
+    for yao in entry.get("yaoCi", []):
+        if set(yao) - {"position", *YAO_FIELDS}:
+            errors.append(f"{full_name}: 爻辞未知字段 {sorted(set(yao) - {'position', *YAO_FIELDS})}")
+    return bits
+
+
+def _base_entry(bits: int) -> Dict[str, Any]:
+    return {
+        "number": NUMBERS[bits],
+        "name": SHORT_NAMES[bits],
+        "fullName": NAMES[bits],
+        "upper": TRIGRAM_NAMES[bits >> 3],
+        "lower": TRIGRAM_NAMES[bits & 7],
+    }
+
+
+class _TextLookup(abc.ABC):
+    """查询接口, 子类提供 get(bits) 与 yao(bits, position)"""
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def get(self, bits: int) -> Optional[Dict]:
+        ...
+
+    @abc.abstractmethod
+    def yao(self, bits: int, position: int) -> Optional[Dict]:
+        """第 position 爻 (1-6) 的爻辞"""
+
+    def by_name(self, name: str) -> Optional[Dict]:
+        """全称或简称"""
+        bits = NAME_TO_BITS.get(name)
+        return None if bits is None else self.get(bits)
+
+    def by_number(self, number: int) -> Optional[Dict]:
+        """文王卦序 1-64"""
+        return self.get(NUMBER_TO_BITS[number]) if 1 <= number <= 64 else None
+
+    def by_trigrams(self, upper: Union[int, str], lower: Union[int, str]) -> Optional[Dict]:
+        """上下卦, 可用三位卦编码或卦名 ("乾")"""
+        if isinstance(upper, str):
+            upper = TRIGRAM_CODE[upper]
+        if isinstance(lower, str):
+            lower = TRIGRAM_CODE[lower]
+        return self.get((upper & 7) << 3 | (lower & 7))
+
+
+class HexagramTextStore(_TextLookup):
+    """
+    由 JSON 源数据构建的卦爻辞索引 (编译及无编译文件时使用)
+
+    条目为共享对象, 调用方不得修改
+    """
+    __slots__ = ("_entries", "_yaos")
+
+    version = 0
+
+    def __init__(self, hexagrams: Dict[str, Dict]):
+        self._entries: List[Optional[Dict]] = [None] * 64
+        self._yaos: List[Optional[Dict]] = [None] * (64 * 6)
+
+        errors: List[str] = []
+        for full_name, entry in hexagrams.items():
+            bits = _check_entry(full_name, entry, errors)
+            if bits is not None:
+                self._entries[bits] = entry
+        if errors:
+            raise ValueError("卦辞数据有误: " + "; ".join(errors))
+
+        for bits, entry in enumerate(self._entries):
+            if entry is None:
+                continue
+            entry["yaoCi"] = sorted(entry.get("yaoCi", []), key=lambda yao: yao["position"])
+            for yao in entry["yaoCi"]:
+                self._yaos[bits * 6 + yao["position"] - 1] = yao
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str] = SOURCE_FILES) -> "HexagramTextStore":
+        """
+        读取并合并 JSON 数据源
+
+        Raises:
+            FileNotFoundError / json.JSONDecodeError: 数据文件缺失或无法解析
+            ValueError: 数据与卦象编码不符
+        """
+        merged: Dict[str, Dict] = {}
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for full_name, entry in data.get('hexagrams', data).items():
+                merged.setdefault(full_name, {}).update(entry)
+        return cls(_intern(merged))
+
+    def __len__(self) -> int:
+        return sum(entry is not None for entry in self._entries)
+
+    def get(self, bits: int) -> Optional[Dict]:
+        return self._entries[bits & 0x3F]
+
+    def yao(self, bits: int, position: int) -> Optional[Dict]:
+        return self._yaos[(bits & 0x3F) * 6 + position - 1] if 1 <= position <= 6 else None
+
+
+class MappedTextStore(_TextLookup):
+    """
+    映射编译文件的卦爻辞索引
+
+    偏移表为映射内存上的 memoryview, 条目在首次查询时解码并缓存于本进程, 爻辞按 (卦, 爻位) 直接索引.
+    映射随对象释放而关闭, 替换后仍在使用旧对象的请求不受影响.
+    条目为共享对象, 调用方不得修改
+    """
+    __slots__ = ("_mapping", "_slots", "_blob_start", "_decoded", "_yaos", "_count", "version")
+
+    def __init__(self, mapping: mmap.mmap):
+        magic, version, field_count, hexagram_count, blob_size, data_version = _HEADER.unpack_from(mapping, 0)
+        table_size = hexagram_count * field_count * 8
+        if (magic != _MAGIC or version != _VERSION or field_count != FIELD_COUNT
+                or hexagram_count != 64 or len(mapping) != _HEADER.size + table_size + blob_size):
+            raise ValueError("卦辞编译文件格式不符")
+
+        self.version: int = data_version
+        self._mapping = mapping
+        self._slots = memoryview(mapping)[_HEADER.size:_HEADER.size + table_size].cast('I')
+        self._blob_start = _HEADER.size + table_size
+        self._decoded: List[Optional[Dict]] = [None] * 64
+        self._yaos: List[Optional[Dict]] = [None] * (64 * 6)
+        self._count = sum(
+            any(self._slots[(bits * FIELD_COUNT + k) * 2] != _ABSENT for k in range(FIELD_COUNT))
+            for bits in range(64)
+        )
+
+    @classmethod
+    def open(cls, path: str = CORPUS_FILE) -> "MappedTextStore":
+        """
+        映射编译文件
+
+        Raises:
+            FileNotFoundError: 文件不存在
+            ValueError: 文件格式不符
+        """
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapping) < _HEADER.size:
+            mapping.close()
+            raise ValueError("卦辞编译文件格式不符")
+        try:
+            return cls(mapping)
+        except ValueError:
+            mapping.close()
+            raise
+
+    def __len__(self) -> int:
+        return self._count
+
+    def payload(self) -> bytes:
+        """偏移表与字符串区 (不含表头), 用于比较内容是否变化"""
+        return self._mapping[_HEADER.size:]
+
+    def _field(self, slot: int) -> Optional[str]:
+        offset, length = self._slots[slot * 2], self._slots[slot * 2 + 1]
+        if offset == _ABSENT:
+            return None
+        start = self._blob_start + offset
+        return str(self._mapping[start:start + length], 'utf-8')
+
+    def _decode(self, bits: int) -> Optional[Dict]:
+        base = bits * FIELD_COUNT
+        values = [self._field(base + k) for k in range(FIELD_COUNT)]
+        if all(v is None for v in values):
+            return None
+
+        entry = _base_entry(bits)
+        for k, field in enumerate(GUA_FIELDS):
+            value = values[k]
+            if value is None:
+                continue
+            if field == "keywords":
+                value = [sys.intern(w) for w in value.split(_KEYWORD_SEP)] if value else []
+            entry[field] = value
+
+        yao_ci = []
+        for position in range(1, 7):
+            k = len(GUA_FIELDS) + (position - 1) * len(YAO_FIELDS)
+            if all(v is None for v in values[k:k + len(YAO_FIELDS)]):
+                continue
+            yao = {"position": position}
+            for j, field in enumerate(YAO_FIELDS):
+                if values[k + j] is not None:
+                    yao[field] = values[k + j]
+            yao_ci.append(yao)
+        entry["yaoCi"] = yao_ci
+        return entry
+
+    def get(self, bits: int) -> Optional[Dict]:
+        bits &= 0x3F
+        entry = self._decoded[bits]
+        if entry is None:
+            # 并发首次解码只会得到等价条目, 无需加锁; 先填爻辞索引再发布条目
+            entry = self._decode(bits)
+            if entry is not None:
+                for yao in entry["yaoCi"]:
+                    self._yaos[bits * 6 + yao["position"] - 1] = yao
+            self._decoded[bits] = entry
+        return entry
+
+    def yao(self, bits: int, position: int) -> Optional[Dict]:
+        if not 1 <= position <= 6:
+            return None
+        bits &= 0x3F
+        if self._decoded[bits] is None:
+            self.get(bits)
+        return self._yaos[bits * 6 + position - 1]
+
+
+EMPTY_STORE = HexagramTextStore({})
+
+
+# ========== 编译 ==========
+
+def _encode(store: HexagramTextStore) -> Tuple[int, bytes]:
+    """编码偏移表与字符串区, 返回 (字符串区字节数, 偏移表+字符串区)"""
+    blob = bytearray()
+    offsets: Dict[bytes, int] = {}  # 相同字符串只存一份
+    slots = [_ABSENT, 0] * (64 * FIELD_COUNT)
+
+    def put(slot: int, value: Optional[str]):
+        if value is None:
+            return
+        data = value.encode('utf-8')
+        if data not in offsets:
+            offsets[data] = len(blob)
+            blob.extend(data)
+        slots[slot * 2], slots[slot * 2 + 1] = offsets[data], len(data)
+
+    for bits in range(64):
+        entry = store.get(bits)
+        if entry is None:
+            continue
+        base = bits * FIELD_COUNT
+        for k, field in enumerate(GUA_FIELDS):
+            value = entry.get(field)
+            put(base + k, _KEYWORD_SEP.join(value) if field == "keywords" and value is not None else value)
+        for yao in entry["yaoCi"]:
+            k = base + len(GUA_FIELDS) + (yao["position"] - 1) * len(YAO_FIELDS)
+            for j, field in enumerate(YAO_FIELDS):
+                put(k + j, yao.get(field))
+
+    return len(blob), struct.pack(f"<{len(slots)}I", *slots) + bytes(blob)
+
+
+def compile_corpus(sources: Iterable[str] = SOURCE_FILES, path: str = CORPUS_FILE) -> int:
+    """
+    将 JSON 数据源编译为二进制文件 (离线或热更新时执行), 返回数据版本
+
+    内容与现有文件相同时不重写 (只更新修改时间), 版本不变; 校验失败时抛出异常, 现有文件不受影响
+    """
+    blob_size, payload = _encode(HexagramTextStore.from_files(sources))
+
+    version = 0
+    try:
+        current = MappedTextStore.open(path)
+    except (OSError, ValueError):
+        pass
+    else:
+        if current.payload() == payload:
+            # 只更新修改时间, 免得 sources_newer 之后每次都判为过期
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return current.version
+        version = current.version
+        del current
+
+    # 临时文件按进程区分, 多个 worker 同时编译时互不覆盖
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, FIELD_COUNT, 64, blob_size, version + 1))
+        f.write(payload)
+    os.replace(tmp, path)
+    return version + 1
+
+
+def sources_newer(sources: Iterable[str] = SOURCE_FILES, path: str = CORPUS_FILE) -> bool:
+    """JSON 数据源是否比编译文件新 (编译文件不存在时为 True)"""
+    try:
+        compiled = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return True
+    return any(os.stat(source).st_mtime_ns > compiled for source in sources)
+
+
+if __name__ == "__main__":
+    version = compile_corpus()
+    print(f"已生成 {CORPUS_FILE} (数据版本 {version})")